@@ -0,0 +1,301 @@
+"""
+    Incrementally maintained graph aggregates.
+
+    Degree histograms, per-label counts and degree stats, density and
+    centralization are built once per loaded graph with grouped array
+    reductions (np.bincount over the degrees of the backend.CompactGraph,
+    per label over the members in labels.LabelIndex), without touching the
+    networkx DiGraph. The triangle counts behind the clustering and
+    transitivity numbers cost a Python record per node, so they are only
+    built when something first asks for clustering, from the CSR and CSC
+    arrays as well.
+
+    After that, every graph edit (see GraphStore.edit) only revisits the
+    nodes it touched: the contribution of each touched node in the old
+    graph is subtracted and its contribution in the new graph added.
+    Triangle contributions change for the endpoints of the changed edges
+    and for their common neighbours, so an edit costs O(change) rather
+    than a pass over the whole graph.
+
+    The label_* endpoints and the cheap part of general_statistical_info
+    are served from here; degree_distribution reads the sparse degrees.
+"""
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from . import backend, graph_store, labels, metrics
+
+
+class _Neighbourhoods(dict):
+    """Predecessor or successor sets without self loops, built on demand."""
+
+    def __init__(self, adjacency):
+        super().__init__()
+        self.adjacency = adjacency
+
+    def __missing__(self, node):
+        value = self[node] = set(self.adjacency[node]) - {node}
+        return value
+
+
+class _ArrayNeighbourhoods(dict):
+    """The same, by position, from CSR (or CSC) offsets and neighbour arrays."""
+
+    def __init__(self, offsets, neighbors):
+        super().__init__()
+        self.offsets = offsets
+        self.neighbors = neighbors
+
+    def __missing__(self, i):
+        value = self[i] = set(self.neighbors[self.offsets[i]:self.offsets[i + 1]].tolist()) - {i}
+        return value
+
+
+def _histogram(values):
+    counts = np.bincount(values)
+    degrees = np.flatnonzero(counts)
+    return Counter(dict(zip(degrees.tolist(), counts[degrees].tolist())))
+
+
+class Aggregates:
+    """Aggregates of `graph`, a backend.GraphBackend, with `index` its labels.LabelIndex."""
+
+    def __init__(self, graph, index):
+        self._lock = threading.Lock()
+        self._backend = graph
+        # The DiGraph of the latest edit; None until the first one.
+        self._graph = None
+
+        in_degree, degree = graph.in_degree, graph.in_degree + graph.out_degree
+        self.nodes = len(graph)
+        self.edges = graph.number_of_edges()
+        self.degree_counts = _histogram(degree)
+        self.in_degree_counts = _histogram(in_degree)
+        self.in_degree_sum = int(in_degree.sum())
+        self.label_count = Counter()
+        self.label_degree_counts = defaultdict(Counter)
+        self.label_degree_sum = Counter()
+        self.label_clustering_sum = defaultdict(float)
+        # Sort key of the first member of each label: its position in
+        # list(G), or a later key for nodes added since. A label whose
+        # first member was removed or relabelled is missing until
+        # label_counts() scans the graph again.
+        self._first = {}
+        self._next_key = len(graph)
+        for label in index.labels:
+            members = index.members[label]
+            if not len(members):
+                continue
+            self.label_count[label] = len(members)
+            self.label_degree_counts[label] = _histogram(degree[members])
+            self.label_degree_sum[label] = int(degree[members].sum())
+            self._first[label] = (int(members[0]), graph.nodes[members[0]])
+
+        self.clustering_sum = 0.0
+        self.triangles = 0
+        self.triads = 0
+        # Per node: its triangle record, once clustering has been asked for.
+        self.triangle_records = None
+
+    @classmethod
+    def from_networkx(cls, G):
+        graph = backend.CompactGraph.from_networkx(G)
+        return cls(graph, labels.LabelIndex(graph.nodes, graph.label_codes, graph.labels))
+
+    def _build_triangles(self):
+        """Triangle records of every node, on first use. Must hold self._lock."""
+        if self.triangle_records is not None:
+            return
+        self.triangle_records = {}
+        if self._graph is None:
+            graph = self._backend
+            pred = _ArrayNeighbourhoods(graph.in_offsets, graph.in_neighbors)
+            succ = _ArrayNeighbourhoods(graph.offsets, graph.neighbors)
+            for i, (node, label) in enumerate(zip(graph.nodes, graph.node_labels())):
+                self._add_triangles(node, label, pred, succ, i)
+        else:
+            G = self._graph
+            pred, succ = _Neighbourhoods(G._pred), _Neighbourhoods(G._succ)
+            for node, label in G.nodes(data='label'):
+                self._add_triangles(node, label, pred, succ)
+
+    def _add_triangles(self, node, label, pred, succ, key=None):
+        _, succ_succ, triads, clustering = metrics.node_triangles(node if key is None else key, pred, succ)
+        self.triangle_records[node] = (succ_succ, triads, clustering)
+        self.triangles += succ_succ
+        self.triads += triads
+        self.clustering_sum += clustering
+        if label is not None:
+            self.label_clustering_sum[label] += clustering
+
+    def _remove_triangles(self, node, label):
+        succ_succ, triads, clustering = self.triangle_records.pop(node)
+        self.triangles -= succ_succ
+        self.triads -= triads
+        self.clustering_sum -= clustering
+        if label is not None:
+            self.label_clustering_sum[label] -= clustering
+
+    def _remove_node(self, G, node, keep_first):
+        in_degree, degree, label = G.in_degree(node), G.degree(node), G.nodes[node].get('label')
+        if self.triangle_records is not None:
+            self._remove_triangles(node, label)
+        self.nodes -= 1
+        _decrement(self.degree_counts, degree)
+        _decrement(self.in_degree_counts, in_degree)
+        self.in_degree_sum -= in_degree
+        if label is not None:
+            _decrement(self.label_count, label)
+            if not keep_first and self._first.get(label, (None, None))[1] == node:
+                del self._first[label]
+            _decrement(self.label_degree_counts[label], degree)
+            self.label_degree_sum[label] -= degree
+            if not self.label_count[label]:
+                # Do not carry rounding residue over to the next member.
+                self.label_clustering_sum[label] = 0.0
+
+    def _add_node(self, G, node, is_new, keep_first, pred, succ):
+        in_degree, degree, label = G.in_degree(node), G.degree(node), G.nodes[node].get('label')
+        self.nodes += 1
+        self.degree_counts[degree] += 1
+        self.in_degree_counts[in_degree] += 1
+        self.in_degree_sum += in_degree
+        if label is not None:
+            if is_new and not self.label_count[label]:
+                self._first[label] = (self._next_key, node)
+            elif not is_new and not keep_first:
+                # A relabelled node may come before the label's first member.
+                self._first.pop(label, None)
+            self.label_count[label] += 1
+            self.label_degree_counts[label][degree] += 1
+            self.label_degree_sum[label] += degree
+        if is_new:
+            self._next_key += 1
+        if self.triangle_records is not None:
+            self._add_triangles(node, label, pred, succ)
+
+    def update(self, old_graph, new_graph, change):
+        """Move from old_graph to new_graph, which differ by `change`."""
+        old_pred, old_succ = _Neighbourhoods(old_graph._pred), _Neighbourhoods(old_graph._succ)
+        pred, succ = _Neighbourhoods(new_graph._pred), _Neighbourhoods(new_graph._succ)
+
+        with self._lock:
+            self._graph = new_graph
+            # Common neighbours of a changed edge gain or lose a triangle;
+            # look them up on both sides of the change.
+            nearby = set()
+            if self.triangle_records is not None:
+                for u, v in change.edges:
+                    for p, s in ((old_pred, old_succ), (pred, succ)):
+                        if u in p.adjacency and v in p.adjacency:
+                            nearby |= (p[u] | s[u]) & (p[v] | s[v])
+                nearby -= change.nodes
+            self.edges = new_graph.number_of_edges()
+            for node in nearby:
+                if node in self.triangle_records:
+                    label = new_graph.nodes[node].get('label')
+                    self._remove_triangles(node, label)
+                    self._add_triangles(node, label, pred, succ)
+            for node in change.nodes:
+                old, new = node in old_graph, node in new_graph
+                keep_first = old and new and old_graph.nodes[node].get('label') == new_graph.nodes[node].get('label')
+                if old:
+                    self._remove_node(old_graph, node, keep_first)
+                if new:
+                    self._add_node(new_graph, node, not old, keep_first, pred, succ)
+
+    def _find_first_members(self):
+        """Sort keys of the first member of every label, from one scan of the graph. Must hold self._lock."""
+        self._first = {}
+        for position, (node, label) in enumerate(self._graph.nodes(data='label')):
+            if label is not None and label not in self._first:
+                self._first[label] = (position, node)
+        self._next_key = self._graph.number_of_nodes()
+
+    def degree_histogram(self):
+        """[(degree, frequency), ...] for every degree that occurs, ascending."""
+        with self._lock:
+            return sorted(self.degree_counts.items())
+
+    def label_counts(self):
+        """[(label, member count), ...] in the order each label's first member appears."""
+        with self._lock:
+            present = [label for label, count in self.label_count.items() if count]
+            if any(label not in self._first for label in present):
+                self._find_first_members()
+            return [(label, self.label_count[label]) for label in sorted(present, key=self._first.get)]
+
+    def label_statistics(self, clustering=True):
+        """{label: (count, degree min, degree avg, degree max, average clustering)}, labels sorted.
+
+        With clustering=False the average clustering is None, and the
+        triangle records are not built for it.
+        """
+        with self._lock:
+            if clustering:
+                self._build_triangles()
+            stats = {}
+            for label in sorted(self.label_count):
+                count = self.label_count[label]
+                if not count:
+                    continue
+                degrees = self.label_degree_counts[label]
+                stats[label] = (count, min(degrees), self.label_degree_sum[label] / count, max(degrees),
+                                self.label_clustering_sum[label] / count if clustering else None)
+            return stats
+
+    def label_degree_histogram(self, label):
+        with self._lock:
+            return sorted(self.label_degree_counts.get(label, Counter()).items())
+
+    def summary(self):
+        """Counts, degrees, density, centralization, average clustering and transitivity."""
+        with self._lock:
+            self._build_triangles()
+            n = self.nodes
+            return {
+                'nodes': n,
+                'edges': self.edges,
+                'avg_in_degree': self.in_degree_sum / float(n),
+                'avg_out_degree': self.edges / float(n),
+                'density': 0 if n <= 1 else self.edges / (n * (n - 1)),
+                'degree_centralization': float(n * max(self.in_degree_counts) - self.in_degree_sum) / (n - 1) ** 2,
+                'average_clustering': self.clustering_sum / n if n else 0.0,
+                'transitivity': 0 if self.triangles == 0 else self.triangles / self.triads,
+            }
+
+
+def _decrement(counter, key):
+    counter[key] -= 1
+    if not counter[key]:
+        del counter[key]
+
+
+_lock = threading.Lock()
+_state = {'version': None, 'aggregates': None}
+
+
+def _on_change(old_graph, old_version, new_graph, new_version, change):
+    with _lock:
+        if _state['version'] != old_version:
+            return
+        _state['aggregates'].update(old_graph, new_graph, change)
+        _state['version'] = new_version
+
+
+graph_store.store.listeners.append(_on_change)
+
+
+def current():
+    """Aggregates of the current graph."""
+    version = graph_store.graph_version()
+    with _lock:
+        if _state['version'] == version:
+            return _state['aggregates']
+    aggregates = Aggregates(backend.current(), labels.label_index())
+    with _lock:
+        if _state['version'] != version:
+            _state.update(version=version, aggregates=aggregates)
+    return aggregates
@@ -0,0 +1,107 @@
+"""
+    Pivot-sampled estimators for closeness and betweenness centrality.
+
+    Instead of a BFS from every node, k source pivots are drawn uniformly
+    (with the same sampler nx.betweenness_centrality(G, k=k, seed=seed)
+    uses) and a single sweep from them feeds both estimators:
+
+    * betweenness (Brandes-Pich): the mean pivot dependency, rescaled like
+      networkx rescales a sampled run. For the same k and seed the values
+      are the ones networkx returns.
+    * closeness (Eppstein-Wang): the reach fraction p and the mean distance
+      y *to* each node over the pivots give p**2 / y, which is the
+      Wasserman-Faust closeness networkx computes on the full graph.
+
+    Each estimate comes with the half-width of its 95% confidence
+    interval, from the sample variance of the pivot contributions (the
+    delta method for the closeness ratio). A node with fewer than two
+    pivots counting towards it has no error bound (None).
+"""
+import random
+from collections import namedtuple
+
+import numpy as np
+
+from . import parallel
+
+Z_95 = 1.959963984540054
+
+ApproximateCentrality = namedtuple('ApproximateCentrality', [
+    'sample_size', 'closeness', 'closeness_error', 'betweenness', 'betweenness_error',
+])
+
+
+def sample_sources(nodes, k, seed=None):
+    k = min(k, len(nodes))
+    return random.Random(seed).sample(list(nodes), k)
+
+
+def approximate_centrality(graph, k=256, seed=None):
+    """Estimates for `graph`, a backend.CompactGraph (or anything with nodes, offsets, neighbors)."""
+    nodes = graph.nodes
+    n = len(nodes)
+    pivots = sample_sources(range(n), k, seed)
+    k = len(pivots)
+    sweep = parallel.all_pairs_sweep(graph, with_betweenness=True, sources=pivots)
+
+    is_pivot = np.zeros(n, dtype=np.int64)
+    is_pivot[pivots] = 1
+    # A pivot never counts towards its own estimate.
+    samples = k - is_pivot
+
+    closeness, closeness_error = _closeness_estimate(sweep, samples, is_pivot)
+    betweenness, betweenness_error = _betweenness_estimate(sweep, samples, n)
+
+    return ApproximateCentrality(
+        sample_size=k,
+        closeness=dict(zip(nodes, closeness.tolist())),
+        closeness_error=_error_dict(nodes, closeness_error),
+        betweenness=dict(zip(nodes, betweenness.tolist())),
+        betweenness_error=_error_dict(nodes, betweenness_error),
+    )
+
+
+def _error_dict(nodes, error):
+    return {node: None if np.isnan(e) else e for node, e in zip(nodes, error.tolist())}
+
+
+def _half_width(variance, samples):
+    """95% half-width of a mean over `samples` draws, given their population variance.
+
+    The population variance is rescaled to the sample variance (m - 1
+    denominator); with fewer than two samples the width is NaN.
+    """
+    m = samples.astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = Z_95 * np.sqrt(np.maximum(variance, 0.0) / (m - 1))
+    return np.where(samples >= 2, error, np.nan)
+
+
+def _closeness_estimate(sweep, samples, is_pivot):
+    m = np.maximum(samples, 1).astype(float)
+    reached = (sweep.reach_to - is_pivot).astype(float)
+    p = reached / m
+    y = sweep.dist_to / m
+    y_sq = sweep.dist_sq_to / m
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        estimate = np.where(y > 0, p * p / y, 0.0)
+        # Delta method for f(p, y) = p**2 / y with Z = reached, Y = distance.
+        grad_p = np.where(y > 0, 2 * p / y, 0.0)
+        grad_y = np.where(y > 0, -p * p / (y * y), 0.0)
+    var_p = p * (1 - p)
+    var_y = np.maximum(y_sq - y * y, 0.0)
+    cov_py = y * (1 - p)
+    variance = grad_p ** 2 * var_p + grad_y ** 2 * var_y + 2 * grad_p * grad_y * cov_py
+    return estimate, _half_width(variance, samples)
+
+
+def _betweenness_estimate(sweep, samples, n):
+    if n <= 2:
+        return np.zeros(n), _half_width(np.zeros(n), samples)
+    m = np.maximum(samples, 1).astype(float)
+    # Pivot contributions normalized to [0, 1]; their mean is the estimate.
+    mean = sweep.dependency_sum * (1 / (m * (n - 2)))
+    mean_sq = sweep.dependency_sq / (m * (n - 2) ** 2)
+    variance = np.maximum(mean_sq - mean * mean, 0.0)
+    return mean, _half_width(variance, samples)
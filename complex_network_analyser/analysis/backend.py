@@ -0,0 +1,273 @@
+"""
+    Graph backends.
+
+    GraphBackend names what the analyses need from a graph. Every node is
+    addressed by its position 0..N-1, and NodeIds come back only when a
+    response is built (nodes, ids(), position()).
+
+    CompactGraph is the default. It holds plain arrays:
+
+        nodes                      position -> NodeId
+        offsets, neighbors         CSR: successors grouped by source, in networkx order
+        in_offsets, in_neighbors   CSC: predecessors grouped by target (built on first use)
+        label_codes                position -> index into labels, -1 if unlabelled
+
+    It is built once per graph version. When the store was loaded from a
+    snapshot, it is built straight from the memory-mapped snapshot arrays,
+    without the store ever building a DiGraph; after edits it is built
+    from the store's DiGraph. Positions follow list(G) either way, so
+    sparse.adjacency(), labels.label_index() and the layouts all index
+    the same way.
+
+    NetworkXGraph adapts the store's DiGraph to the same interface. Its
+    `graph` attribute is for the algorithms that are not ported to arrays
+    yet: EoN, Louvain, nx.betweenness_centrality, the spring layout, the
+    Fagiolo clustering and the incremental aggregates. Asking for it (or
+    for graph_store.get_graph()) is what makes the store build the
+    DiGraph, so only those algorithms pay for it.
+"""
+import abc
+import functools
+import threading
+
+import numpy as np
+
+from . import graph_store, instrumentation, parallel
+
+
+class GraphBackend(abc.ABC):
+
+    nodes = ()
+    labels = ()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @abc.abstractmethod
+    def number_of_edges(self):
+        pass
+
+    @property
+    @abc.abstractmethod
+    def offsets(self):
+        """CSR offsets: the successors of position i are neighbors[offsets[i]:offsets[i + 1]]."""
+
+    @property
+    @abc.abstractmethod
+    def neighbors(self):
+        """CSR successor positions, grouped by source in networkx order."""
+
+    @property
+    @abc.abstractmethod
+    def label_codes(self):
+        """Index into labels of every node, by position; -1 if unlabelled."""
+
+    @property
+    @abc.abstractmethod
+    def out_degree(self):
+        pass
+
+    @property
+    @abc.abstractmethod
+    def in_degree(self):
+        pass
+
+    @abc.abstractmethod
+    def successors(self, i):
+        pass
+
+    @abc.abstractmethod
+    def predecessors(self, i):
+        pass
+
+    @abc.abstractmethod
+    def edges(self):
+        """(source positions, target positions), grouped by source."""
+
+    @abc.abstractmethod
+    def node_labels(self):
+        """Label (or None) of every node, by position."""
+
+    def ids(self, positions):
+        return [self.nodes[i] for i in np.asarray(positions).tolist()]
+
+    @functools.cached_property
+    def _positions(self):
+        return {node: i for i, node in enumerate(self.nodes)}
+
+    def position(self, node_id):
+        """Position of a NodeId; KeyError if it is not in the graph."""
+        return self._positions[node_id]
+
+
+def _label_codes(G, nodes):
+    """Sorted distinct labels of G, and the index of each node's label in them (-1 if unlabelled)."""
+    attrs = G.nodes
+    raw = [attrs[node].get('label') for node in nodes]
+    labels = sorted({label for label in raw if label is not None})
+    code_of = {label: i for i, label in enumerate(labels)}
+    return labels, np.array([code_of.get(label, -1) for label in raw], dtype=np.int64)
+
+
+class CompactGraph(GraphBackend):
+
+    def __init__(self, nodes, offsets, neighbors, label_codes, labels):
+        self.nodes = nodes
+        self._offsets = np.asarray(offsets)
+        self._neighbors = np.asarray(neighbors)
+        self._label_codes = np.asarray(label_codes)
+        self.labels = list(labels)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.node_ids.tolist(), snapshot.offsets, snapshot.neighbors,
+                   snapshot.label_codes, snapshot.labels)
+
+    @classmethod
+    def from_networkx(cls, G):
+        nodes, offsets, neighbors = parallel.csr_arrays(G)
+        labels, codes = _label_codes(G, nodes)
+        return cls(nodes, offsets, neighbors, codes, labels)
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def neighbors(self):
+        return self._neighbors
+
+    @property
+    def label_codes(self):
+        return self._label_codes
+
+    def number_of_edges(self):
+        return len(self.neighbors)
+
+    @functools.cached_property
+    def out_degree(self):
+        return np.diff(self.offsets).astype(np.int64)
+
+    @functools.cached_property
+    def in_degree(self):
+        return np.bincount(self.neighbors, minlength=len(self.nodes)).astype(np.int64)
+
+    @functools.cached_property
+    def _csc(self):
+        order = np.argsort(self.neighbors, kind='stable')
+        in_neighbors = self.edges()[0][order].astype(self.neighbors.dtype)
+        in_offsets = np.zeros(len(self.nodes) + 1, dtype=self.offsets.dtype)
+        np.cumsum(self.in_degree, out=in_offsets[1:])
+        return in_offsets, in_neighbors
+
+    @property
+    def in_offsets(self):
+        return self._csc[0]
+
+    @property
+    def in_neighbors(self):
+        return self._csc[1]
+
+    def successors(self, i):
+        return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
+
+    def predecessors(self, i):
+        return self.in_neighbors[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def edges(self):
+        return np.repeat(np.arange(len(self.nodes)), self.out_degree), self.neighbors
+
+    def node_labels(self):
+        return [self.labels[code] if code >= 0 else None for code in self.label_codes.tolist()]
+
+
+class NetworkXGraph(GraphBackend):
+
+    def __init__(self, G):
+        self.graph = G
+        self.nodes = list(G)
+        self.labels, self._label_codes = _label_codes(G, self.nodes)
+
+    @functools.cached_property
+    def _csr(self):
+        return parallel.csr_arrays(self.graph)[1:]
+
+    @property
+    def offsets(self):
+        return self._csr[0]
+
+    @property
+    def neighbors(self):
+        return self._csr[1]
+
+    @property
+    def label_codes(self):
+        return self._label_codes
+
+    def number_of_edges(self):
+        return self.graph.number_of_edges()
+
+    @property
+    def out_degree(self):
+        return np.array([d for _, d in self.graph.out_degree(self.nodes)], dtype=np.int64)
+
+    @property
+    def in_degree(self):
+        return np.array([d for _, d in self.graph.in_degree(self.nodes)], dtype=np.int64)
+
+    def successors(self, i):
+        return np.array([self._positions[v] for v in self.graph._succ[self.nodes[i]]], dtype=np.int64)
+
+    def predecessors(self, i):
+        return np.array([self._positions[v] for v in self.graph._pred[self.nodes[i]]], dtype=np.int64)
+
+    def edges(self):
+        index = self._positions
+        pairs = np.array([(index[u], index[v]) for u, v in self.graph.edges], dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def node_labels(self):
+        attrs = self.graph.nodes
+        return [attrs[node].get('label') for node in self.nodes]
+
+
+_lock = threading.Lock()
+_cache = {'version': None, 'compact': None, 'networkx': None}
+
+
+def _cached(kind, build):
+    version = graph_store.graph_version()
+    with _lock:
+        if _cache['version'] == version and _cache[kind] is not None:
+            return _cache[kind]
+    value, version = build(version)
+    with _lock:
+        if _cache['version'] != version:
+            _cache.update(version=version, compact=None, networkx=None)
+        _cache[kind] = value
+    return value
+
+
+def _compact(version):
+    snapshot = graph_store.store.snapshot
+    with instrumentation.phase('backend'):
+        # An unedited snapshot is this version's graph; no DiGraph needed.
+        if snapshot is not None and snapshot.source_version == version:
+            return CompactGraph.from_snapshot(snapshot), version
+        G, version = graph_store.get_versioned_graph()
+        return CompactGraph.from_networkx(G), version
+
+
+def _networkx(version):
+    G, version = graph_store.get_versioned_graph()
+    return NetworkXGraph(G), version
+
+
+def current():
+    """CompactGraph of the graph currently in the store."""
+    return _cached('compact', _compact)
+
+
+def networkx():
+    """NetworkXGraph of the graph currently in the store, for the algorithms that need networkx."""
+    return _cached('networkx', _networkx)
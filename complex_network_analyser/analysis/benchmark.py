@@ -0,0 +1,349 @@
+"""
+    Benchmark harness on synthetic datasets.
+
+    synthetic_dataset() generates a labelled directed graph with a given
+    number of edges and a skewed in-degree distribution, roughly shaped
+    like the real one (about 4 edges per node, NodeIds up to 1.2M, 7 labels
+    plus about 6% 'Unknown'), and writes it as a binary snapshot.
+
+    run() swaps the process-wide graph store for one over that snapshot and
+    times, for every size:
+
+    * the underlying computations, called directly (loading, the sparse
+      view, the centralities, Louvain, the layouts, the epidemic engine,
+      label propagation, ...);
+    * every GET route end to end through the Django test client, on a
+      second copy of the dataset, so the views start from cold caches.
+
+    * the startup of a fresh interpreter (case 'startup'): the time to set
+      Django up and import the URLconf, which heavy libraries that left
+      loaded, and the latency of the first requests after it, both cold
+      and after preload.preload(). Each is the median of a few separate
+      processes.
+
+    Each case records its wall time and, unless disabled, the peak of the
+    memory traced by tracemalloc (which also sees NumPy buffers, and slows
+    pure Python code down a bit). Cases that would take hours at a size,
+    such as the exact all-pairs sweeps on 1M edges, are skipped unless
+    max_edges is lifted. The report is plain JSON, so two runs can be
+    compared between commits.
+"""
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from . import (communities, centrality, epidemics, graph_store, inference, labels, layout, metrics,
+               reachability, snapshot as snapshot_format, sparse)
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+EDGES_PER_NODE = 4
+LABELS = ['L1', 'L2', 'L3', 'L4', 'L5', 'L6', 'L7', 'Unknown']
+LABEL_SHARES = [0.10, 0.14, 0.28, 0.15, 0.08, 0.06, 0.13, 0.06]
+MAX_NODE_ID = 1_200_000
+
+
+def synthetic_edges(edges, seed=0):
+    """(source ids, target ids, labels by id) with `edges` distinct edges and no self loops."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    n = max(2, edges // EDGES_PER_NODE)
+    node_ids = rng.choice(max(MAX_NODE_ID, 2 * n), size=n, replace=False).astype(np.int64)
+    # Targets follow a Zipf-like popularity, sources are uniform.
+    popularity = 1.0 / np.arange(1, n + 1) ** 0.8
+    popularity /= popularity.sum()
+
+    keys = np.zeros(0, dtype=np.int64)
+    while len(keys) < edges:
+        draw = int((edges - len(keys)) * 1.2) + 16
+        src = rng.integers(0, n, size=draw)
+        dst = rng.choice(n, size=draw, p=popularity)
+        candidates = np.concatenate([keys, (src * n + dst)[src != dst]])
+        _, first = np.unique(candidates, return_index=True)
+        keys = candidates[np.sort(first)]
+    keys = keys[:edges]
+
+    codes = rng.choice(len(LABELS), size=n, p=LABEL_SHARES)
+    labels_by_id = pd.Series(np.array(LABELS, dtype=object)[codes], index=node_ids)
+    return node_ids[keys // n], node_ids[keys % n], labels_by_id
+
+
+def synthetic_dataset(edges, out_dir, seed=0, tag=''):
+    """Write a synthetic snapshot to out_dir and return its meta."""
+    src, dst, labels_by_id = synthetic_edges(edges, seed)
+    version = 'synthetic-{}-{}{}'.format(edges, seed, tag)
+    return snapshot_format.write_snapshot(src, dst, labels_by_id, version, out_dir)
+
+
+class SnapshotStore(graph_store.GraphStore):
+    """A GraphStore over a snapshot directory alone, without Excel sources."""
+
+    def __init__(self, snapshot_dir, edits_path):
+        super().__init__(edges_path=None, nodes_path=None, snapshot_dir=snapshot_dir, edits_path=edits_path)
+
+    def _source_paths(self):
+        return (os.path.join(self.snapshot_dir, 'meta.json'),)
+
+    def hash_sources(self):
+        return snapshot_format.read_meta(self.snapshot_dir)['source_version']
+
+    def _load(self, version):
+        # The DiGraph is built from the snapshot when something needs it.
+        self.snapshot = snapshot_format.load_snapshot(self.snapshot_dir)
+        return None
+
+
+@contextlib.contextmanager
+def synthetic_store(snapshot_dir, work_dir):
+    """Serve the snapshot in snapshot_dir from the process-wide graph store."""
+    previous_store, previous_layout_dir = graph_store.store, layout.LAYOUT_DIR
+    graph_store.store = SnapshotStore(snapshot_dir, os.path.join(work_dir, 'edits.jsonl'))
+    layout.LAYOUT_DIR = os.path.join(work_dir, 'layouts')
+    try:
+        yield graph_store.store
+    finally:
+        graph_store.store, layout.LAYOUT_DIR = previous_store, previous_layout_dir
+
+
+def _sir():
+    members = labels.label_index().members['L1']
+    return epidemics.simulate(sparse.adjacency(), 'SIR', 0.5, 0.5, members, runs=32, seed=0)
+
+
+# (name, callable, largest edge count it is run at by default)
+COMPUTATIONS = [
+    ('load', graph_store.get_graph, None),
+    ('sparse_adjacency', sparse.adjacency, None),
+    ('label_index', labels.label_index, None),
+    ('centrality.degree', lambda: centrality.scores('degree'), None),
+    ('centrality.eigenvector', lambda: centrality.scores('eigenvector'), None),
+    ('centrality.closeness', lambda: centrality.scores('closeness'), 10_000),
+    ('centrality.betweenness', lambda: centrality.scores('betweenness'), 10_000),
+    ('metrics.path_summary', lambda: metrics.path_summary(sparse.adjacency()), 100_000),
+    ('reachability', reachability.reachability, None),
+    ('metrics.triangle_summary', lambda: metrics.triangle_summary(graph_store.get_graph()), None),
+    ('communities.louvain', lambda: communities.partition(seed=0), 100_000),
+    ('layout.forceatlas2', lambda: layout.positions('forceatlas2'), 100_000),
+    ('layout.spring', lambda: layout.positions('spring'), 10_000),
+    ('epidemics.sir', _sir, None),
+    ('inference.label_propagation', inference.predictions, None),
+]
+
+# (name, url, largest edge count it is run at by default)
+VIEWS = [
+    ('general_statistical_info', '/api/v1/general_statistical_info/', 10_000),
+    ('top_5_nodes_based_on_several_measures', '/api/v1/top_5_nodes_based_on_several_measures/', 10_000),
+    ('top_5_nodes_based_on_several_measures.approx',
+     '/api/v1/top_5_nodes_based_on_several_measures/?mode=approx&seed=0', 100_000),
+    ('top_nodes.degree', '/api/v1/top_nodes/degree/', None),
+    ('degree_distribution', '/api/v1/degree_distribution/', None),
+    ('reachability', '/api/v1/reachability/', None),
+    ('reachability.components', '/api/v1/reachability/components/', None),
+    ('community_weight', '/api/v1/community_weight/?seed=0', 100_000),
+    ('communities.sizes', '/api/v1/communities/sizes/?seed=0', 100_000),
+    ('node_labels', '/api/v1/node_labels/', None),
+    ('label_clustering', '/api/v1/label_clustering/', None),
+    ('label_degree_values', '/api/v1/label_degree_values/', None),
+    ('label_degree_distribution', '/api/v1/label_degree_distribution/L1/', None),
+    ('predicted_labels', '/api/v1/predicted_labels/?seed=0', 100_000),
+    ('sis_epidemic', '/api/v1/sis_epidemic/', 10_000),
+    ('sir_epidemic', '/api/v1/sir_epidemic/', 100_000),
+    ('sir_epidemic.batch', '/api/v1/sir_epidemic/?engine=batch&runs=32&seed=0', None),
+    ('convert_graph.columnar', '/api/v1/convert_graph/?layout=forceatlas2&payload=columnar', 100_000),
+    ('convert_graph', '/api/v1/convert_graph/', 10_000),
+    ('viewport', '/api/v1/viewport/?layout=forceatlas2&xmin=-1000&ymin=-1000&xmax=1000&ymax=1000', 100_000),
+]
+
+# First requests of a fresh process, in this order: one that needs no
+# graph, the first one to load it, and the ones behind lazily imported
+# libraries.
+STARTUP_VIEWS = [
+    ('metrics', '/metrics'),
+    ('node_labels', '/api/v1/node_labels/'),
+    ('top_nodes.degree', '/api/v1/top_nodes/degree/'),
+    ('sir_epidemic', '/api/v1/sir_epidemic/'),
+]
+STARTUP_REPEATS = 3
+HEAVY_MODULES = ('pandas', 'networkx', 'EoN', 'community', 'matplotlib', 'scipy.sparse', 'scipy.stats')
+
+# Run with `python -c` in a fresh interpreter; times everything up to and
+# including the URLconf (which imports the views) before anything else
+# of the app is imported.
+_STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+import sys
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+imported = time.perf_counter()
+modules = set(sys.modules)
+from analysis import benchmark
+benchmark._startup_probe(imported - start, modules)
+'''
+
+
+def measure(fn, trace_memory=True):
+    """{'seconds': ..., 'peak_bytes': ...} for one call of fn."""
+    if trace_memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    fn()
+    result = {'seconds': round(time.perf_counter() - start, 6)}
+    if trace_memory:
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1] - before
+    return result
+
+
+def _run_case(fn, edges, max_edges, trace_memory, unlimited):
+    if max_edges is not None and edges > max_edges and not unlimited:
+        return {'skipped': 'more than {} edges'.format(max_edges)}
+    try:
+        return measure(fn, trace_memory)
+    except Exception as e:
+        return {'error': repr(e)}
+
+
+def _view(client, url):
+    def call():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError('HTTP {}'.format(response.status_code))
+        # Streamed responses only do their work when consumed.
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+    return call
+
+
+def _startup_probe(import_seconds, modules):
+    """Child side of startup(): print the timings of this process as JSON."""
+    from django.test import Client
+
+    snapshot_dir, work_dir, mode = sys.argv[1:4]
+    result = {
+        'import_seconds': round(import_seconds, 6),
+        'heavy_modules': [name for name in HEAVY_MODULES if name in modules],
+    }
+    with synthetic_store(snapshot_dir, work_dir):
+        if mode == 'preload':
+            from . import preload
+            result['preload_seconds'] = measure(preload.preload, trace_memory=False)['seconds']
+        client = Client()
+        result['first_request'] = {name: measure(_view(client, url), trace_memory=False)['seconds']
+                                   for name, url in STARTUP_VIEWS}
+    print(json.dumps(result))
+
+
+def _median(results):
+    first = results[0]
+    if isinstance(first, dict):
+        return {key: _median([result[key] for result in results]) for key in first}
+    if isinstance(first, list):
+        return first
+    return round(statistics.median(results), 6)
+
+
+def startup(snapshot_dir, work_dir, repeats=STARTUP_REPEATS):
+    """Median startup timings of fresh processes serving the snapshot, cold and after preload."""
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=project_dir)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'complex_network_analyser.settings')
+    report = {'repeats': repeats}
+    for mode in ('cold', 'preload'):
+        results = []
+        for i in range(repeats):
+            # A directory of its own per process, so no layout or edit log carries over.
+            run_dir = os.path.join(work_dir, '{}-{}'.format(mode, i))
+            os.makedirs(run_dir)
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT, snapshot_dir, run_dir, mode],
+                                 cwd=project_dir, env=env, capture_output=True, text=True, check=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            result['process_seconds'] = round(time.perf_counter() - start, 6)
+            results.append(result)
+        report[mode] = _median(results)
+    return report
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=('10k',), seed=0, only=None, trace_memory=True, unlimited=False, log=None):
+    """Run the benchmark for the given sizes (keys of SIZES or edge counts)."""
+    from django.test import Client
+
+    def wanted(name):
+        return not only or any(part in name for part in only)
+
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'started': datetime.now(timezone.utc).isoformat(),
+        'trace_memory': trace_memory,
+        'sizes': {},
+    }
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for size in sizes:
+            edges = SIZES.get(size, size)
+            edges = int(edges)
+            result = report['sizes'][str(size)] = {'edges': edges, 'computations': {}, 'views': {}}
+            work_dir = tempfile.mkdtemp(prefix='analysis-benchmark-')
+            try:
+                start = time.perf_counter()
+                meta = synthetic_dataset(edges, os.path.join(work_dir, 'computations'), seed)
+                synthetic_dataset(edges, os.path.join(work_dir, 'views'), seed, tag='-views')
+                result.update(nodes=meta['nodes'], generate_seconds=round(time.perf_counter() - start, 6))
+
+                with synthetic_store(os.path.join(work_dir, 'computations'), work_dir):
+                    for name, fn, max_edges in COMPUTATIONS:
+                        if wanted(name):
+                            result['computations'][name] = _run_case(fn, edges, max_edges, trace_memory, unlimited)
+                            if log:
+                                log(size, name, result['computations'][name])
+
+                if wanted('startup'):
+                    synthetic_dataset(edges, os.path.join(work_dir, 'startup'), seed, tag='-startup')
+                    try:
+                        result['startup'] = startup(os.path.join(work_dir, 'startup'), work_dir)
+                    except (subprocess.CalledProcessError, ValueError) as e:
+                        result['startup'] = {'error': repr(e)}
+                    if log:
+                        log(size, 'startup', result['startup'])
+
+                client = Client()
+                with synthetic_store(os.path.join(work_dir, 'views'), work_dir):
+                    for name, url, max_edges in VIEWS:
+                        if wanted(name):
+                            result['views'][name] = _run_case(_view(client, url), edges, max_edges,
+                                                              trace_memory, unlimited)
+                            if log:
+                                log(size, name, result['views'][name])
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    report['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
@@ -0,0 +1,111 @@
+"""
+    Per-measure centrality scores with top-k selection.
+
+    Each measure is only computed when it is asked for, and its scores are
+    kept as a NumPy array per (measure, graph version), so a dashboard that
+    only wants degree centrality never pays for betweenness. The top k are
+    picked with np.argpartition instead of sorting every node.
+"""
+import threading
+
+import numpy as np
+
+from . import backend, graph_store, instrumentation, metrics, parallel, sparse
+
+
+def _degree(measure):
+    return {'degree': sparse.degree_centrality(sparse.adjacency())}
+
+
+def _eigenvector(measure):
+    return {'eigenvector': sparse.eigenvector_centrality(sparse.adjacency())}
+
+
+def _path_based(measure):
+    if measure == 'closeness':
+        return {'closeness': metrics.path_summary(sparse.adjacency()).closeness}
+    # The worker pool's betweenness sweep yields closeness too, so keep both.
+    if parallel.worker_count() > 1:
+        sweep = parallel.all_pairs_sweep(sparse.adjacency(), with_betweenness=True)
+        closeness = metrics.closeness_from_accumulators(sweep.nodes, sweep.dist_to, sweep.reach_to)
+        return {'closeness': closeness, 'betweenness': sweep.betweenness}
+    import networkx as nx
+
+    return {'betweenness': nx.betweenness_centrality(backend.networkx().graph)}
+
+
+MEASURES = {
+    'degree': _degree,
+    'closeness': _path_based,
+    'betweenness': _path_based,
+    'eigenvector': _eigenvector,
+}
+
+_lock = threading.Lock()
+_scores = {}
+
+
+def scores(measure):
+    """(node list, score array) for one measure on the current graph."""
+    if measure not in MEASURES:
+        raise KeyError(measure)
+    version = graph_store.graph_version()
+    key = (measure, version)
+    with _lock:
+        cached = _scores.get(key)
+    if cached is not None:
+        return cached
+
+    with instrumentation.phase('centrality.' + measure):
+        computed = MEASURES[measure](measure)
+    nodes = sparse.adjacency().nodes
+    with _lock:
+        for stale in [k for k in _scores if k[1] != version]:
+            del _scores[stale]
+        for name, values in computed.items():
+            # Measures return either a {node: score} dict or an array in list(G) order.
+            if not isinstance(values, np.ndarray):
+                values = np.array([values[node] for node in nodes], dtype=float)
+            _scores[(name, version)] = (nodes, values)
+        return _scores[key]
+
+
+def top_k_indices(values, k):
+    """Indices of the k largest values, ties broken by position.
+
+    This is the order sorted(..., reverse=True) gives, without sorting
+    more than the k selected entries.
+    """
+    n = len(values)
+    k = min(k, n)
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    if k < n:
+        threshold = values[np.argpartition(values, n - k)[n - k]]
+        above = np.flatnonzero(values > threshold)
+        ties = np.flatnonzero(values == threshold)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order]
+
+
+def _top_rows(nodes, values, k, errors=None):
+    rows = []
+    for i in top_k_indices(values, k).tolist():
+        rows.append({'node': nodes[i], 'value': float(values[i])})
+        if errors is not None:
+            rows[-1]['error'] = errors[nodes[i]]
+    return rows
+
+
+def top_nodes(measure, k=5):
+    nodes, values = scores(measure)
+    return _top_rows(nodes, values, k)
+
+
+def top_of(values, k=5, errors=None):
+    """Top k of an already computed {node: score} dict, e.g. an estimate."""
+    nodes = list(values)
+    return _top_rows(nodes, np.array([values[node] for node in nodes], dtype=float), k, errors)
@@ -0,0 +1,121 @@
+"""
+    Louvain community subsystem.
+
+    A partition of the undirected version of the graph is computed once per
+    (graph version, resolution, seed) and kept in memory. It is stored as a
+    community id per node position in list(G), with ids numbered in the
+    order the communities first appear, and the members of all communities
+    are grouped at once by a bincount and one stable sort.
+
+    When the graph version changes, the last partition computed with the
+    same resolution and seed is the starting point of the next run: known
+    nodes start in their old community and new nodes on their own, so
+    Louvain only has to repair the part of the graph that changed.
+
+    The community_weight and /communities/ endpoints are views over the
+    cached Partition.
+"""
+import threading
+
+import numpy as np
+
+from . import backend, graph_store, instrumentation, sparse
+
+# Partitions kept per graph version (one per resolution/seed pair asked for).
+MAX_PARTITIONS = 16
+
+
+class Partition:
+
+    def __init__(self, nodes, membership, modularity, resolution, seed):
+        self.nodes = nodes
+        self.membership = membership
+        self.modularity = modularity
+        self.resolution = resolution
+        self.seed = seed
+        self.sizes = np.bincount(membership) if len(membership) else np.zeros(0, dtype=np.int64)
+        self._order = np.argsort(membership, kind='stable')
+        self._bounds = np.concatenate([[0], np.cumsum(self.sizes)])
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def members(self, community):
+        """Node positions of one community, ascending."""
+        return self._order[self._bounds[community]:self._bounds[community + 1]]
+
+    def member_ids(self, community):
+        return [self.nodes[i] for i in self.members(community).tolist()]
+
+    def size_distribution(self):
+        """[(community size, number of communities of that size), ...] by size."""
+        counts = np.bincount(self.sizes)
+        sizes = np.flatnonzero(counts)
+        return list(zip(sizes.tolist(), counts[sizes].tolist()))
+
+
+def _first_appearance(raw):
+    """Renumber community ids 0..C-1 in the order they first appear."""
+    ids, first, inverse = np.unique(raw, return_index=True, return_inverse=True)
+    rank = np.empty(len(ids), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(ids))
+    return rank[inverse]
+
+
+def _initial_partition(nodes, previous):
+    """Louvain starting point from the partition of an older graph version."""
+    if previous is None:
+        return None
+    old_nodes, old_membership = previous
+    old = dict(zip(old_nodes, old_membership.tolist()))
+    next_id = int(old_membership.max()) + 1 if len(old_membership) else 0
+    initial = {}
+    for node in nodes:
+        community = old.get(node)
+        if community is None:
+            community = next_id
+            next_id += 1
+        initial[node] = community
+    return initial
+
+
+def louvain(G, nodes, resolution=1.0, seed=None, previous=None):
+    import community as louvain_community
+
+    undirected = G.to_undirected()
+    found = louvain_community.best_partition(
+        undirected, partition=_initial_partition(nodes, previous), resolution=resolution, random_state=seed)
+    membership = _first_appearance(np.array([found[node] for node in nodes], dtype=np.int64))
+    modularity = louvain_community.modularity(dict(zip(nodes, membership.tolist())), undirected)
+    return Partition(nodes, membership, modularity, resolution, seed)
+
+
+_lock = threading.Lock()
+_partitions = {}
+# Last (nodes, membership) per (resolution, seed), for warm starts.
+_previous = {}
+
+
+def partition(resolution=1.0, seed=None):
+    version = graph_store.graph_version()
+    key = (version, resolution, seed)
+    with _lock:
+        cached = _partitions.get(key)
+        previous = _previous.get((resolution, seed))
+    if cached is not None:
+        return cached
+
+    nodes = sparse.adjacency().nodes
+    with instrumentation.phase('communities.louvain'):
+        result = louvain(backend.networkx().graph, nodes, resolution, seed, previous)
+    with _lock:
+        for stale in [k for k in _partitions if k[0] != version]:
+            del _partitions[stale]
+        while len(_partitions) >= MAX_PARTITIONS:
+            del _partitions[next(iter(_partitions))]
+        _partitions[key] = result
+        _previous.pop((resolution, seed), None)
+        while len(_previous) >= MAX_PARTITIONS:
+            del _previous[next(iter(_previous))]
+        _previous[(resolution, seed)] = (nodes, result.membership)
+    return result
@@ -0,0 +1,157 @@
+"""
+    Batched Monte Carlo epidemic engine.
+
+    Many realizations of a discrete-time SIS or SIR process run at once:
+    the state of all runs is an N x R matrix, and one step is a sparse
+    product of the transposed adjacency with the infected indicator. That
+    gives every node the number of infected in-neighbours in every run.
+    Infection follows the direction of the edges, as in EoN on a DiGraph.
+    Per step of length dt:
+
+        P(S -> I) = 1 - exp(-tau * dt * infected in-neighbours)
+        P(I -> S or R) = 1 - exp(-gamma * dt)
+
+    Runs are split into fixed-size chunks with independent seeds spawned
+    from the request seed, so the result does not depend on how many pool
+    workers (settings.ANALYSIS_WORKERS) ran the chunks. Each chunk only
+    keeps the counts of the steps on the fixed output time grid, which are
+    then reduced to the mean and percentile bands over the runs.
+
+    resample() puts an event-driven trajectory (EoN's t, S, I, R arrays,
+    one entry per event) on the same kind of grid, so a response has
+    `points` samples however many events the simulation produced.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse as sp
+
+from . import jobs, parallel
+
+MODELS = {'SIS': ('S', 'I'), 'SIR': ('S', 'I', 'R')}
+PERCENTILES = (5, 25, 50, 75, 95)
+RUNS_PER_CHUNK = 16
+# Limits on a request: the simulated time (the EoN engine's old fixed
+# tmax) and the number of steps of the batch engine, which sets both the
+# size of the count arrays and the length of the step loop.
+MAX_TMAX = 2000.0
+MAX_STEPS = 100_000
+# Limit on runs x steps x nodes for the batch engine: the node updates
+# one request may cost.
+MAX_WORK = 1_000_000_000
+# Limits on the infection and recovery rates. The EoN engine's cost grows
+# with the number of events, about (tau + gamma) * tmax per node, so the
+# product is bounded too (by its value for the SIS defaults).
+MAX_RATE = 10.0
+MAX_EON_RATE_TIME = 2400.0
+
+Bands = namedtuple('Bands', ['t', 'runs', 'mean', 'percentiles'])
+
+_worker_adjacency = None
+
+
+def _transposed(offsets, neighbors, n):
+    data = np.ones(len(neighbors), dtype=np.float32)
+    return sp.csr_array((data, neighbors, offsets), shape=(n, n)).T.tocsr()
+
+
+def _init_worker(offsets, neighbors, n):
+    global _worker_adjacency
+    _worker_adjacency = _transposed(offsets, neighbors, n)
+
+
+def _run_chunk(AT, model, tau, gamma, initial, runs, dt, steps, sampled_steps, seed):
+    """Compartment counts of `runs` runs at each of the ascending, distinct `sampled_steps`."""
+    rng = np.random.default_rng(seed)
+    n = AT.shape[0]
+    compartments = MODELS[model]
+    state = np.zeros((n, runs), dtype=np.int8)
+    state[initial] = 1
+    p_recover = 1 - np.exp(-gamma * dt)
+    recovered_state = 2 if model == 'SIR' else 0
+
+    counts = np.zeros((len(compartments), len(sampled_steps), runs), dtype=np.int32)
+    row = 0
+    for step in range(steps + 1):
+        if step == sampled_steps[row]:
+            for c in range(len(compartments)):
+                counts[c, row] = (state == c).sum(axis=0)
+            row += 1
+        if row == len(sampled_steps):
+            break
+        infected = state == 1
+        pressure = AT @ infected.astype(np.float32)
+        p_infect = 1 - np.exp(-tau * dt * pressure)
+        draws = rng.random((n, runs))
+        newly_infected = (state == 0) & (draws < p_infect)
+        recovering = infected & (rng.random((n, runs)) < p_recover)
+        state[newly_infected] = 1
+        state[recovering] = recovered_state
+    return counts
+
+
+def _run_worker_chunk(args):
+    return _run_chunk(_worker_adjacency, *args)
+
+
+def sample_indices(times, grid):
+    """Index of the last of the ascending `times` at or before each grid time.
+
+    Counts only change at those times, so that entry is the state of the
+    process at the grid time.
+    """
+    return np.clip(np.searchsorted(times, grid + 1e-9, side='right') - 1, 0, len(times) - 1)
+
+
+def resample(t, series, points, end=None):
+    """(grid, sampled series): `points` evenly spaced times from t[0] to `end` (default t[-1])."""
+    t = np.asarray(t, dtype=float)
+    grid = np.linspace(t[0], t[-1] if end is None else end, points)
+    sample = sample_indices(t, grid)
+    return grid, tuple(np.asarray(values)[sample] for values in series)
+
+
+def simulate(view, model, tau, gamma, initial, runs=100, tmax=50.0, dt=0.1, points=51, seed=None, workers=None):
+    """Run `runs` realizations and summarize them on `points` grid times in [0, tmax]."""
+    if model not in MODELS:
+        raise KeyError(model)
+    workers = parallel.worker_count() if workers is None else workers
+    steps = max(1, int(np.ceil(tmax / dt)))
+    if steps > MAX_STEPS:
+        raise ValueError(f"tmax / dt must not exceed {MAX_STEPS} steps")
+    if runs * steps * len(view) > MAX_WORK:
+        raise ValueError(f"runs x steps x nodes must not exceed {MAX_WORK}")
+    grid = np.linspace(0, tmax, points)
+    # The step each grid time samples; only those are kept.
+    sampled_steps, rows = np.unique(sample_indices(np.arange(steps + 1) * dt, grid), return_inverse=True)
+
+    sizes = [min(RUNS_PER_CHUNK, runs - start) for start in range(0, runs, RUNS_PER_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(model, tau, gamma, initial, size, dt, steps, sampled_steps, chunk_seed)
+             for size, chunk_seed in zip(sizes, seeds)]
+
+    if workers == 1 or len(tasks) == 1:
+        AT = _transposed(view.offsets, view.neighbors, len(view))
+        chunks = []
+        for done, task in enumerate(tasks):
+            jobs.report_progress(done, len(tasks))
+            chunks.append(_run_chunk(AT, *task))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker,
+                                 initargs=(np.asarray(view.offsets), np.asarray(view.neighbors), len(view))) as pool:
+            chunks = []
+            for done, chunk in enumerate(pool.map(_run_worker_chunk, tasks), 1):
+                jobs.report_progress(done, len(tasks))
+                chunks.append(chunk)
+    counts = np.concatenate(chunks, axis=2)
+
+    sampled = counts[:, rows, :].astype(float)
+
+    names = MODELS[model]
+    mean = {name: sampled[c].mean(axis=1) for c, name in enumerate(names)}
+    percentiles = {
+        name: dict(zip(PERCENTILES, np.percentile(sampled[c], PERCENTILES, axis=1)))
+        for c, name in enumerate(names)
+    }
+    return Bands(grid, runs, mean, percentiles)
@@ -0,0 +1,152 @@
+"""
+    Serializers for the convert_graph payload.
+
+    * full - the original {"nodes": [...], "edges": [...]} document.
+    * stream_full - the same document, produced incrementally from a
+      generator so the full list of dicts is never materialized.
+    * columnar - node ids, labels and coordinates sent once as parallel
+      arrays, and edges as pairs of node indices.
+    * binary - the columnar payload as little-endian typed arrays that the
+      browser can wrap without parsing (see binary() for the layout).
+
+    orjson is used when it is installed, the standard json module otherwise.
+"""
+import json
+import struct
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SCALE = 1000
+BATCH = 2048
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def _node_rows(nodes, labels, x, y):
+    for i, node in enumerate(nodes):
+        yield {"id": str(node), "olabel": labels[i], "size": 10, "x": x[i], "y": y[i]}
+
+
+def _edge_rows(nodes, x, y, sources, targets):
+    for u, v in zip(sources, targets):
+        yield {
+            "source": str(nodes[u]),
+            "target": str(nodes[v]),
+            "weight": 2.5,
+            "startPoint": {"x": x[u], "y": y[u]},
+            "endPoint": {"x": x[v], "y": y[v]},
+        }
+
+
+def _json_array(rows):
+    first = True
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            encoded = dumps(batch)[1:-1]
+            yield encoded if first else ',' + encoded
+            first = False
+            batch = []
+    if batch:
+        encoded = dumps(batch)[1:-1]
+        yield encoded if first else ',' + encoded
+
+
+def full(nodes, labels, positions, sources, targets):
+    x = (positions[:, 0] * SCALE).tolist()
+    y = (positions[:, 1] * SCALE).tolist()
+    sources, targets = np.asarray(sources).tolist(), np.asarray(targets).tolist()
+    return {
+        "nodes": list(_node_rows(nodes, labels, x, y)),
+        "edges": list(_edge_rows(nodes, x, y, sources, targets)),
+    }
+
+
+def stream_full(nodes, labels, positions, sources, targets):
+    x = (positions[:, 0] * SCALE).tolist()
+    y = (positions[:, 1] * SCALE).tolist()
+    sources, targets = np.asarray(sources).tolist(), np.asarray(targets).tolist()
+    yield '{"nodes":['
+    yield from _json_array(_node_rows(nodes, labels, x, y))
+    yield '],"edges":['
+    yield from _json_array(_edge_rows(nodes, x, y, sources, targets))
+    yield ']}'
+
+
+def columnar(nodes, label_names, label_codes, positions, sources, targets):
+    return {
+        "format": "columnar",
+        "ids": [str(node) for node in nodes],
+        "labels": list(label_names),
+        "label": np.asarray(label_codes).tolist(),
+        "x": (positions[:, 0] * SCALE).tolist(),
+        "y": (positions[:, 1] * SCALE).tolist(),
+        "size": 10,
+        "weight": 2.5,
+        "source": np.asarray(sources).tolist(),
+        "target": np.asarray(targets).tolist(),
+    }
+
+
+def binary(nodes, label_names, label_codes, positions, sources, targets):
+    """Typed-array payload.
+
+    uint32 header length, then the UTF-8 JSON header padded to 8 bytes,
+    then the arrays back to back, each starting on an 8 byte boundary:
+
+        ids     int64[N]
+        x, y    float32[N] each
+        label   int8[N]      index into header['labels'], -1 if none
+        source  uint32[M]
+        target  uint32[M]
+
+    header['arrays'] lists [name, dtype, byte offset, length] for each.
+    """
+    n, m = len(nodes), len(sources)
+    arrays = [
+        ('ids', np.asarray(nodes, dtype='<i8')),
+        ('x', (positions[:, 0] * SCALE).astype('<f4')),
+        ('y', (positions[:, 1] * SCALE).astype('<f4')),
+        ('label', np.asarray(label_codes, dtype='i1')),
+        ('source', np.asarray(sources, dtype='<u4')),
+        ('target', np.asarray(targets, dtype='<u4')),
+    ]
+
+    def pad(size):
+        return (-size) % 8
+
+    relative = []
+    offset = 0
+    for name, array in arrays:
+        relative.append((name, array.dtype.str, offset, len(array)))
+        offset += array.nbytes + pad(array.nbytes)
+
+    # The offsets depend on the header length and vice versa; grow the
+    # data start until the header fits in front of it.
+    header = {'nodes': n, 'edges': m, 'labels': list(label_names), 'size': 10, 'weight': 2.5}
+    start = 0
+    while True:
+        header['arrays'] = [[name, dtype, start + rel, length] for name, dtype, rel, length in relative]
+        encoded = json.dumps(header).encode()
+        needed = 4 + len(encoded)
+        needed += pad(needed)
+        if needed <= start:
+            break
+        start = needed
+    encoded += b' ' * (start - 4 - len(encoded))
+
+    chunks = [struct.pack('<I', len(encoded)), encoded]
+    for name, array in arrays:
+        chunks.append(array.tobytes())
+        chunks.append(b'\0' * pad(array.nbytes))
+    return b''.join(chunks)
@@ -0,0 +1,354 @@
+"""
+    Process-wide graph store.
+
+    The network is parsed from the Excel files once per worker and shared by
+    every request. The graph handed out is frozen, so views cannot change it
+    by accident. It is only rebuilt when the source files change on disk.
+
+    When a binary snapshot compiled from the same sources exists (see
+    snapshot.py and the build_snapshot command) the Excel files are not
+    parsed at all. The array-based analyses read the memory-mapped
+    snapshot directly (backend.current()), and the DiGraph is only built
+    from it when get() is first called, by an algorithm that still needs
+    networkx or by an edit.
+
+    Edits (adding or removing nodes and edges, setting labels) go through
+    GraphStore.edit(). Each one produces a new frozen graph and a new
+    version, derived from the previous version and the edit. Edits are
+    appended to data/edits.jsonl, which every worker replays on its next
+    access, and reapplied on top of the Excel data after a restart. When
+    the Excel files change, the edits made on the old data are dropped.
+
+    Callables in GraphStore.listeners are told about every change, so
+    derived state can be updated instead of rebuilt (see aggregates.py).
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+from . import instrumentation, snapshot as snapshot_format
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+EDGES_PATH = os.path.join(DATA_DIR, 'edges.xlsx')
+NODES_PATH = os.path.join(DATA_DIR, 'nodes.xlsx')
+EDITS_PATH = os.path.join(DATA_DIR, 'edits.jsonl')
+
+EDIT_OPS = ('add_edges', 'remove_edges', 'add_nodes', 'remove_nodes', 'set_labels')
+# Label codes are int8 in snapshots and in the binary graph payload.
+MAX_LABELS = 127
+
+# Nodes whose degree, label or existence may have changed, and the
+# (source, target) pairs that were added or removed.
+Change = namedtuple('Change', ['nodes', 'edges'])
+
+
+def build_graph(edges_path=EDGES_PATH, nodes_path=NODES_PATH):
+    import networkx as nx
+    import pandas as pd
+
+    data = pd.read_excel(edges_path)
+    G = nx.from_pandas_edgelist(data, 'sourceNodeId', 'targetNodeId', create_using=nx.DiGraph())
+
+    labels_df = pd.read_excel(nodes_path)
+    labels_dict = labels_df.set_index('NodeId')['Labels'].to_dict()
+    nx.set_node_attributes(G, labels_dict, 'label')
+    return G
+
+
+def _check_labels(G, labels):
+    new = {label for label in labels if label is not None}
+    if not new:
+        return
+    existing = {label for _, label in G.nodes(data='label') if label is not None}
+    if len(existing | new) > MAX_LABELS:
+        raise ValueError('a graph can have at most {} distinct labels'.format(MAX_LABELS))
+
+
+def apply_edit(G, edit):
+    """Apply one edit to the mutable graph G in place and return the Change.
+
+    Everything is validated before G is touched; an invalid edit raises
+    ValueError and leaves G as it was.
+    """
+    op = edit['op']
+    if op in ('add_edges', 'remove_edges'):
+        edges = list(dict.fromkeys((u, v) for u, v in edit['edges']))
+        if op == 'add_edges':
+            edges = [(u, v) for u, v in edges if not G.has_edge(u, v)]
+            G.add_edges_from(edges)
+        else:
+            missing = [(u, v) for u, v in edges if not G.has_edge(u, v)]
+            if missing:
+                raise ValueError('no edge {} -> {}'.format(*missing[0]))
+            G.remove_edges_from(edges)
+        return Change({node for edge in edges for node in edge}, set(edges))
+
+    if op == 'add_nodes':
+        nodes = [(node['id'], node.get('label')) for node in edit['nodes']]
+        existing = [node for node, _ in nodes if node in G]
+        if existing:
+            raise ValueError('node {} already exists'.format(existing[0]))
+        _check_labels(G, [label for _, label in nodes])
+        for node, label in nodes:
+            G.add_node(node) if label is None else G.add_node(node, label=label)
+        return Change({node for node, _ in nodes}, set())
+
+    if op == 'remove_nodes':
+        nodes = list(dict.fromkeys(edit['nodes']))
+        missing = [node for node in nodes if node not in G]
+        if missing:
+            raise ValueError('no node {}'.format(missing[0]))
+        edges = {edge for node in nodes for edge in list(G.in_edges(node)) + list(G.out_edges(node))}
+        G.remove_nodes_from(nodes)
+        return Change({node for edge in edges for node in edge} | set(nodes), edges)
+
+    if op == 'set_labels':
+        labels = [(node['id'], node['label']) for node in edit['labels']]
+        missing = [node for node, _ in labels if node not in G]
+        if missing:
+            raise ValueError('no node {}'.format(missing[0]))
+        _check_labels(G, [label for _, label in labels])
+        for node, label in labels:
+            G.nodes[node]['label'] = label
+        return Change({node for node, _ in labels}, set())
+
+    raise ValueError('op must be one of {}'.format(', '.join(EDIT_OPS)))
+
+
+def merge_changes(changes):
+    nodes, edges = set(), set()
+    for change in changes:
+        nodes |= change.nodes
+        edges |= change.edges
+    return Change(nodes, edges)
+
+
+def next_version(version, edit):
+    payload = json.dumps(edit, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1('{}:{}'.format(version, payload).encode()).hexdigest()[:16]
+
+
+class GraphStore:
+    """Holds one frozen graph and reloads it when the dataset changes.
+
+    Every access compares the mtime and size of the source files with the
+    ones seen at the last load. When they differ the files are hashed, and
+    the graph is only rebuilt if the content hash changed too, so touching
+    a file without editing it is cheap.
+    """
+
+    def __init__(self, edges_path=EDGES_PATH, nodes_path=NODES_PATH, snapshot_dir=snapshot_format.SNAPSHOT_DIR,
+                 edits_path=EDITS_PATH):
+        self.edges_path = edges_path
+        self.nodes_path = nodes_path
+        self.snapshot_dir = snapshot_dir
+        self.edits_path = edits_path
+        self.snapshot = None
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._graph = None
+        self._stat = None
+        self._version = None
+        # Content hash of the sources, and how far the edit log was read.
+        self._base = None
+        self._edits_stat = None
+        self._edits_offset = 0
+        self._edits_inode = None
+
+    def _source_paths(self):
+        return (self.edges_path, self.nodes_path)
+
+    def _stat_sources(self):
+        stats = []
+        for path in self._source_paths():
+            st = os.stat(path)
+            stats.append((st.st_mtime_ns, st.st_size))
+        return tuple(stats)
+
+    def hash_sources(self):
+        digest = hashlib.sha1()
+        for path in self._source_paths():
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    def _load(self, version):
+        """The graph built from the sources, or None when the snapshot matches them.
+
+        In that case the DiGraph is only built from the snapshot when
+        something asks for it (see _materialize).
+        """
+        snapshot = snapshot_format.load_snapshot(self.snapshot_dir)
+        if snapshot is not None and snapshot.source_version == version:
+            self.snapshot = snapshot
+            return None
+        import networkx as nx
+
+        self.snapshot = None
+        return nx.freeze(build_graph(self.edges_path, self.nodes_path))
+
+    def _materialize(self):
+        """The current graph, built from the snapshot on first use. Must hold self._lock."""
+        if self._graph is None:
+            import networkx as nx
+
+            with instrumentation.phase('load.networkx'):
+                self._graph = nx.freeze(snapshot_format.to_networkx(self.snapshot))
+        return self._graph
+
+    def compile_snapshot(self):
+        """Compile the current sources into the binary snapshot directory."""
+        return snapshot_format.compile_snapshot(
+            self.edges_path, self.nodes_path, self.hash_sources(), self.snapshot_dir)
+
+    def _stat_edits(self):
+        try:
+            st = os.stat(self.edits_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def refresh(self):
+        """Pick up changes to the source files and the edit log."""
+        stat = self._stat_sources()
+        edits_stat = self._stat_edits()
+        if self._version is not None and stat == self._stat and edits_stat == self._edits_stat:
+            return
+        with self._lock, instrumentation.phase('load'):
+            if self._version is None or stat != self._stat:
+                base = self.hash_sources()
+                if self._version is None or base != self._base:
+                    self._graph = self._load(base)
+                    self._version = self._base = base
+                    self._edits_offset = 0
+                self._stat = stat
+            if edits_stat != self._edits_stat:
+                with open(self.edits_path, 'a+') as f:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                    self._check_log(f)
+                    self._replay(f)
+
+    def get(self):
+        """The current frozen DiGraph."""
+        self.refresh()
+        graph = self._graph
+        if graph is not None:
+            return graph
+        with self._lock:
+            return self._materialize()
+
+    def _check_log(self, f):
+        """Read the log from the start again if it was truncated or replaced since the last read."""
+        st = os.fstat(f.fileno())
+        if self._edits_offset > st.st_size or st.st_ino != self._edits_inode:
+            self._edits_offset = 0
+        self._edits_inode = st.st_ino
+
+    def _read_edits(self, f):
+        """Edits appended to the log since the last read, for the current base."""
+        f.seek(self._edits_offset)
+        edits = []
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            self._edits_offset += len(line.encode())
+            entry = json.loads(line)
+            if entry.pop('base') == self._base:
+                edits.append(entry)
+        self._edits_stat = self._stat_edits()
+        return edits
+
+    def _replay(self, f, edit=None):
+        """Apply the unread edits of the log, then `edit`, as one new graph.
+
+        Must hold self._lock and a lock on the log file f. Returns the
+        change made by `edit`. If `edit` is invalid, the edits from the log
+        are still applied before the ValueError propagates.
+        """
+        edits = self._read_edits(f)
+        if not edits and edit is None:
+            return None
+        G = self._materialize().copy()
+        changes = [apply_edit(G, entry) for entry in edits]
+        version = edits[-1]['version'] if edits else self._version
+        change = None
+        try:
+            if edit is not None:
+                change = apply_edit(G, edit)
+                changes.append(change)
+                version = next_version(version, edit)
+                f.seek(0, os.SEEK_END)
+                line = json.dumps(dict(edit, base=self._base, version=version), separators=(',', ':')) + '\n'
+                f.write(line)
+                f.flush()
+                self._edits_offset += len(line.encode())
+                self._edits_stat = self._stat_edits()
+        finally:
+            if changes:
+                self._publish(G, version, merge_changes(changes))
+        return change
+
+    def _publish(self, G, version, change):
+        import networkx as nx
+
+        old_graph, old_version = self._graph, self._version
+        self._graph = nx.freeze(G)
+        self._version = version
+        for listener in self.listeners:
+            listener(old_graph, old_version, self._graph, version, change)
+
+    def edit(self, edit):
+        """Apply one edit (see apply_edit), log it and return (version, Change)."""
+        self.refresh()
+        with self._lock, open(self.edits_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._check_log(f)
+            # Edits logged by other workers come first.
+            change = self._replay(f, edit)
+            return self._version, change
+
+    def get_versioned(self):
+        """The current graph together with the version it was built from."""
+        self.refresh()
+        with self._lock:
+            return self._materialize(), self._version
+
+    @property
+    def version(self):
+        """Content hash of the dataset the current graph was built from."""
+        self.refresh()
+        return self._version
+
+    def clear(self):
+        with self._lock:
+            self._graph = None
+            self._stat = None
+            self._version = None
+            self._base = None
+            self._edits_stat = None
+            self._edits_offset = 0
+            self._edits_inode = None
+            self.snapshot = None
+
+
+store = GraphStore()
+
+
+def get_graph():
+    return store.get()
+
+
+def get_versioned_graph():
+    return store.get_versioned()
+
+
+def graph_version():
+    return store.version
+
+
+def edit_graph(edit):
+    return store.edit(edit)
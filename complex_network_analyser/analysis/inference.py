@@ -0,0 +1,109 @@
+"""
+    Label inference for the nodes labelled 'Unknown'.
+
+    Label propagation (Zhu & Ghahramani) as sparse matrix iterations over
+    the undirected adjacency W. F has one column per known label; the rows
+    of labelled nodes are clamped to their one-hot label, and every
+    iteration replaces the rows of the unknown nodes by the mean of their
+    neighbours' rows,
+
+        F[unknown] = (D^-1 W F)[unknown]
+
+    until no value moves by more than TOLERANCE. The predicted label is
+    the largest entry of a row and its share of the row the confidence.
+    Unknown nodes that no labelled node reaches get no prediction.
+
+    Results are cached per graph version. After labels or edges change,
+    the previous F is the starting point of the next run, so only the rows
+    near the change have to move again.
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+from scipy import sparse as sp
+
+from . import graph_store, instrumentation, labels, sparse
+
+UNKNOWN = 'Unknown'
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 1000
+
+# unknown holds node positions; label indexes into labels (-1 when no
+# labelled node is reachable), one entry per unknown node.
+Prediction = namedtuple('Prediction', ['nodes', 'unknown', 'labels', 'label', 'confidence', 'iterations'])
+
+
+def propagate(view, label_index, initial=None, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """(Prediction, F). `initial` optionally gives starting rows for all nodes."""
+    n = len(view)
+    names = [label for label in label_index.labels if label != UNKNOWN]
+    column_of = np.array([names.index(label) if label != UNKNOWN else -1 for label in label_index.labels],
+                         dtype=np.int64)
+    codes = label_index.codes
+    column = np.full(n, -1, dtype=np.int64)
+    column[codes >= 0] = column_of[codes[codes >= 0]]
+    known = column >= 0
+    unknown = np.flatnonzero(~known)
+
+    F = np.zeros((n, len(names)))
+    F[known, column[known]] = 1.0
+    if initial is not None:
+        F[unknown] = initial[unknown]
+
+    W = (view.A + view.A.T).astype(float).tocsr()
+    degree = np.asarray(W.sum(axis=1)).ravel()
+    scale = np.divide(1.0, degree, out=np.zeros(n), where=degree > 0)
+    rows = sp.diags(scale[unknown]) @ W[unknown]
+
+    iterations = 0
+    while len(unknown) and iterations < max_iterations:
+        iterations += 1
+        updated = rows @ F
+        delta = np.abs(updated - F[unknown]).max()
+        F[unknown] = updated
+        if delta < tolerance:
+            break
+
+    scores = F[unknown]
+    total = scores.sum(axis=1)
+    label = np.where(total > 0, scores.argmax(axis=1) if len(names) else -1, -1)
+    confidence = np.divide(scores.max(axis=1) if len(names) else total, total,
+                           out=np.zeros(len(unknown)), where=total > 0)
+    return Prediction(view.nodes, unknown, names, label, confidence, iterations), F
+
+
+def _warm_rows(nodes, previous):
+    old_nodes, old_F = previous[:2]
+    old = {node: i for i, node in enumerate(old_nodes)}
+    initial = np.zeros((len(nodes), old_F.shape[1]))
+    for i, node in enumerate(nodes):
+        j = old.get(node)
+        if j is not None:
+            initial[i] = old_F[j]
+    return initial
+
+
+_lock = threading.Lock()
+_cache = {'version': None, 'prediction': None, 'previous': None}
+
+
+def predictions():
+    """Prediction for the current graph."""
+    version = graph_store.graph_version()
+    with _lock:
+        if _cache['version'] == version:
+            return _cache['prediction']
+        previous = _cache['previous']
+    view = sparse.adjacency()
+    label_index = labels.label_index()
+    initial = None
+    names = [label for label in label_index.labels if label != UNKNOWN]
+    # A warm start only makes sense over the same label columns.
+    if previous is not None and previous[2] == names:
+        initial = _warm_rows(view.nodes, previous)
+    with instrumentation.phase('inference.label_propagation'):
+        prediction, F = propagate(view, label_index, initial)
+    with _lock:
+        _cache.update(version=version, prediction=prediction, previous=(view.nodes, F, names))
+    return prediction
@@ -0,0 +1,262 @@
+"""
+    Request instrumentation: phase timings, metrics and profiling.
+
+    MetricsMiddleware opens a record for every request. Code on the hot
+    path wraps its expensive parts in phase(name), e.g. 'load' (reading
+    or replaying the graph), 'sparse', 'centrality.<measure>', and the
+    middleware adds 'serialization' (rendering the response body). Phases
+    nest and are inclusive: the 'load' inside a 'centrality.closeness'
+    counts towards both. When the request is done the record is written
+    as one JSON line to the 'analysis.requests' logger:
+
+        {"method": "GET", "route": "api/v1/top_nodes/<str:measure>/", "status": 200,
+         "seconds": 0.41, "phases": {"load": 0.02, ...}, "cache": "MISS",
+         "max_rss_kb": 512000, "rss_growth_kb": 20480}
+
+    and added to in-memory counters that prometheus_text() renders for
+    /metrics. The counters are per process, like the caches; every worker
+    reports its own.
+
+    instrumented(endpoint) goes between @api_view and the rest of the
+    decorators of a view. With ?profile=1, and settings.ANALYSIS_PROFILE
+    on, it runs the view (bypassing the result cache) under cProfile and
+    tracemalloc and answers with the profile summary instead of the result.
+"""
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger('analysis.requests')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+PROFILE_ROWS = 40
+
+_current = contextvars.ContextVar('analysis_request', default=None)
+_lock = threading.Lock()
+_profile_lock = threading.Lock()
+_requests = Counter()
+_durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1) + [0.0])
+_phases = defaultdict(lambda: [0, 0.0])
+_cache = Counter()
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time the block as phase `name` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def record_phase(name, seconds):
+    record = _current.get()
+    if record is not None:
+        record['phases'][name] = record['phases'].get(name, 0.0) + seconds
+    with _lock:
+        totals = _phases[name]
+        totals[0] += 1
+        totals[1] += seconds
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unmatched'
+    return match.route
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        record = {'phases': {}, 'max_rss_kb': _max_rss_kb()}
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, record, time.perf_counter() - start)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before the response is rendered (still inside
+        # __call__); the callback runs right after.
+        start = time.perf_counter()
+
+        def rendered(response):
+            record_phase('serialization', time.perf_counter() - start)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def _finish(self, request, response, record, seconds):
+        route = _route(request)
+        cache = response.get('X-Cache')
+        max_rss_kb = _max_rss_kb()
+        with _lock:
+            _requests[(route, request.method, response.status_code)] += 1
+            histogram = _durations[route]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(DURATION_BUCKETS)] += 1
+            histogram[-1] += seconds
+            if cache:
+                _cache[(route, cache.lower())] += 1
+        line = {
+            'method': request.method,
+            'path': request.path_info,
+            'route': route,
+            'view': record.get('view'),
+            'status': response.status_code,
+            'seconds': round(seconds, 6),
+            'phases': {name: round(value, 6) for name, value in record['phases'].items()},
+            'cache': cache,
+            'max_rss_kb': max_rss_kb,
+            'rss_growth_kb': max_rss_kb - record['max_rss_kb'],
+        }
+        logger.info(json.dumps(line))
+
+
+def profiling(request):
+    """Whether the request asks for, and may get, a profile instead of a result."""
+    return getattr(settings, 'ANALYSIS_PROFILE', False) and request.GET.get('profile') == '1'
+
+
+def _profile(endpoint, view, request, args, kwargs):
+    record = _current.get()
+    phases_before = dict(record['phases']) if record is not None else {}
+    profiler = cProfile.Profile()
+    # tracemalloc is process wide, so profile one request at a time.
+    with _profile_lock:
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            response = profiler.runcall(view, request, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative').print_stats(PROFILE_ROWS)
+    phases = record['phases'] if record is not None else {}
+    return Response({
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'seconds': round(seconds, 6),
+        'peak_bytes': peak_bytes,
+        'phases': {name: round(value - phases_before.get(name, 0.0), 6)
+                   for name, value in phases.items() if value != phases_before.get(name)},
+        'profile': out.getvalue(),
+    }, status=status.HTTP_200_OK)
+
+
+def instrumented(endpoint):
+    """Name the request after the view, time it as phase 'view' and serve ?profile=1.
+
+        @api_view(['GET'])
+        @instrumentation.instrumented('top_nodes')
+        @jobs.asynchronous('top_nodes')
+        @result_cache.cached('top_nodes')
+        def top_nodes(request, measure): ...
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            record = _current.get()
+            if record is not None:
+                record['view'] = endpoint
+            if profiling(request):
+                return _profile(endpoint, view, request, args, kwargs)
+            with phase('view'):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('{}="{}"'.format(key, escape(value)) for key, value in labels.items()) + '}'
+
+
+def prometheus_text():
+    """The counters of this process in the Prometheus text exposition format."""
+    with _lock:
+        requests = sorted(_requests.items())
+        durations = sorted((route, list(values)) for route, values in _durations.items())
+        phases = sorted((name, list(values)) for name, values in _phases.items())
+        cache = sorted(_cache.items())
+
+    lines = [
+        '# HELP analysis_requests_total Requests handled, by route, method and status code.',
+        '# TYPE analysis_requests_total counter',
+    ]
+    for (route, method, code), count in requests:
+        lines.append('analysis_requests_total{} {}'.format(_labels(route=route, method=method, status=code), count))
+
+    lines += [
+        '# HELP analysis_request_duration_seconds Time spent handling requests, by route.',
+        '# TYPE analysis_request_duration_seconds histogram',
+    ]
+    for route, values in durations:
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + ('+Inf',), values):
+            cumulative += count
+            lines.append('analysis_request_duration_seconds_bucket{} {}'.format(
+                _labels(route=route, le=bound), cumulative))
+        lines.append('analysis_request_duration_seconds_sum{} {}'.format(_labels(route=route), values[-1]))
+        lines.append('analysis_request_duration_seconds_count{} {}'.format(_labels(route=route), cumulative))
+
+    lines += [
+        '# HELP analysis_phase_duration_seconds Time spent in each phase of request handling.',
+        '# TYPE analysis_phase_duration_seconds summary',
+    ]
+    for name, (count, seconds) in phases:
+        lines.append('analysis_phase_duration_seconds_sum{} {}'.format(_labels(phase=name), seconds))
+        lines.append('analysis_phase_duration_seconds_count{} {}'.format(_labels(phase=name), count))
+
+    lines += [
+        '# HELP analysis_result_cache_requests_total Result cache outcomes (hit, miss, coalesced), by route.',
+        '# TYPE analysis_result_cache_requests_total counter',
+    ]
+    for (route, outcome), count in cache:
+        lines.append('analysis_result_cache_requests_total{} {}'.format(
+            _labels(route=route, outcome=outcome), count))
+
+    lines += [
+        '# HELP analysis_process_max_rss_bytes Peak resident set size of this process.',
+        '# TYPE analysis_process_max_rss_bytes gauge',
+        'analysis_process_max_rss_bytes {}'.format(_max_rss_kb() * 1024),
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,216 @@
+"""
+    Background jobs for the heavy analysis endpoints.
+
+    A view wrapped in asynchronous() answers ?async=1 at once with 202 and
+    a job id instead of computing the result. The job is a Job row in the
+    default (sqlite) database and runs in a bounded process pool of
+    settings.ANALYSIS_JOB_WORKERS processes. The worker calls the same view
+    with the same query minus async and stores the response data on the
+    row, where /jobs/<id>/ picks it up. The worker has a result cache of
+    its own (unless ANALYSIS_CACHE_DIR makes it shared), so the result is
+    also handed back to the submitting process, which puts it in its
+    cache: a plain request for the same thing afterwards is a hit.
+
+    A submission with the same endpoint, parameters, graph version and
+    cache generation as a job that is still queued or running gets that
+    job back. A job whose row has not changed for settings.ANALYSIS_JOB_TIMEOUT
+    seconds is considered lost (e.g. the server was restarted) and no
+    longer absorbs new submissions. Rows that have not changed for
+    settings.ANALYSIS_JOB_TTL seconds (finished or lost jobs) are deleted on
+    the next submission, or by the expire_jobs command.
+
+    Long computations call report_progress(done, total); outside a job it
+    does nothing.
+"""
+import functools
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from . import result_cache
+from .models import Job
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 3600
+DEFAULT_TTL = 7 * 24 * 3600
+
+_lock = threading.Lock()
+_submit_lock = threading.Lock()
+_pool = None
+_current = {'job': None, 'progress': 0}
+
+
+def _timeout():
+    return getattr(settings, 'ANALYSIS_JOB_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _init_worker():
+    # A forked worker must open its own database connections instead of
+    # using the copies of the parent's.
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+
+
+def _ttl():
+    return getattr(settings, 'ANALYSIS_JOB_TTL', DEFAULT_TTL)
+
+
+def expire():
+    """Delete the jobs that are finished or lost and older than the TTL; returns how many."""
+    # A live job updates its row at least every timeout seconds.
+    cutoff = timezone.now() - timedelta(seconds=max(_ttl(), _timeout()))
+    deleted, _ = Job.objects.filter(updated__lt=cutoff).delete()
+    return deleted
+
+
+def _get_pool(reset=False):
+    global _pool
+    with _lock:
+        if reset and _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            workers = max(1, getattr(settings, 'ANALYSIS_JOB_WORKERS', DEFAULT_WORKERS))
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        return _pool
+
+
+def job_key(endpoint, request, kwargs):
+    return hashlib.sha1(result_cache.cache_key(endpoint, request, kwargs).encode()).hexdigest()
+
+
+def _finish(job_id, job_status, result=None, error=''):
+    Job.objects.filter(pk=job_id).update(
+        status=job_status,
+        progress=100 if job_status == Job.DONE else _current['progress'],
+        result=result,
+        error=error,
+        updated=timezone.now(),
+    )
+
+
+def _job_done(job_id, endpoint, future):
+    error = future.exception()
+    if error is not None:
+        # Only reached when the worker process itself died.
+        Job.objects.filter(pk=job_id, status__in=[Job.QUEUED, Job.RUNNING]).update(
+            status=Job.FAILED, error=repr(error), updated=timezone.now())
+        connections.close_all()
+        return
+    result = future.result()
+    if result is not None:
+        key, data = result
+        result_cache.store(endpoint, key, data)
+
+
+def submit(endpoint, request, kwargs):
+    """(job, created) for the request; an identical live job is reused."""
+    key = job_key(endpoint, request, kwargs)
+    query = request.query_params.copy()
+    query.pop('async', None)
+    alive_since = timezone.now() - timedelta(seconds=_timeout())
+    expire()
+    with _submit_lock, transaction.atomic():
+        job = Job.objects.filter(key=key, status__in=[Job.QUEUED, Job.RUNNING], updated__gte=alive_since).first()
+        if job is not None:
+            return job, False
+        job = Job.objects.create(key=key, endpoint=endpoint, path=request.path_info, query=query.urlencode())
+
+    try:
+        future = _get_pool().submit(run, job.id)
+    except BrokenProcessPool:
+        future = _get_pool(reset=True).submit(run, job.id)
+    future.add_done_callback(functools.partial(_job_done, job.id, endpoint))
+    return job, True
+
+
+def run(job_id):
+    """Execute a job. Runs inside a pool worker.
+
+    Returns (cache key, response data) when the view succeeded, else None.
+    """
+    job = Job.objects.get(pk=job_id)
+    Job.objects.filter(pk=job_id).update(status=Job.RUNNING, updated=timezone.now())
+    _current.update(job=job_id, progress=0)
+    try:
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = request.path_info = job.path
+        request.GET = QueryDict(job.query)
+        request.META.update(SERVER_NAME='localhost', SERVER_PORT='80')
+        match = resolve(job.path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if not isinstance(response, Response):
+            _finish(job_id, Job.FAILED, error='{} does not return JSON for these parameters'.format(job.endpoint))
+        elif response.status_code != status.HTTP_200_OK:
+            _finish(job_id, Job.FAILED, result=response.data, error='HTTP {}'.format(response.status_code))
+        else:
+            _finish(job_id, Job.DONE, result=response.data)
+            return result_cache.cache_key(job.endpoint, Request(request), match.kwargs), response.data
+    except Exception as e:
+        _finish(job_id, Job.FAILED, error=repr(e))
+    finally:
+        _current.update(job=None, progress=0)
+
+
+def report_progress(done, total):
+    """Record that `done` of `total` units of the current job are finished."""
+    job_id = _current['job']
+    if job_id is None or total <= 0:
+        return
+    percent = min(99, int(100 * done / total))
+    if percent > _current['progress']:
+        _current['progress'] = percent
+        Job.objects.filter(pk=job_id).update(progress=percent, updated=timezone.now())
+
+
+def describe(job, request=None):
+    data = {
+        'id': str(job.id),
+        'endpoint': job.endpoint,
+        'status': job.status,
+        'progress': job.progress,
+        'created': job.created.isoformat(),
+        'updated': job.updated.isoformat(),
+    }
+    if request is not None:
+        data['url'] = request.build_absolute_uri(reverse('get the status and result of a job', args=[job.id]))
+    if job.status in (Job.DONE, Job.FAILED):
+        data['result'] = job.result
+    if job.status == Job.FAILED:
+        data['error'] = job.error
+    return data
+
+
+def asynchronous(endpoint):
+    """Give a DRF function view an ?async=1 mode.
+
+    Goes between @api_view and @result_cache.cached:
+
+        @api_view(['GET'])
+        @jobs.asynchronous('community_weight')
+        @result_cache.cached('community_weight')
+        def community_weight(request): ...
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.query_params.get('async') != '1':
+                return view(request, *args, **kwargs)
+            job, created = submit(endpoint, request, kwargs)
+            response = Response(describe(job, request), status=status.HTTP_202_ACCEPTED)
+            response['Location'] = response.data['url']
+            return response
+        return wrapper
+    return decorator
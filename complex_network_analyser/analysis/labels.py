@@ -0,0 +1,53 @@
+"""
+    Per-label index over the loaded graph.
+
+    Built once per graph version from the label codes of the current
+    backend.CompactGraph (-1 when a node has no label): for every label,
+    the sorted array of its member positions. The per-label statistics
+    of the label_* endpoints are kept up to date in aggregates.py.
+"""
+import threading
+
+import numpy as np
+
+from . import backend, graph_store
+
+
+class LabelIndex:
+
+    def __init__(self, nodes, codes, labels):
+        self.nodes = nodes
+        self.labels = list(labels)
+        self.codes = np.asarray(codes, dtype=np.int64)
+
+        order = np.argsort(self.codes, kind='stable')
+        self.counts = np.bincount(self.codes[self.codes >= 0], minlength=len(self.labels))
+        bounds = np.concatenate([[0], np.cumsum(self.counts)]) + int((self.codes < 0).sum())
+        self.members = {label: order[bounds[i]:bounds[i + 1]] for i, label in enumerate(self.labels)}
+
+    @classmethod
+    def from_graph(cls, G, nodes):
+        attrs = G.nodes
+        raw = [attrs[node].get('label') for node in nodes]
+        labels = sorted({label for label in raw if label is not None})
+        code_of = {label: i for i, label in enumerate(labels)}
+        return cls(nodes, [code_of.get(label, -1) for label in raw], labels)
+
+    def member_ids(self, label):
+        return [self.nodes[i] for i in self.members.get(label, np.array([], dtype=np.int64)).tolist()]
+
+
+_lock = threading.Lock()
+_cache = {'version': None, 'index': None}
+
+
+def label_index():
+    version = graph_store.graph_version()
+    with _lock:
+        if _cache['version'] == version and _cache['index'] is not None:
+            return _cache['index']
+    graph = backend.current()
+    index = LabelIndex(graph.nodes, graph.label_codes, graph.labels)
+    with _lock:
+        _cache.update(version=version, index=index)
+    return index
@@ -0,0 +1,185 @@
+"""
+    Layout engine for convert_graph.
+
+    Positions are computed once per (algorithm, graph version) with a fixed
+    seed, kept in memory and persisted under data/layouts/, so every
+    request and every worker sees the same stable picture. When the graph
+    changes, the previous positions are used as the starting point: known
+    nodes keep their place and only need a few refinement iterations.
+
+    Algorithms:
+
+    * 'spring' - nx.spring_layout (Fruchterman-Reingold), the original
+      behaviour.
+    * 'forceatlas2' - a sparse ForceAtlas2-style layout. Attraction runs
+      along the edges of the CSR adjacency, and repulsion is approximated
+      Barnes-Hut style through the centres of mass of a uniform grid. Each
+      iteration costs O(M + N * cells) instead of O(N^2).
+"""
+import os
+import tempfile
+import threading
+import zipfile
+
+import numpy as np
+
+from . import backend, graph_store, instrumentation, sparse
+
+LAYOUT_DIR = os.path.join(graph_store.DATA_DIR, 'layouts')
+ALGORITHMS = ('spring', 'forceatlas2')
+SEED = 42
+
+# Iterations for a layout from scratch and for a warm start.
+ITERATIONS = {'spring': (50, 15), 'forceatlas2': (100, 30)}
+
+_lock = threading.Lock()
+_layouts = {}
+
+
+def _path(algorithm):
+    return os.path.join(LAYOUT_DIR, '{}.npz'.format(algorithm))
+
+
+def _load(algorithm):
+    try:
+        with np.load(_path(algorithm)) as data:
+            return str(data['version']), data['node_ids'], data['positions']
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _save(algorithm, version, nodes, positions):
+    os.makedirs(LAYOUT_DIR, exist_ok=True)
+    # A temporary file of its own per writer, so concurrent saves cannot mix.
+    with tempfile.NamedTemporaryFile(dir=LAYOUT_DIR, suffix='.npz', delete=False) as f:
+        try:
+            np.savez(f, version=version, node_ids=np.asarray(nodes), positions=positions)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, _path(algorithm))
+
+
+def _warm_start(view, previous_ids, previous_positions, rng):
+    """Initial positions for view.nodes from an older layout.
+
+    Nodes that existed keep their position. New nodes are placed next to
+    an already placed neighbour when they have one, at random otherwise.
+    """
+    old = {node: i for i, node in enumerate(previous_ids.tolist())}
+    n = len(view)
+    positions = rng.uniform(-1, 1, size=(n, 2))
+    known = np.zeros(n, dtype=bool)
+    for i, node in enumerate(view.nodes):
+        j = old.get(node)
+        if j is not None:
+            positions[i] = previous_positions[j]
+            known[i] = True
+    for i in np.flatnonzero(~known).tolist():
+        neighbours = view.neighbors[view.offsets[i]:view.offsets[i + 1]]
+        placed = neighbours[known[neighbours]]
+        if len(placed):
+            positions[i] = positions[placed[0]] + rng.normal(scale=0.01, size=2)
+    return positions, int(known.sum())
+
+
+def spring(view, initial, iterations):
+    import networkx as nx
+
+    pos = None
+    if initial is not None:
+        pos = {node: initial[i] for i, node in enumerate(view.nodes)}
+    result = nx.spring_layout(backend.networkx().graph, pos=pos, iterations=iterations, seed=SEED)
+    return np.array([result[node] for node in view.nodes])
+
+
+def forceatlas2(view, initial, iterations, grid_size=16, repulsion=1.0, gravity=1.0):
+    n = len(view)
+    rng = np.random.default_rng(SEED)
+    pos = initial.copy() if initial is not None else rng.uniform(-1, 1, size=(n, 2))
+    if n < 2:
+        return pos
+
+    sources = np.repeat(np.arange(n), view.out_degree)
+    targets = view.neighbors
+    mass = (view.degree + 1).astype(float)
+    # Repulsion per unit of mass, so the total does not grow with the graph.
+    repulsion = repulsion / mass.sum()
+    temperature = 0.1 * np.abs(pos).max()
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        # Repulsion from the centres of mass of a grid over the bounding box.
+        low = pos.min(axis=0)
+        extent = np.maximum(pos.max(axis=0) - low, 1e-9)
+        cell_xy = np.minimum((((pos - low) / extent) * grid_size).astype(int), grid_size - 1)
+        cell = cell_xy[:, 0] * grid_size + cell_xy[:, 1]
+        cell_mass = np.bincount(cell, weights=mass, minlength=grid_size ** 2)
+        occupied = np.flatnonzero(cell_mass)
+        centre = np.column_stack([
+            np.bincount(cell, weights=mass * pos[:, 0], minlength=grid_size ** 2),
+            np.bincount(cell, weights=mass * pos[:, 1], minlength=grid_size ** 2),
+        ])[occupied] / cell_mass[occupied, None]
+
+        force = np.zeros_like(pos)
+        for start in range(0, n, 4096):
+            chunk = slice(start, min(start + 4096, n))
+            delta = pos[chunk, None, :] - centre[None, :, :]
+            dist_sq = np.maximum((delta ** 2).sum(axis=2), 1e-4)
+            weight = repulsion * mass[chunk, None] * cell_mass[occupied][None, :] / dist_sq
+            force[chunk] = (delta * weight[:, :, None]).sum(axis=1)
+
+        # Linear attraction along the edges, pulling both endpoints.
+        pull = pos[targets] - pos[sources]
+        np.add.at(force, sources, pull)
+        np.add.at(force, targets, -pull)
+
+        # Gravity keeps disconnected components on screen.
+        force -= gravity * mass[:, None] * pos
+
+        # Move along the force per unit of mass, capped by the temperature.
+        displacement = force / mass[:, None]
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 1e-12)
+        pos = pos + displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    # Same framing as nx.spring_layout: centred, largest coordinate 1.
+    pos = pos - pos.mean(axis=0)
+    limit = np.abs(pos).max()
+    return pos / limit if limit > 0 else pos
+
+
+ENGINES = {'spring': spring, 'forceatlas2': forceatlas2}
+
+
+def positions(algorithm='spring'):
+    """(node list, N x 2 positions) for the current graph."""
+    if algorithm not in ENGINES:
+        raise KeyError(algorithm)
+    version = graph_store.graph_version()
+    key = (algorithm, version)
+    with _lock:
+        cached = _layouts.get(key)
+    if cached is not None:
+        return cached
+
+    view = sparse.adjacency()
+    stored = _load(algorithm)
+    if stored is not None and stored[0] == version and np.array_equal(stored[1], view.nodes):
+        result = (view.nodes, stored[2])
+    else:
+        initial = None
+        iterations = ITERATIONS[algorithm][0]
+        if stored is not None:
+            initial, known = _warm_start(view, stored[1], stored[2], np.random.default_rng(SEED))
+            if known:
+                iterations = ITERATIONS[algorithm][1]
+        with instrumentation.phase('layout.' + algorithm):
+            result = (view.nodes, ENGINES[algorithm](view, initial, iterations))
+        _save(algorithm, version, view.nodes, result[1])
+
+    with _lock:
+        for stale in [k for k in _layouts if k[0] == algorithm and k[1] != version]:
+            del _layouts[stale]
+        _layouts[key] = result
+    return result
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from analysis import benchmark
+
+
+class Command(BaseCommand):
+    help = "Time the analysis computations and views on synthetic graphs and write the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append',
+                            help="Dataset size: one of {} or an edge count; may be repeated. Default: 10k.".format(
+                                ', '.join(benchmark.SIZES)))
+        parser.add_argument('--case', action='append',
+                            help="Only run the cases whose name contains this text; may be repeated.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic graphs.")
+        parser.add_argument('--no-memory', action='store_true',
+                            help="Do not trace peak memory (tracemalloc slows pure Python code down).")
+        parser.add_argument('--unlimited', action='store_true',
+                            help="Also run the cases that are skipped by default at large sizes.")
+        parser.add_argument('--output', help="Write the JSON report here instead of to stdout.")
+
+    def handle(self, *args, **options):
+        def log(size, name, result):
+            if 'seconds' in result:
+                peak = result.get('peak_bytes')
+                memory = f", peak {peak / 2 ** 20:.1f} MiB" if peak is not None else ''
+                self.stderr.write(f"{size} {name}: {result['seconds']:.3f}s{memory}")
+            elif 'cold' in result:
+                cold, warm = result['cold'], result['preload']
+                self.stderr.write(
+                    f"{size} {name}: import {cold['import_seconds']:.3f}s, first requests "
+                    f"{sum(cold['first_request'].values()):.3f}s cold, "
+                    f"{sum(warm['first_request'].values()):.3f}s after a {warm['preload_seconds']:.3f}s preload")
+            else:
+                self.stderr.write(f"{size} {name}: {result.get('skipped') or result.get('error')}")
+
+        report = benchmark.run(
+            sizes=options['size'] or ['10k'],
+            seed=options['seed'],
+            only=options['case'],
+            trace_memory=not options['no_memory'],
+            unlimited=options['unlimited'],
+            log=log,
+        )
+        body = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(body + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Benchmark report written to {options['output']}"))
+        else:
+            self.stdout.write(body)
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analysis import layout
+
+
+class Command(BaseCommand):
+    help = "Compute and persist the convert_graph layout for the current dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=layout.ALGORITHMS, action='append',
+                            help="Layout to build; may be repeated. Default: all of them.")
+
+    def handle(self, *args, **options):
+        for algorithm in options['algorithm'] or layout.ALGORITHMS:
+            start = time.perf_counter()
+            nodes, positions = layout.positions(algorithm)
+            self.stdout.write(self.style.SUCCESS(
+                f"{algorithm} layout ready for {len(nodes)} nodes ({time.perf_counter() - start:.2f}s)"
+            ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from analysis import graph_store
+
+
+class Command(BaseCommand):
+    help = "Compile data/edges.xlsx and data/nodes.xlsx into the memory-mapped binary snapshot."
+
+    def handle(self, *args, **options):
+        meta = graph_store.store.compile_snapshot()
+        graph_store.store.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot written to {graph_store.store.snapshot_dir}: {meta['nodes']} nodes, "
+            f"{meta['edges']} edges, labels {', '.join(meta['labels'])}"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from analysis import jobs
+
+
+class Command(BaseCommand):
+    help = "Delete the background jobs that finished (or were lost) more than ANALYSIS_JOB_TTL seconds ago."
+
+    def handle(self, *args, **options):
+        deleted = jobs.expire()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired jobs"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from analysis import result_cache
+
+
+class Command(BaseCommand):
+    help = "Invalidate cached analysis results, for the given endpoints or for all of them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', help="Endpoint names, e.g. community_weight. Default: all.")
+
+    def handle(self, *args, **options):
+        endpoints = options['endpoints']
+        result_cache.invalidate(endpoints)
+        self.stdout.write(self.style.SUCCESS(
+            "Invalidated cached results for " + (', '.join(endpoints) if endpoints else 'all endpoints')
+        ))
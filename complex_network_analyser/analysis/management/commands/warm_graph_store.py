@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analysis import backend, graph_store, snapshot as snapshot_format
+
+
+class Command(BaseCommand):
+    help = ("Prepare the data every server process loads: compile the binary snapshot if it is missing or "
+            "older than the Excel files, then check that the graph and the edit log load. This does not warm "
+            "running servers; set ANALYSIS_PRELOAD=1 to load the graph when the WSGI application starts.")
+
+    def handle(self, *args, **options):
+        store = graph_store.store
+        meta = snapshot_format.read_meta(store.snapshot_dir)
+        if meta is None or meta['source_version'] != store.hash_sources():
+            start = time.perf_counter()
+            meta = store.compile_snapshot()
+            store.clear()
+            self.stdout.write(f"Compiled the snapshot in {time.perf_counter() - start:.2f}s")
+        else:
+            self.stdout.write("The snapshot is current")
+
+        start = time.perf_counter()
+        graph = backend.current()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Graph loads: {len(graph)} nodes, {graph.number_of_edges()} edges, "
+            f"version {graph_store.graph_version()}, "
+            f"from {'snapshot' if store.snapshot is not None else 'Excel'} ({elapsed:.2f}s)"
+        ))
@@ -0,0 +1,172 @@
+"""
+    Single-pass metrics engine for the general statistics endpoint.
+
+    nx.shortest_path_length, nx.closeness_centrality, nx.average_clustering
+    and nx.transitivity each walk the whole graph on their own. The helpers
+    here share that work:
+
+    * path_summary runs one BFS per source and feeds the diameter, the
+      average shortest path length and the closeness accumulators from it.
+    * triangle_summary counts the triangles around each node once and
+      derives both the clustering coefficients and the transitivity.
+
+    All values are computed the same way networkx computes them, so the
+    endpoint output does not change. The distance sweep always runs in
+    scipy's csgraph, which beats any practical number of pure Python BFS
+    workers; with settings.ANALYSIS_WORKERS > 1 only betweenness (Brandes)
+    goes to the process pool in parallel.py.
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import csgraph
+
+from . import jobs, sparse
+
+PathStats = namedtuple('PathStats', ['diameter', 'average_shortest_path_length', 'closeness'])
+TriangleStats = namedtuple('TriangleStats', ['clustering', 'average_clustering', 'transitivity'])
+
+# Upper bound on the number of distances held in memory by one BFS batch.
+_MAX_BATCH_CELLS = 1 << 24
+
+
+def _source_batches(n):
+    size = max(1, min(256, _MAX_BATCH_CELLS // max(n, 1)))
+    for start in range(0, n, size):
+        yield np.arange(start, min(start + size, n))
+
+
+def path_summary(view):
+    """One BFS per source over the whole graph (a sparse.SparseView).
+
+    Closeness follows nx.closeness_centrality on a directed graph: it uses
+    the distances *to* each node, with the Wasserman-Faust correction for
+    nodes that are not reached from everywhere.
+    """
+    nodes, dist_to, reach_to, diameter, total_length, pair_count = _serial_sweep(view)
+    closeness = closeness_from_accumulators(nodes, dist_to, reach_to)
+    average = total_length / pair_count if pair_count else 0.0
+    return PathStats(diameter, average, closeness)
+
+
+def _serial_sweep(view):
+    nodes, A = view.nodes, view.A
+    n = len(nodes)
+    diameter = 0
+    total_length = 0
+    pair_count = 0
+    dist_to = np.zeros(n, dtype=np.int64)
+    reach_to = np.zeros(n, dtype=np.int64)
+
+    for sources in _source_batches(n):
+        jobs.report_progress(int(sources[0]), n)
+        D = csgraph.shortest_path(A, method='D', directed=True, unweighted=True, indices=sources)
+        reached = np.isfinite(D)
+        D = np.where(reached, D, 0).astype(np.int64)
+        diameter = max(diameter, int(D.max()))
+        total_length += int(D.sum())
+        pair_count += int(reached.sum())
+        dist_to += D.sum(axis=0)
+        reach_to += reached.sum(axis=0)
+    return nodes, dist_to, reach_to, diameter, total_length, pair_count
+
+
+def closeness_from_accumulators(nodes, dist_to, reach_to):
+    n = len(nodes)
+    closeness = {}
+    for node, totsp, reached in zip(nodes, dist_to.tolist(), reach_to.tolist()):
+        value = 0.0
+        if totsp > 0 and n > 1:
+            value = (reached - 1.0) / totsp
+            value *= (reached - 1.0) / (n - 1)
+        closeness[node] = value
+    return closeness
+
+
+def node_triangles(i, pred, succ):
+    """(directed triangles, successor/successor triangles, triads, clustering) of node i.
+
+    pred and succ map every node to its predecessor/successor set without
+    self loops.
+    """
+    ipreds = pred[i]
+    isuccs = succ[i]
+    directed_triangles = 0
+    succ_succ_total = 0
+    for j in ipreds:
+        directed_triangles += (len(ipreds & pred[j]) + len(ipreds & succ[j])
+                               + len(isuccs & pred[j]) + len(isuccs & succ[j]))
+    for j in isuccs:
+        succ_succ = len(isuccs & succ[j])
+        succ_succ_total += succ_succ
+        directed_triangles += (len(ipreds & pred[j]) + len(ipreds & succ[j])
+                               + len(isuccs & pred[j]) + succ_succ)
+
+    dtotal = len(ipreds) + len(isuccs)
+    dbidirectional = len(ipreds & isuccs)
+    clustering = 0 if directed_triangles == 0 else \
+        directed_triangles / ((dtotal * (dtotal - 1) - 2 * dbidirectional) * 2)
+    return directed_triangles, succ_succ_total, len(isuccs) * (len(isuccs) - 1), clustering
+
+
+def triangle_summary(G):
+    """Directed clustering (Fagiolo) and transitivity from one triangle count.
+
+    For a DiGraph nx.transitivity only looks at successors, and the
+    successor/successor term of the directed triangle count is exactly
+    the transitivity numerator, so it is accumulated on the side.
+    """
+    pred = {v: set(G._pred[v]) - {v} for v in G}
+    succ = {v: set(G._succ[v]) - {v} for v in G}
+
+    clustering = {}
+    triangles = 0
+    triads = 0
+    for i in G:
+        _, succ_succ, node_triads, clustering[i] = node_triangles(i, pred, succ)
+        triangles += succ_succ
+        triads += node_triads
+
+    average = sum(clustering.values()) / len(clustering) if clustering else 0.0
+    transitivity = 0 if triangles == 0 else triangles / triads
+    return TriangleStats(clustering, average, transitivity)
+
+
+def general_statistics(G, view=None, aggregates=None):
+    """The general_statistical_info numbers.
+
+    With `aggregates` (an aggregates.Aggregates of G) the counts, density,
+    centralization, clustering and transitivity come from there; the path
+    statistics and the assortativity are always computed.
+    """
+    view = view if view is not None else sparse.SparseView.from_graph(G)
+    paths = path_summary(view)
+    if aggregates is not None:
+        summary = aggregates.summary()
+    else:
+        n = len(view)
+        triangles = triangle_summary(G)
+        summary = {
+            'nodes': n,
+            'edges': int(view.out_degree.sum()),
+            'avg_in_degree': int(view.in_degree.sum()) / float(n),
+            'avg_out_degree': int(view.out_degree.sum()) / float(n),
+            'density': sparse.density(view),
+            'degree_centralization': sparse.degree_centralization(view),
+            'average_clustering': triangles.average_clustering,
+            'transitivity': triangles.transitivity,
+        }
+
+    return {
+        "nodes_count": summary['nodes'],
+        "edges_count": summary['edges'],
+        "avg_in_degree": float("{:.6f}".format(summary['avg_in_degree'])),
+        "avg_out_degree": float("{:.6f}".format(summary['avg_out_degree'])),
+        "density": float("{:.6f}".format(summary['density'])),
+        "diameter": paths.diameter,
+        "avg_shortest_path_length": float("{:.6f}".format(paths.average_shortest_path_length)),
+        "avg_cc": float("{:.6f}".format(summary['average_clustering'])),
+        "transitivity": float("{:.6f}".format(summary['transitivity'])),
+        "assortiativity": float("{:.6f}".format(sparse.degree_assortativity(view))),
+        "degree_centralization": float("{:.6f}".format(summary['degree_centralization']))
+    }
@@ -1,3 +1,33 @@
+import uuid
+
 from django.db import models
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class Job(models.Model):
+    """A background run of an analysis endpoint (see analysis/jobs.py)."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Endpoint, parameters and graph version; identical submissions share it.
+    key = models.CharField(max_length=64, db_index=True)
+    endpoint = models.CharField(max_length=100)
+    path = models.CharField(max_length=200)
+    query = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created']
 
-# Create your models here.
+    def __str__(self):
+        return '{} {} ({})'.format(self.endpoint, self.id, self.status)
@@ -0,0 +1,199 @@
+"""
+    Process-pool backend for the all-pairs BFS / Brandes sweep.
+
+    The source nodes are split into batches and handed to a pool of
+    settings.ANALYSIS_WORKERS processes. The graph travels to the workers
+    once, as CSR offset/neighbor arrays in a shared memory block, and every
+    worker returns the partial accumulators for its batch:
+
+    * the per-source Brandes dependencies, which the parent adds up in
+      source order, so the floating point sums are the same as in
+      nx.betweenness_centrality;
+    * the distance sums and reach counts *to* each node (closeness);
+    * the diameter, the total path length and the number of reached pairs.
+
+    Successors keep their networkx iteration order, so BFS visits nodes in
+    the same order networkx does and the results match it exactly.
+"""
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+
+from . import jobs
+
+Sweep = namedtuple('Sweep', [
+    'nodes', 'sources', 'betweenness', 'dependency_sum', 'dependency_sq',
+    'dist_to', 'dist_sq_to', 'reach_to', 'diameter', 'total_length', 'pair_count',
+])
+
+# Upper bound on the number of dependency values one batch sends back.
+_MAX_BATCH_CELLS = 1 << 22
+
+_worker_graph = None
+
+
+def worker_count():
+    return max(1, int(getattr(settings, 'ANALYSIS_WORKERS', 1)))
+
+
+def csr_arrays(G):
+    """Node list plus int32 CSR arrays that keep networkx successor order."""
+    nodes = list(G)
+    index = {node: i for i, node in enumerate(nodes)}
+    offsets = np.zeros(len(nodes) + 1, dtype=np.int32)
+    np.cumsum([len(G._succ[node]) for node in nodes], out=offsets[1:])
+    neighbors = np.fromiter(
+        (index[v] for node in nodes for v in G._succ[node]),
+        dtype=np.int32, count=int(offsets[-1]))
+    return nodes, offsets, neighbors
+
+
+def _sweep_sources(sources, offsets, neighbors, n, with_betweenness):
+    diameter = 0
+    total_length = 0
+    pair_count = 0
+    dist_to = np.zeros(n, dtype=np.int64)
+    dist_sq_to = np.zeros(n, dtype=np.int64)
+    reach_to = np.zeros(n, dtype=np.int64)
+    dependencies = np.zeros((len(sources), n)) if with_betweenness else None
+
+    for row, s in enumerate(sources):
+        # Same BFS as networkx' _single_source_shortest_path_basic.
+        S = []
+        P = {}
+        sigma = [0.0] * n
+        D = [-1] * n
+        sigma[s] = 1.0
+        D[s] = 0
+        Q = deque([s])
+        while Q:
+            v = Q.popleft()
+            S.append(v)
+            Dv = D[v]
+            sigmav = sigma[v]
+            for w in neighbors[offsets[v]:offsets[v + 1]]:
+                if D[w] < 0:
+                    Q.append(w)
+                    D[w] = Dv + 1
+                    P[w] = []
+                if D[w] == Dv + 1:
+                    sigma[w] += sigmav
+                    P[w].append(v)
+
+        distances = np.array(D)
+        reached = distances >= 0
+        dist_to[reached] += distances[reached]
+        dist_sq_to[reached] += distances[reached] ** 2
+        reach_to += reached
+        diameter = max(diameter, D[S[-1]])
+        total_length += int(distances[reached].sum())
+        pair_count += len(S)
+
+        if with_betweenness:
+            # Same accumulation as networkx' _accumulate_basic.
+            delta = [0.0] * n
+            for w in reversed(S):
+                coeff = (1 + delta[w]) / sigma[w]
+                for v in P.get(w, ()):
+                    delta[v] += sigma[v] * coeff
+            delta[s] = 0.0
+            dependencies[row] = delta
+
+    return dependencies, dist_to, dist_sq_to, reach_to, diameter, total_length, pair_count
+
+
+def _attach(name, n, m):
+    global _worker_graph
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        arrays = np.ndarray((n + 1 + m,), dtype=np.int32, buffer=block.buf)
+        _worker_graph = (arrays[:n + 1].tolist(), arrays[n + 1:].tolist(), n)
+    finally:
+        block.close()
+
+
+def _run_batch(sources, with_betweenness):
+    offsets, neighbors, n = _worker_graph
+    return _sweep_sources(sources, offsets, neighbors, n, with_betweenness)
+
+
+def _batches(sources, n, with_betweenness, workers):
+    size = max(1, -(-len(sources) // (workers * 4)))
+    if with_betweenness:
+        size = min(size, max(1, _MAX_BATCH_CELLS // max(n, 1)))
+    return [sources[start:start + size] for start in range(0, len(sources), size)]
+
+
+def all_pairs_sweep(graph, with_betweenness=True, workers=None, sources=None):
+    """BFS from every node, or only from `sources` (node positions).
+
+    `graph` is anything with nodes, offsets and neighbors: a
+    backend.CompactGraph or a sparse.SparseView.
+
+    Betweenness is only normalized into a dict for a full sweep; a sampled
+    sweep leaves the raw dependency sums to the caller.
+    """
+    workers = worker_count() if workers is None else workers
+    nodes, offsets, neighbors = graph.nodes, np.asarray(graph.offsets), np.asarray(graph.neighbors)
+    n = len(nodes)
+    sources = list(range(n)) if sources is None else list(sources)
+    batches = _batches(sources, n, with_betweenness, workers)
+
+    if workers == 1:
+        offsets_list, neighbors_list = offsets.tolist(), neighbors.tolist()
+        results = (_sweep_sources(batch, offsets_list, neighbors_list, n, with_betweenness) for batch in batches)
+        return _merge(nodes, sources, results, with_betweenness, len(batches))
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, (n + 1 + len(neighbors)) * 4))
+    try:
+        arrays = np.ndarray((n + 1 + len(neighbors),), dtype=np.int32, buffer=block.buf)
+        arrays[:n + 1] = offsets
+        arrays[n + 1:] = neighbors
+        del arrays
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(block.name, n, len(neighbors))) as pool:
+            results = pool.map(_run_batch, batches, [with_betweenness] * len(batches))
+            return _merge(nodes, sources, results, with_betweenness, len(batches))
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _merge(nodes, sources, results, with_betweenness, batch_count):
+    n = len(nodes)
+    dependency_sum = np.zeros(n) if with_betweenness else None
+    dependency_sq = np.zeros(n) if with_betweenness else None
+    dist_to = np.zeros(n, dtype=np.int64)
+    dist_sq_to = np.zeros(n, dtype=np.int64)
+    reach_to = np.zeros(n, dtype=np.int64)
+    diameter = 0
+    total_length = 0
+    pair_count = 0
+
+    # Batches come back in source order; adding the rows one by one keeps
+    # the summation order of nx.betweenness_centrality.
+    for done, result in enumerate(results, 1):
+        dependencies, part_dist, part_dist_sq, part_reach, part_diameter, part_length, part_pairs = result
+        if with_betweenness:
+            for row in dependencies:
+                dependency_sum += row
+                dependency_sq += row * row
+        dist_to += part_dist
+        dist_sq_to += part_dist_sq
+        reach_to += part_reach
+        diameter = max(diameter, part_diameter)
+        total_length += part_length
+        pair_count += part_pairs
+        jobs.report_progress(done, batch_count)
+
+    betweenness = None
+    if with_betweenness and len(sources) == n:
+        betweenness = dependency_sum.copy()
+        if n > 2:
+            betweenness *= 1 / ((n - 1) * (n - 2))
+        betweenness = dict(zip(nodes, betweenness.tolist()))
+    return Sweep(nodes, sources, betweenness, dependency_sum, dependency_sq,
+                 dist_to, dist_sq_to, reach_to, diameter, total_length, pair_count)
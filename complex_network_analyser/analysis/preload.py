@@ -0,0 +1,52 @@
+"""
+    Warm start for the server processes.
+
+    The heavy libraries are imported inside the code that needs them, so a
+    worker serves its first request quickly but pays for the graph (and
+    pandas or networkx) on the first request that touches it. preload()
+    moves that cost to startup: it loads the graph store and builds the
+    structures most requests start from (the compact backend, the sparse
+    adjacency and the label index). The networkx DiGraph, and the
+    incremental aggregates built from it, are left to the first request
+    that needs them, so workers that never run those algorithms do not
+    hold a second copy of the graph.
+
+    wsgi.py calls it when settings.ANALYSIS_PRELOAD is on. A server that
+    imports the application in its master process before forking the
+    workers (gunicorn --preload, uWSGI without lazy-apps) then builds all
+    of it once, and the workers share those pages copy-on-write. Without
+    that, every worker builds its own copy at startup instead of during
+    its first request. gc.freeze() moves everything built so far out of
+    the collector's reach, so collections in the workers do not write to
+    (and copy) the shared pages.
+
+    Nothing here opens a database connection, a thread or a process pool,
+    so the workers have nothing to reset after the fork.
+"""
+import gc
+import logging
+import time
+
+from . import backend, graph_store, labels, sparse
+
+logger = logging.getLogger(__name__)
+
+
+def preload():
+    """Load the graph and its derived structures into this process; returns what was loaded."""
+    start = time.perf_counter()
+    version = graph_store.graph_version()
+    graph = backend.current()
+    sparse.adjacency()
+    labels.label_index()
+    gc.collect()
+    gc.freeze()
+    result = {
+        'nodes': len(graph),
+        'edges': graph.number_of_edges(),
+        'version': version,
+        'seconds': round(time.perf_counter() - start, 6),
+    }
+    logger.info("preloaded graph version %s: %d nodes, %d edges in %.2fs",
+                version, result['nodes'], result['edges'], result['seconds'])
+    return result
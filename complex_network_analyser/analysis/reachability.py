@@ -0,0 +1,315 @@
+"""
+    Reachability: strongly connected components and exact path bounds.
+
+    The graph is directed and not strongly connected, so "the diameter"
+    only means something inside a strongly connected component (SCC); a
+    shortest path between two nodes of an SCC never leaves it. Once per
+    graph version this module computes:
+
+    * the SCCs (scipy csgraph) and the condensation DAG, with components
+      numbered in topological order (every DAG edge goes to a higher id)
+      and ties broken by first member;
+    * for every component the number of nodes reachable from it, by
+      pushing bitsets of target components up the DAG one height level at
+      a time, so the exact number of reachable ordered pairs follows;
+    * the exact diameter of every component with DiFUB (Crescenzi et al.,
+      the directed iFUB). Forward and backward BFS from a central node u
+      give the fringes F_b / B_a (nodes at distance b from u / a to u).
+      A pair (x, y) with d(x, u) <= a and d(u, y) <= b is at most a + b
+      apart, so starting from the deepest fringes only fringe nodes need a
+      BFS of their own: a backward one for F_b, which settles every pair
+      ending there, a forward one for B_a. The cheaper fringe goes first,
+      and the search stops once the largest distance seen reaches a + b,
+      usually after a few dozen BFS runs rather than one per node.
+
+    Per-node eccentricities of a component are computed on request, with
+    the directed form of the bounding-diameters algorithm (Takes & Kosters):
+    after BFS both ways from w,
+
+        max(d(v, w), ecc(w) - d(w, v)) <= ecc(v) <= d(v, w) + ecc(w)
+
+    and BFS continues from the nodes whose bounds are still apart. When
+    eccentricities are too uniform for the bounds to converge quickly,
+    the remaining nodes get a plain forward BFS each.
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import csgraph
+
+from . import graph_store, instrumentation, jobs, sparse
+
+# Components up to this size get their diameter from plain all-pairs BFS.
+ALL_PAIRS_SIZE = 64
+# Highest degree nodes tried as the DiFUB root.
+ROOT_CANDIDATES = 16
+# Nodes per round of the eccentricity bounds.
+ECCENTRICITY_BATCH = 32
+# Upper bound on the bytes held by the reachability bitsets of one block.
+_BITSET_BYTES = 1 << 26
+_MAX_BATCH_CELLS = 1 << 24
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int64)
+
+Eccentricities = namedtuple('Eccentricities', ['component', 'nodes', 'values', 'bfs_runs'])
+
+
+def _bfs(M, sources):
+    """Hop distances from each source (rows), inf where unreachable."""
+    return csgraph.shortest_path(M, method='D', directed=True, unweighted=True, indices=sources)
+
+
+def _max_distance(M, sources):
+    """Largest distance from any of the sources (0 if there are none)."""
+    n = M.shape[0]
+    size = max(1, _MAX_BATCH_CELLS // max(n, 1))
+    farthest = 0
+    for start in range(0, len(sources), size):
+        farthest = max(farthest, int(_bfs(M, sources[start:start + size]).max()))
+    return farthest
+
+
+def _topological_components(A):
+    """(component of every node, DAG offsets, DAG neighbors, height of every component)."""
+    count, raw = csgraph.connected_components(A, directed=True, connection='strong')
+    sources, targets = A.nonzero()
+    between = raw[sources] != raw[targets]
+    pairs = np.unique(np.column_stack([raw[sources][between], raw[targets][between]]), axis=0)
+
+    # Height = longest path to a sink, by peeling sinks off.
+    out_degree = np.bincount(pairs[:, 0], minlength=count)
+    order = np.argsort(pairs[:, 1], kind='stable')
+    pred_offsets = np.concatenate([[0], np.cumsum(np.bincount(pairs[:, 1], minlength=count))])
+    preds = pairs[order, 0].tolist()
+    pred_offsets = pred_offsets.tolist()
+    height = [0] * count
+    remaining = out_degree.tolist()
+    queue = [c for c in range(count) if remaining[c] == 0]
+    for c in queue:
+        for p in preds[pred_offsets[c]:pred_offsets[c + 1]]:
+            height[p] = max(height[p], height[c] + 1)
+            remaining[p] -= 1
+            if remaining[p] == 0:
+                queue.append(p)
+    height = np.array(height, dtype=np.int64)
+
+    # Renumber: higher components first, then by first member.
+    first = np.full(count, len(raw), dtype=np.int64)
+    np.minimum.at(first, raw, np.arange(len(raw)))
+    rank = np.empty(count, dtype=np.int64)
+    rank[np.lexsort((first, -height))] = np.arange(count)
+    component = rank[raw]
+
+    dag = np.unique(rank[pairs], axis=0) if len(pairs) else np.zeros((0, 2), dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(dag[:, 0], minlength=count))])
+    new_height = np.empty(count, dtype=np.int64)
+    new_height[rank] = height
+    return component, offsets, dag[:, 1], new_height
+
+
+def _reach_sizes(offsets, neighbors, height, sizes):
+    """Number of nodes reachable from each component, itself included."""
+    count = len(sizes)
+    # Only components with a predecessor need a bit of their own: nothing
+    # else reaches a source of the DAG.
+    columns = np.flatnonzero(np.bincount(neighbors, minlength=count) > 0)
+    words = int(max(1, min(-(-len(columns) // 64), _BITSET_BYTES // (9 * 8 * max(count, 1)))))
+    block = 64 * words
+
+    # Per height level: the components that have successors, and their edges.
+    levels = []
+    for h in range(1, int(height.max()) + 1 if count else 1):
+        members = np.flatnonzero(height == h)
+        starts, ends = offsets[members], offsets[members + 1]
+        lengths = ends - starts
+        edges = np.repeat(ends - np.cumsum(lengths), lengths) + np.arange(lengths.sum())
+        levels.append((members, neighbors[edges], np.concatenate([[0], np.cumsum(lengths)])))
+
+    reach = sizes.astype(np.int64)
+    reach[columns] = 0
+    for start in range(0, len(columns), block):
+        own = columns[start:start + block]
+        # Ancestors have lower ids, so rows past the last target stay empty.
+        end = int(own[-1]) + 1
+        bits = np.zeros((count, words), dtype=np.uint64)
+        local = np.arange(len(own))
+        bits[own, local // 64] = np.left_shift(np.uint64(1), (local % 64).astype(np.uint64))
+        for members, targets, bounds in levels:
+            k = int(np.searchsorted(members, end))
+            if k:
+                bits[members[:k]] |= np.bitwise_or.reduceat(bits[targets[:bounds[k]]], bounds[:k], axis=0)
+        # Every reachable component counts once; the larger ones add the rest of their size.
+        reach[:end] += _POPCOUNT[bits[:end].view(np.uint8)].sum(axis=1)
+        for i in np.flatnonzero(sizes[own] > 1).tolist():
+            reached = (bits[:end, i // 64] >> np.uint64(i % 64)) & np.uint64(1)
+            reach[:end] += reached.astype(np.int64) * (int(sizes[own[i]]) - 1)
+    return reach
+
+
+def _root(A, AT):
+    """BFS both ways from the most central of the highest degree nodes.
+
+    (forward distances, backward distances, lower bound on the diameter, BFS runs)
+    """
+    degree = np.diff(A.indptr) + np.diff(AT.indptr)
+    candidates = np.argsort(-degree, kind='stable')[:ROOT_CANDIDATES]
+    forward = _bfs(A, candidates)
+    backward = _bfs(AT, candidates)
+    eccentricity = forward.max(axis=1) + backward.max(axis=1)
+    best = int(np.argmin(eccentricity))
+    lb = int(max(forward.max(), backward.max()))
+    return forward[best].astype(np.int64), backward[best].astype(np.int64), lb, 2 * len(candidates)
+
+
+def _difub(A, AT):
+    """(diameter, BFS runs) of a strongly connected graph."""
+    n = A.shape[0]
+    if n <= ALL_PAIRS_SIZE:
+        return _max_distance(A, np.arange(n)), n
+    forward, backward, lb, runs = _root(A, AT)
+    # Pairs not accounted for yet satisfy d(x, u) <= a and d(u, y) <= b.
+    a, b = int(backward.max()), int(forward.max())
+    while a + b > lb:
+        into, out_of = np.flatnonzero(backward == a), np.flatnonzero(forward == b)
+        if b > 0 and (len(out_of) <= len(into) or a == 0):
+            lb = max(lb, _max_distance(AT, out_of))
+            runs += len(out_of)
+            b -= 1
+        else:
+            lb = max(lb, _max_distance(A, into))
+            runs += len(into)
+            a -= 1
+    return lb, runs
+
+
+def _bounded_eccentricities(A, AT):
+    """(exact forward eccentricity of every node, BFS runs) of a strongly connected graph."""
+    n = A.shape[0]
+    lower = np.zeros(n, dtype=np.int64)
+    upper = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+    degree = np.diff(A.indptr) + np.diff(AT.indptr)
+    size = max(1, min(ECCENTRICITY_BATCH, _MAX_BATCH_CELLS // max(n, 1)))
+    runs = 0
+    while True:
+        candidates = np.flatnonzero(lower < upper)
+        if not len(candidates):
+            return lower, runs
+        # Half the batch with the largest upper bounds, half with the smallest lower bounds.
+        by_upper = candidates[np.lexsort((-degree[candidates], -upper[candidates]))][:size // 2 + 1]
+        by_lower = candidates[np.lexsort((-degree[candidates], lower[candidates]))][:size // 2 + 1]
+        batch = np.unique(np.concatenate([by_upper, by_lower]))[:size]
+
+        forward = _bfs(A, batch).astype(np.int64)
+        backward = _bfs(AT, batch).astype(np.int64)
+        runs += 2 * len(batch)
+        for w, f, b in zip(batch.tolist(), forward, backward):
+            ecc = int(f.max())
+            np.maximum(lower, np.maximum(b, ecc - f), out=lower)
+            np.minimum(upper, b + ecc, out=upper)
+            lower[w] = upper[w] = ecc
+
+        remaining = candidates[lower[candidates] < upper[candidates]]
+        if len(candidates) - len(remaining) < 2 * len(batch):
+            # The bounds stopped paying for their BFS runs; a forward BFS
+            # from each remaining node is cheaper from here on.
+            for start in range(0, len(remaining), size):
+                chunk = remaining[start:start + size]
+                lower[chunk] = upper[chunk] = _bfs(A, chunk).max(axis=1).astype(np.int64)
+            return lower, runs + len(remaining)
+
+
+class Reachability:
+
+    def __init__(self, view):
+        self.nodes = view.nodes
+        self.A = view.A
+        self.component, self.offsets, self.neighbors, self.height = _topological_components(view.A)
+        self.sizes = np.bincount(self.component, minlength=len(self.offsets) - 1)
+        self._order = np.argsort(self.component, kind='stable')
+        self._bounds = np.concatenate([[0], np.cumsum(self.sizes)])
+
+        self.reach = _reach_sizes(self.offsets, self.neighbors, self.height, self.sizes)
+        n = len(self.nodes)
+        self.reachable_pairs = int((self.sizes * self.reach).sum()) - n
+
+        self.diameters = np.zeros(len(self.sizes), dtype=np.int64)
+        self.bfs_runs = 0
+        multi = np.flatnonzero(self.sizes > 1)
+        for done, c in enumerate(multi.tolist()):
+            jobs.report_progress(done, len(multi))
+            sub, sub_t = self._subgraph(c)
+            self.diameters[c], runs = _difub(sub, sub_t)
+            self.bfs_runs += runs
+
+        self._lock = threading.Lock()
+        self._eccentricities = {}
+
+    def __len__(self):
+        return len(self.sizes)
+
+    @property
+    def largest(self):
+        return int(np.argmax(self.sizes)) if len(self.sizes) else None
+
+    @property
+    def condensation_edges(self):
+        return len(self.neighbors)
+
+    def members(self, c):
+        """Node positions of one component, ascending."""
+        return self._order[self._bounds[c]:self._bounds[c + 1]]
+
+    def _subgraph(self, c):
+        members = self.members(c)
+        sub = self.A[members][:, members].tocsr()
+        return sub, sub.T.tocsr()
+
+    def eccentricities(self, c):
+        """Eccentricities of component c; cached."""
+        with self._lock:
+            cached = self._eccentricities.get(c)
+        if cached is not None:
+            return cached
+        members = self.members(c)
+        if len(members) == 1:
+            values, runs = np.zeros(1, dtype=np.int64), 0
+        else:
+            values, runs = _bounded_eccentricities(*self._subgraph(c))
+        result = Eccentricities(c, [self.nodes[i] for i in members.tolist()], values, runs)
+        with self._lock:
+            self._eccentricities[c] = result
+        return result
+
+    def summary(self):
+        n = len(self.nodes)
+        largest = self.largest
+        pairs = n * (n - 1)
+        return {
+            'nodes': n,
+            'strongly_connected_components': len(self),
+            'largest_component_size': int(self.sizes[largest]) if largest is not None else 0,
+            'largest_component_diameter': int(self.diameters[largest]) if largest is not None else 0,
+            'condensation_edges': self.condensation_edges,
+            'reachable_pairs': self.reachable_pairs,
+            'unreachable_pairs': pairs - self.reachable_pairs,
+            'reachable_fraction': self.reachable_pairs / pairs if pairs else 0.0,
+            'diameter_bfs_runs': self.bfs_runs,
+        }
+
+
+_lock = threading.Lock()
+_cache = {'version': None, 'reachability': None}
+
+
+def reachability():
+    """Reachability of the current graph."""
+    version = graph_store.graph_version()
+    with _lock:
+        if _cache['version'] == version:
+            return _cache['reachability']
+    view = sparse.adjacency()
+    with instrumentation.phase('reachability'):
+        result = Reachability(view)
+    with _lock:
+        _cache.update(version=version, reachability=result)
+    return result
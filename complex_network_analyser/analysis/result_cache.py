@@ -0,0 +1,182 @@
+"""
+    Result cache for the expensive analysis views.
+
+    Responses are stored in the Django cache alias 'analysis' (locmem by
+    default, file based when ANALYSIS_CACHE_DIR is set; both are size
+    bounded through MAX_ENTRIES). The key is built from
+
+        (endpoint, normalized query/url parameters, dataset content hash, generation)
+
+    so a new dataset never serves old results. The generation lives in a
+    small JSON file that the invalidate_results command bumps, which lets
+    the command reach the caches of every worker process.
+
+    Every cached response carries an ETag derived from its content, and a
+    request whose If-None-Match matches gets an empty 304.
+
+    Concurrent misses on the same key are coalesced (singleflight.py): one
+    request computes and the others wait for its result, within a process
+    through threading and across workers through a file lock.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import graph_store, instrumentation, singleflight
+
+CACHE_ALIAS = 'analysis'
+DEFAULT_TTL = 3600
+
+_lock = threading.Lock()
+_generations = {'stamp': None, 'values': {}}
+stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+_flights = singleflight.Group()
+# Query parameters that do not change the result.
+IGNORED_PARAMS = ('async', 'profile')
+
+
+def _generation_file():
+    return getattr(settings, 'ANALYSIS_CACHE_GENERATION_FILE',
+                   os.path.join(graph_store.DATA_DIR, 'results_generation.json'))
+
+
+def _read_generations():
+    path = _generation_file()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}
+    # invalidate() replaces the file, so a new inode marks a new version
+    # even when two writes land on the same mtime tick.
+    stamp = (path, st.st_ino, st.st_mtime_ns)
+    with _lock:
+        if _generations['stamp'] == stamp:
+            return _generations['values']
+    try:
+        with open(path) as f:
+            values = json.load(f)
+    except (OSError, ValueError):
+        values = {}
+    with _lock:
+        _generations.update(stamp=stamp, values=values)
+    return values
+
+
+def generation(endpoint):
+    values = _read_generations()
+    return '{}.{}'.format(values.get('*', 0), values.get(endpoint, 0))
+
+
+def invalidate(endpoints=None):
+    """Bump the generation of the given endpoints, or of all of them."""
+    path = _generation_file()
+    try:
+        with open(path) as f:
+            values = json.load(f)
+    except (OSError, ValueError):
+        values = {}
+    for endpoint in endpoints or ['*']:
+        values[endpoint] = values.get(endpoint, 0) + 1
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(values, f)
+    os.replace(tmp_path, path)
+    return values
+
+
+def ttl(endpoint):
+    ttls = getattr(settings, 'ANALYSIS_CACHE_TTLS', {})
+    return ttls.get(endpoint, ttls.get('default', DEFAULT_TTL))
+
+
+def normalized_params(request, kwargs):
+    params = sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists()
+        if key not in IGNORED_PARAMS
+    )
+    return json.dumps([sorted(kwargs.items()), params], separators=(',', ':'), default=str)
+
+
+def cache_key(endpoint, request, kwargs):
+    params = hashlib.sha1(normalized_params(request, kwargs).encode()).hexdigest()
+    return 'analysis:{}:{}:{}:{}'.format(endpoint, graph_store.graph_version(), generation(endpoint), params)
+
+
+def _etag(data):
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return '"{}"'.format(hashlib.sha1(body.encode()).hexdigest())
+
+
+def store(endpoint, key, data):
+    """Cache `data` as the response for `key` in this process's cache and return the entry."""
+    entry = {'data': data, 'etag': _etag(data)}
+    caches[CACHE_ALIAS].set(key, entry, ttl(endpoint))
+    return entry
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return etag in [tag.strip() for tag in header.split(',')] or header.strip() == '*'
+
+
+def cached(endpoint):
+    """Cache successful responses of a DRF function view.
+
+    Goes between @api_view and the view function:
+
+        @api_view(['GET'])
+        @result_cache.cached('community_weight')
+        def community_weight(request): ...
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if instrumentation.profiling(request):
+                # A profile has to see the computation itself.
+                return view(request, *args, **kwargs)
+            cache = caches[CACHE_ALIAS]
+            key = cache_key(endpoint, request, kwargs)
+            entry = cache.get(key)
+            outcome = 'HIT'
+            if entry is not None:
+                stats['hits'] += 1
+            else:
+                stats['misses'] += 1
+
+                def compute():
+                    with singleflight.file_lock(key):
+                        # Another worker may have stored it while we waited.
+                        stored = cache.get(key)
+                        if stored is not None:
+                            return dict(stored, waited=True), None
+                        response = view(request, *args, **kwargs)
+                        # Streamed and binary payloads are passed through as they are.
+                        if not isinstance(response, Response) or response.status_code != status.HTTP_200_OK:
+                            return None, response
+                        return store(endpoint, key, response.data), None
+
+                (entry, response), shared = _flights.do(key, compute)
+                if entry is None:
+                    # Responses that are not cached are not shared either.
+                    return view(request, *args, **kwargs) if shared else response
+                if shared or entry.get('waited'):
+                    stats['coalesced'] += 1
+                outcome = 'COALESCED' if shared or entry.get('waited') else 'MISS'
+
+            if _etag_matches(request, entry['etag']):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(entry['data'], status=status.HTTP_200_OK)
+            response['ETag'] = entry['etag']
+            response['X-Cache'] = outcome
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,76 @@
+"""
+    Single-flight coalescing of identical concurrent computations.
+
+    Group.do(key, fn) runs fn once for all the threads that ask for the
+    same key at the same time: the first caller computes, the others wait
+    for it and get its result, or its exception.
+
+    file_lock(key) does the same job across processes (gunicorn workers):
+    an exclusive flock on a per-key file under settings.ANALYSIS_LOCK_DIR.
+    The holder computes while the others block; when they get the lock
+    they find the result in the shared (file based) result cache. Without
+    ANALYSIS_LOCK_DIR, i.e. without a cache the workers share, it does
+    nothing.
+"""
+import contextlib
+import fcntl
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Group:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """(value, shared): fn() or the result of the identical call in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+
+@contextlib.contextmanager
+def file_lock(key):
+    lock_dir = getattr(settings, 'ANALYSIS_LOCK_DIR', None)
+    if not lock_dir:
+        yield
+        return
+    os.makedirs(lock_dir, exist_ok=True)
+    path = os.path.join(lock_dir, hashlib.sha1(key.encode()).hexdigest() + '.lock')
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
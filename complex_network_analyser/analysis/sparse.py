@@ -0,0 +1,121 @@
+"""
+    scipy.sparse view of the loaded graph and the vectorized measures built
+    on it: degree arrays, the degree histogram, degree centralization and
+    eigenvector centrality.
+
+    The CSR arrays are those of the current backend.CompactGraph, so rows
+    and columns follow its node positions and map back to NodeIds through
+    view.nodes.
+"""
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from . import backend, graph_store, instrumentation, parallel
+
+
+class SparseView:
+
+    def __init__(self, nodes, offsets, neighbors):
+        n = len(nodes)
+        self.nodes = nodes
+        self.offsets = np.asarray(offsets)
+        self.neighbors = np.asarray(neighbors)
+        data = np.ones(len(neighbors), dtype=np.float64)
+        self.A = sparse.csr_array((data, self.neighbors, self.offsets), shape=(n, n))
+        self.out_degree = np.diff(self.offsets).astype(np.int64)
+        self.in_degree = np.bincount(self.neighbors, minlength=n).astype(np.int64)
+
+    @classmethod
+    def from_graph(cls, G):
+        return cls(*parallel.csr_arrays(G))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def degree(self):
+        return self.in_degree + self.out_degree
+
+    def to_dict(self, values):
+        return dict(zip(self.nodes, values.tolist()))
+
+
+_lock = threading.Lock()
+_view = (None, None)
+
+
+def adjacency():
+    """SparseView of the graph currently in the store, rebuilt once per version."""
+    global _view
+    version = graph_store.graph_version()
+    with _lock:
+        if _view[0] == version:
+            return _view[1]
+    graph = backend.current()
+    with instrumentation.phase('sparse'):
+        view = SparseView(graph.nodes, graph.offsets, graph.neighbors)
+    with _lock:
+        _view = (version, view)
+    return view
+
+
+def degree_histogram(view):
+    """[(degree, frequency), ...] for every degree that occurs, ascending."""
+    counts = np.bincount(view.degree)
+    degrees = np.flatnonzero(counts)
+    return list(zip(degrees.tolist(), counts[degrees].tolist()))
+
+
+def degree_centrality(view):
+    n = len(view)
+    if n <= 1:
+        return np.ones(n)
+    return view.degree * (1.0 / (n - 1.0))
+
+
+def degree_centralization(view):
+    """In-degree centralization, as reported by general_statistical_info."""
+    N = len(view)
+    return float(N * int(view.in_degree.max()) - int(view.in_degree.sum())) / (N - 1) ** 2
+
+
+def density(view):
+    n = len(view)
+    if n <= 1:
+        return 0
+    return int(view.out_degree.sum()) / (n * (n - 1))
+
+
+def degree_assortativity(view):
+    """nx.degree_pearson_correlation_coefficient for a DiGraph (out-degree of
+    the source against in-degree of the target, over every edge)."""
+    from scipy import stats
+
+    sources = np.repeat(np.arange(len(view)), view.out_degree)
+    targets = view.neighbors
+    return float(stats.pearsonr(view.out_degree[sources], view.in_degree[targets])[0])
+
+
+def eigenvector_centrality(view, max_iter=100, tol=1.0e-6):
+    """Power iteration of nx.eigenvector_centrality as sparse mat-vec products.
+
+    Like networkx this iterates x <- (A^T + I) x from the uniform vector
+    and stops once the L1 change is below n * tol.
+    """
+    import networkx as nx
+
+    n = len(view)
+    if n == 0:
+        raise nx.NetworkXPointlessConcept("cannot compute centrality for the null graph")
+    AT = view.A.T.tocsr()
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        xlast = x
+        x = xlast + AT @ xlast
+        norm = np.linalg.norm(x) or 1
+        x = x / norm
+        if np.abs(x - xlast).sum() < n * tol:
+            return x
+    raise nx.PowerIterationFailedConvergence(max_iter)
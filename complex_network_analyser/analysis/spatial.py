@@ -0,0 +1,201 @@
+"""
+    Spatial index and level-of-detail queries over the layout positions.
+
+    GridIndex buckets the nodes of a layout into a uniform grid, sorted by
+    cell, so a bounding box query only touches the cells it overlaps
+    (np.searchsorted per grid column) instead of every node.
+
+    viewport() answers a bounding box + zoom request. Zoomed in, it returns
+    the nodes in the box and the edges touching them. Zoomed out, or when
+    the box holds more nodes than a client can draw, nodes are merged into
+    one super-node per grid cell. A super-node sits at the degree-weighted
+    centroid of its members, and parallel edges between two cells collapse
+    into one weighted super-edge.
+
+    Coordinates are in the same scale convert_graph uses (layout * 1000).
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from . import graph_store, labels, layout, sparse
+from .graph_payload import SCALE
+
+Box = namedtuple('Box', ['xmin', 'ymin', 'xmax', 'ymax'])
+
+GRID_CELLS = 256
+# Below this zoom level nodes are always aggregated.
+DETAIL_ZOOM = 3
+# Zoomed in, more nodes than this in the box still get aggregated.
+MAX_DETAIL_NODES = 5000
+# Deepest zoom level accepted; its grid has 8 * 2**20 cells per axis.
+MAX_ZOOM = 20
+
+
+class GridIndex:
+
+    def __init__(self, xy, cells=GRID_CELLS):
+        self.xy = xy
+        self.cells = cells
+        self.low = xy.min(axis=0) if len(xy) else np.zeros(2)
+        high = xy.max(axis=0) if len(xy) else np.ones(2)
+        self.cell_size = np.maximum((high - self.low) / cells, 1e-9)
+        cx, cy = self._cell(xy)
+        keys = cx * cells + cy
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def _cell(self, xy):
+        c = np.floor((xy - self.low) / self.cell_size).astype(np.int64)
+        c = np.clip(c, 0, self.cells - 1)
+        return c[:, 0], c[:, 1]
+
+    def query(self, box):
+        """Indices of the nodes inside the box, ascending."""
+        # Clip before the cast: a bound far outside the layout would overflow int64.
+        (cx0, cx1), (cy0, cy1) = [
+            np.clip(np.floor((np.array(bounds) - self.low[axis]) / self.cell_size[axis]),
+                    0, self.cells - 1).astype(np.int64)
+            for axis, bounds in ((0, (box.xmin, box.xmax)), (1, (box.ymin, box.ymax)))
+        ]
+        columns = np.arange(cx0, cx1 + 1) * self.cells
+        starts = np.searchsorted(self.sorted_keys, columns + cy0, side='left')
+        ends = np.searchsorted(self.sorted_keys, columns + cy1, side='right')
+        if not len(starts):
+            return np.array([], dtype=np.int64)
+        candidates = self.order[np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])]
+        xy = self.xy[candidates]
+        inside = ((xy[:, 0] >= box.xmin) & (xy[:, 0] <= box.xmax)
+                  & (xy[:, 1] >= box.ymin) & (xy[:, 1] <= box.ymax))
+        return np.sort(candidates[inside])
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def grid_index(algorithm='spring'):
+    version = graph_store.graph_version()
+    key = (algorithm, version)
+    with _lock:
+        index = _indexes.get(key)
+    if index is not None:
+        return index
+    nodes, positions = layout.positions(algorithm)
+    index = GridIndex(positions * SCALE)
+    with _lock:
+        for stale in [k for k in _indexes if k[0] == algorithm and k[1] != version]:
+            del _indexes[stale]
+        _indexes[key] = index
+    return index
+
+
+def _edge_arrays(view):
+    return np.repeat(np.arange(len(view)), view.out_degree), view.neighbors
+
+
+def _detail(index, view, label_index, box, members):
+    nodes = view.nodes
+    xy = index.xy
+    inside = np.zeros(len(view), dtype=bool)
+    inside[members] = True
+    sources, targets = _edge_arrays(view)
+    touching = np.flatnonzero(inside[sources] | inside[targets])
+
+    node_rows = []
+    for i in members.tolist():
+        code = label_index.codes[i]
+        node_rows.append({
+            "id": str(nodes[i]),
+            "olabel": label_index.labels[code] if code >= 0 else None,
+            "size": 10,
+            "x": float(xy[i, 0]),
+            "y": float(xy[i, 1]),
+        })
+    edge_rows = []
+    for u, v in zip(sources[touching].tolist(), targets[touching].tolist()):
+        edge_rows.append({
+            "source": str(nodes[u]),
+            "target": str(nodes[v]),
+            "weight": 2.5,
+            "startPoint": {"x": float(xy[u, 0]), "y": float(xy[u, 1])},
+            "endPoint": {"x": float(xy[v, 0]), "y": float(xy[v, 1])},
+        })
+    return node_rows, edge_rows
+
+
+def _aggregate(index, view, label_index, box, zoom):
+    # Cell size halves with every zoom level: 8 x 8 cells over the whole
+    # layout at zoom 0.
+    cells = 8 * 2 ** min(max(int(zoom), 0), MAX_ZOOM)
+    xy = index.xy
+    low = index.low
+    size = np.maximum((xy.max(axis=0) - low) / cells, 1e-9)
+    c = np.clip(np.floor((xy - low) / size).astype(np.int64), 0, cells - 1)
+    cell = c[:, 0] * cells + c[:, 1]
+
+    weight = (view.degree + 1).astype(float)
+    occupied, members_cell = np.unique(cell, return_inverse=True)
+    mass = np.bincount(members_cell, weights=weight)
+    cx = np.bincount(members_cell, weights=weight * xy[:, 0]) / mass
+    cy = np.bincount(members_cell, weights=weight * xy[:, 1]) / mass
+    count = np.bincount(members_cell)
+
+    visible = (cx >= box.xmin) & (cx <= box.xmax) & (cy >= box.ymin) & (cy <= box.ymax)
+
+    # Majority label per cell.
+    codes = label_index.codes
+    n_labels = max(len(label_index.labels), 1)
+    labelled = codes >= 0
+    votes = np.zeros((len(occupied), n_labels), dtype=np.int64)
+    np.add.at(votes, (members_cell[labelled], codes[labelled]), 1)
+    majority = votes.argmax(axis=1)
+
+    node_rows = []
+    for k in np.flatnonzero(visible).tolist():
+        node_rows.append({
+            "id": "cell:{}".format(int(occupied[k])),
+            "olabel": label_index.labels[majority[k]] if votes[k].any() else None,
+            "size": int(count[k]),
+            "x": float(cx[k]),
+            "y": float(cy[k]),
+            "aggregated": True,
+        })
+
+    sources, targets = _edge_arrays(view)
+    a, b = members_cell[sources], members_cell[targets]
+    between = a != b
+    pairs, weights = np.unique(np.column_stack([a[between], b[between]]), axis=0, return_counts=True)
+    edge_rows = []
+    for (u, v), w in zip(pairs.tolist(), weights.tolist()):
+        if not (visible[u] or visible[v]):
+            continue
+        edge_rows.append({
+            "source": "cell:{}".format(int(occupied[u])),
+            "target": "cell:{}".format(int(occupied[v])),
+            "weight": int(w),
+            "startPoint": {"x": float(cx[u]), "y": float(cy[u])},
+            "endPoint": {"x": float(cx[v]), "y": float(cy[v])},
+        })
+    return node_rows, edge_rows
+
+
+def viewport(box, zoom, algorithm='spring'):
+    index = grid_index(algorithm)
+    view = sparse.adjacency()
+    label_index = labels.label_index()
+    members = index.query(box)
+
+    aggregated = zoom < DETAIL_ZOOM or len(members) > MAX_DETAIL_NODES
+    if aggregated:
+        node_rows, edge_rows = _aggregate(index, view, label_index, box, zoom)
+    else:
+        node_rows, edge_rows = _detail(index, view, label_index, box, members)
+    return {
+        "zoom": zoom,
+        "aggregated": bool(aggregated),
+        "nodes_in_box": int(len(members)),
+        "nodes": node_rows,
+        "edges": edge_rows,
+    }
@@ -1,3 +1,656 @@
-from django.test import TestCase
+import json
+import os
+import random
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+import networkx as nx
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import aggregates, approximate, backend, benchmark, centrality, epidemics, graph_store, inference, jobs, labels, layout, metrics, parallel, reachability, result_cache, singleflight, snapshot, sparse, views
+
+
+def labelled_digraph(n=300, p=0.02, seed=1):
+    G = nx.gnp_random_graph(n, p, seed=seed, directed=True)
+    labels = ['L1', 'L2', 'L3', 'Unknown']
+    nx.set_node_attributes(G, {node: labels[node % len(labels)] for node in G}, 'label')
+    return G
+
+
+class SparseEquivalenceTests(SimpleTestCase):
+
+    def setUp(self):
+        self.G = labelled_digraph()
+        self.view = sparse.SparseView.from_graph(self.G)
+
+    def test_eigenvector_centrality_matches_networkx(self):
+        expected = nx.eigenvector_centrality(self.G)
+        actual = self.view.to_dict(sparse.eigenvector_centrality(self.view))
+        for node, value in expected.items():
+            self.assertAlmostEqual(actual[node], value, delta=1e-9)
+
+    def test_degree_arrays_match_networkx(self):
+        self.assertEqual(self.view.to_dict(self.view.in_degree), dict(self.G.in_degree()))
+        self.assertEqual(self.view.to_dict(self.view.out_degree), dict(self.G.out_degree()))
+        self.assertEqual(self.view.to_dict(sparse.degree_centrality(self.view)), nx.degree_centrality(self.G))
+
+    def test_degree_histogram_matches_networkx(self):
+        histogram = dict(sparse.degree_histogram(self.view))
+        expected = {d: c for d, c in enumerate(nx.degree_histogram(self.G)) if c}
+        self.assertEqual(histogram, expected)
+
+    def test_density_and_assortativity_match_networkx(self):
+        self.assertEqual(sparse.density(self.view), nx.density(self.G))
+        self.assertTrue(np.isclose(sparse.degree_assortativity(self.view),
+                                   nx.degree_pearson_correlation_coefficient(self.G)))
+
+
+class MetricsEngineTests(SimpleTestCase):
+
+    def test_path_and_triangle_summaries_match_networkx(self):
+        G = labelled_digraph()
+        paths = metrics.path_summary(sparse.SparseView.from_graph(G))
+        # The graph is not strongly connected: like the original endpoint,
+        # both path statistics run over every reachable ordered pair (and
+        # the zero distance of every node to itself).
+        lengths = [d for _, row in nx.shortest_path_length(G) for d in row.values()]
+        self.assertEqual(paths.diameter, max(lengths))
+        self.assertAlmostEqual(paths.average_shortest_path_length, sum(lengths) / len(lengths), delta=1e-12)
+
+        triangles = metrics.triangle_summary(G)
+        self.assertAlmostEqual(triangles.average_clustering, nx.average_clustering(G), delta=1e-12)
+        self.assertAlmostEqual(triangles.transitivity, nx.transitivity(G), delta=1e-12)
+        for node, value in nx.clustering(G).items():
+            self.assertAlmostEqual(triangles.clustering[node], value, delta=1e-12)
+
+
+class ParallelSweepTests(SimpleTestCase):
+
+    def test_pool_sweep_matches_networkx(self):
+        G = labelled_digraph()
+        view = sparse.SparseView.from_graph(G)
+        sweep = parallel.all_pairs_sweep(view, with_betweenness=True, workers=2)
+        for node, value in nx.betweenness_centrality(G).items():
+            self.assertAlmostEqual(sweep.betweenness[node], value, delta=1e-9)
+        closeness = metrics.closeness_from_accumulators(sweep.nodes, sweep.dist_to, sweep.reach_to)
+        for node, value in nx.closeness_centrality(G).items():
+            self.assertAlmostEqual(closeness[node], value, delta=1e-9)
+
+
+class TopKSelectionTests(SimpleTestCase):
+
+    def test_ties_keep_the_order_of_a_full_sort(self):
+        rng = np.random.default_rng(8)
+        for values in (rng.integers(0, 5, size=200).astype(float), np.zeros(10), np.arange(10.0)):
+            expected = sorted(range(len(values)), key=values.__getitem__, reverse=True)
+            for k in (0, 1, 3, 7, 50, len(values), len(values) + 5):
+                self.assertEqual(centrality.top_k_indices(values, k).tolist(), expected[:k])
+
+
+class ApproximateCentralityTests(SimpleTestCase):
+
+    def test_error_bounds_need_two_samples(self):
+        G = labelled_digraph()
+        graph = backend.CompactGraph.from_networkx(G)
+        single = approximate.approximate_centrality(graph, k=1, seed=3)
+        self.assertTrue(all(e is None for e in single.closeness_error.values()))
+        self.assertTrue(all(e is None for e in single.betweenness_error.values()))
+
+        estimate = approximate.approximate_centrality(graph, k=2, seed=3)
+        pivots = set(approximate.sample_sources(G, 2, seed=3))
+        for node in G:
+            has_bound = estimate.betweenness_error[node] is not None
+            self.assertEqual(has_bound, node not in pivots)
+            self.assertEqual(estimate.closeness_error[node] is not None, has_bound)
+
+        exact = nx.betweenness_centrality(G)
+        full = approximate.approximate_centrality(graph, k=len(G), seed=3)
+        for node, value in exact.items():
+            self.assertAlmostEqual(full.betweenness[node], value, delta=1e-9)
+
+
+class GraphBackendTests(SimpleTestCase):
+
+    def test_compact_graph_matches_the_networkx_adapter(self):
+        G = labelled_digraph()
+        G.add_node('isolated')
+        compact, adapter = backend.CompactGraph.from_networkx(G), backend.NetworkXGraph(G)
+        self.assertEqual(compact.nodes, adapter.nodes)
+        self.assertEqual(compact.node_labels(), adapter.node_labels())
+        self.assertEqual(compact.labels, adapter.labels)
+        self.assertEqual(compact.number_of_edges(), adapter.number_of_edges())
+        for name in ('offsets', 'neighbors', 'label_codes'):
+            np.testing.assert_array_equal(getattr(compact, name), getattr(adapter, name))
+        for a, b in zip(compact.edges(), adapter.edges()):
+            self.assertEqual(a.tolist(), b.tolist())
+        np.testing.assert_array_equal(compact.in_degree, adapter.in_degree)
+        for i in range(len(compact)):
+            self.assertEqual(compact.successors(i).tolist(), adapter.successors(i).tolist())
+            self.assertEqual(sorted(compact.predecessors(i).tolist()), sorted(adapter.predecessors(i).tolist()))
+        self.assertEqual(compact.ids([compact.position('isolated')]), ['isolated'])
+
+
+class SnapshotRoundTripTests(SimpleTestCase):
+
+    def test_snapshot_rebuilds_the_excel_graph(self):
+        import pandas as pd
+
+        rng = np.random.default_rng(12)
+        edges = pd.DataFrame({'sourceNodeId': rng.integers(1000, 1300, size=3000),
+                              'targetNodeId': rng.integers(1000, 1300, size=3000)})
+        # Repeated NodeIds (the last label wins), ids without edges, and unlabelled nodes.
+        nodes = pd.DataFrame({'NodeId': list(range(1000, 1250)) + [1001, 5000],
+                              'Labels': ['L{}'.format(i % 4) for i in range(250)] + ['L9', 'L1']})
+        expected = nx.from_pandas_edgelist(edges, 'sourceNodeId', 'targetNodeId', create_using=nx.DiGraph())
+        nx.set_node_attributes(expected, nodes.set_index('NodeId')['Labels'].to_dict(), 'label')
+
+        out_dir = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        self.addCleanup(shutil.rmtree, os.path.dirname(out_dir))
+        labels_by_id = nodes.drop_duplicates('NodeId', keep='last').set_index('NodeId')['Labels']
+        meta = snapshot.write_snapshot(edges['sourceNodeId'].to_numpy(), edges['targetNodeId'].to_numpy(),
+                                       labels_by_id, 'v1', out_dir)
+        self.assertEqual((meta['nodes'], meta['edges']), (len(expected), expected.number_of_edges()))
+
+        loaded = snapshot.load_snapshot(out_dir)
+        self.assertEqual(loaded.source_version, 'v1')
+        G = snapshot.to_networkx(loaded)
+        self.assertEqual(list(G.nodes(data=True)), list(expected.nodes(data=True)))
+        self.assertEqual(list(G.edges()), list(expected.edges()))
+
+        with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+            json.dump(dict(meta, format=snapshot.FORMAT_VERSION + 1), f)
+        self.assertIsNone(snapshot.load_snapshot(out_dir))
+
+
+class LayoutWarmStartTests(SimpleTestCase):
+
+    def test_existing_nodes_keep_their_positions(self):
+        G = labelled_digraph()
+        view = sparse.SparseView.from_graph(G)
+        rng = np.random.default_rng(9)
+        # An older layout of most of the nodes, in another order, plus one that is gone since.
+        previous_ids = np.array(list(rng.permutation(view.nodes)[:250]) + [-1])
+        previous_positions = rng.uniform(-5, 5, size=(len(previous_ids), 2))
+
+        positions, known = layout._warm_start(view, previous_ids, previous_positions, np.random.default_rng(0))
+        self.assertEqual(positions.shape, (len(view), 2))
+        self.assertEqual(known, 250)
+        old = dict(zip(previous_ids.tolist(), previous_positions))
+        for i, node in enumerate(view.nodes):
+            if node in old:
+                np.testing.assert_array_equal(positions[i], old[node])
+            else:
+                # A new node starts next to a placed neighbour when it has one.
+                neighbours = [j for j in view.neighbors[view.offsets[i]:view.offsets[i + 1]].tolist()
+                              if view.nodes[j] in old]
+                if neighbours:
+                    self.assertLess(np.abs(positions[i] - positions[neighbours[0]]).max(), 0.1)
+
+
+class ReachabilityTests(SimpleTestCase):
+
+    def test_components_pairs_and_diameters_match_networkx(self):
+        G = nx.gnp_random_graph(800, 0.003, seed=1, directed=True)
+        view = sparse.SparseView.from_graph(G)
+        r = reachability.Reachability(view)
+        position = {node: i for i, node in enumerate(view.nodes)}
+        self.assertEqual(r.reachable_pairs, sum(len(nx.descendants(G, node)) for node in G))
+        self.assertTrue(all(r.component[position[u]] <= r.component[position[v]] for u, v in G.edges))
+
+        components = list(nx.strongly_connected_components(G))
+        self.assertEqual(len(r), len(components))
+        largest = max(components, key=len)
+        self.assertEqual(set(r.members(r.largest).tolist()), {position[node] for node in largest})
+        expected = nx.eccentricity(G.subgraph(largest))
+        self.assertEqual(r.diameters[r.largest], max(expected.values()))
+        ecc = r.eccentricities(r.largest)
+        self.assertEqual(dict(zip(ecc.nodes, ecc.values.tolist())), expected)
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def test_concurrent_calls_share_one_computation(self):
+        group = singleflight.Group()
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+
+        threads = [threading.Thread(target=lambda: results.append(group.do('key', compute))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [(42, False)] + [(42, True)] * 4)
+
+
+class LabelPropagationTests(SimpleTestCase):
+
+    def test_unknown_nodes_take_the_labels_around_them(self):
+        G = nx.DiGraph([(0, 1), (1, 2), (3, 0), (4, 5), (5, 4)])
+        nx.set_node_attributes(G, {0: 'L1', 1: 'Unknown', 2: 'L2', 3: 'Unknown', 4: 'Unknown', 5: 'Unknown'}, 'label')
+        view = sparse.SparseView.from_graph(G)
+        prediction, _ = inference.propagate(view, labels.LabelIndex.from_graph(G, view.nodes))
+
+        predicted = {view.nodes[i]: (prediction.labels[label] if label >= 0 else None, confidence)
+                     for i, label, confidence in zip(prediction.unknown, prediction.label, prediction.confidence)}
+        self.assertEqual(predicted[3], ('L1', 1.0))
+        self.assertAlmostEqual(predicted[1][1], 0.5)
+        self.assertEqual(predicted[4], (None, 0.0))
+
+
+class EpidemicResamplingTests(SimpleTestCase):
+
+    def test_grid_takes_the_state_after_the_last_event(self):
+        t = np.array([0.0, 0.5, 0.5, 2.0, 3.5])
+        infected = np.array([1, 2, 3, 2, 0])
+        grid, (sampled,) = epidemics.resample(t, (infected,), 5)
+        np.testing.assert_allclose(grid, [0.0, 0.875, 1.75, 2.625, 3.5])
+        self.assertEqual(sampled.tolist(), [1, 3, 3, 2, 0])
+
+        grid, (sampled,) = epidemics.resample(t, (infected,), 3, end=10.0)
+        self.assertEqual((grid.tolist(), sampled.tolist()), ([0.0, 5.0, 10.0], [1, 0, 0]))
+
+
+class EpidemicBatchTests(SimpleTestCase):
+
+    def test_seeded_runs_are_deterministic_and_keep_every_node(self):
+        view = sparse.SparseView.from_graph(labelled_digraph())
+        initial = np.arange(10)
+        for model in epidemics.MODELS:
+            first = epidemics.simulate(view, model, 0.5, 0.3, initial, runs=40, tmax=5.0, dt=0.1, points=11, seed=7)
+            again = epidemics.simulate(view, model, 0.5, 0.3, initial, runs=40, tmax=5.0, dt=0.1, points=11, seed=7,
+                                       workers=2)
+            for name in epidemics.MODELS[model]:
+                np.testing.assert_array_equal(first.mean[name], again.mean[name])
+            np.testing.assert_allclose(sum(first.mean.values()), len(view))
+            self.assertEqual(first.mean['I'][0], len(initial))
+            self.assertGreater(first.mean['S'][0], first.mean['S'][-1])
+
+
+class AggregateUpdateTests(SimpleTestCase):
+
+    def assertSameAggregates(self, incremental, fresh):
+        self.assertEqual(incremental.degree_histogram(), fresh.degree_histogram())
+        self.assertEqual(incremental.label_counts(), fresh.label_counts())
+        for key, value in fresh.summary().items():
+            self.assertAlmostEqual(incremental.summary()[key], value, delta=1e-9)
+        expected = fresh.label_statistics()
+        actual = incremental.label_statistics()
+        self.assertEqual(list(actual), list(expected))
+        for label, row in expected.items():
+            for a, b in zip(actual[label], row):
+                self.assertAlmostEqual(a, b, delta=1e-9)
+
+    def test_incremental_updates_match_a_rebuild(self):
+        G = labelled_digraph(n=120, p=0.05)
+        # Triangle records built from the arrays before any edit, and
+        # built from the edited DiGraph after the last one.
+        incremental, lazy = aggregates.Aggregates.from_networkx(G), aggregates.Aggregates.from_networkx(G)
+        incremental.summary()
+        rng = random.Random(3)
+        for step in range(40):
+            nodes = list(G)
+            kind = step % 5
+            if kind == 0:
+                edit = {'op': 'add_edges', 'edges': [(rng.choice(nodes), rng.choice(nodes)) for _ in range(5)]}
+            elif kind == 1:
+                edit = {'op': 'remove_edges', 'edges': rng.sample(list(G.edges()), 5)}
+            elif kind == 2:
+                edit = {'op': 'add_nodes', 'nodes': [{'id': 1000 + step, 'label': 'L9'}]}
+            elif kind == 3:
+                edit = {'op': 'remove_nodes', 'nodes': rng.sample(nodes, 2)}
+            else:
+                edit = {'op': 'set_labels', 'labels': [{'id': node, 'label': rng.choice(['L1', 'L9'])}
+                                                       for node in rng.sample(nodes, 3)]}
+            edited = G.copy()
+            change = graph_store.apply_edit(edited, edit)
+            incremental.update(G, edited, change)
+            lazy.update(G, edited, change)
+            G = edited
+            self.assertSameAggregates(incremental, aggregates.Aggregates.from_networkx(G))
+        self.assertSameAggregates(lazy, aggregates.Aggregates.from_networkx(G))
+
+    def test_invalid_edit_leaves_the_graph_unchanged(self):
+        G = labelled_digraph(n=50)
+        before = (list(G.nodes(data=True)), list(G.edges()))
+        with self.assertRaises(ValueError):
+            graph_store.apply_edit(G, {'op': 'remove_nodes', 'nodes': [0, 'missing']})
+        with self.assertRaises(ValueError):
+            graph_store.apply_edit(G, {'op': 'set_labels', 'labels': [
+                {'id': node, 'label': 'X{}'.format(node)} for node in range(graph_store.MAX_LABELS)]})
+        self.assertEqual((list(G.nodes(data=True)), list(G.edges())), before)
+
+
+class EditLogTests(SimpleTestCase):
+
+    def test_workers_reread_a_rotated_log(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        snapshot_dir, edits_path = os.path.join(work_dir, 'snapshot'), os.path.join(work_dir, 'edits.jsonl')
+        benchmark.synthetic_dataset(500, snapshot_dir, seed=5, tag=self.id())
+        first = benchmark.SnapshotStore(snapshot_dir, edits_path)
+        second = benchmark.SnapshotStore(snapshot_dir, edits_path)
+        first.edit({'op': 'add_nodes', 'nodes': [{'id': 10 ** 15, 'label': 'L1'}]})
+        self.assertIn(10 ** 15, second.get())
+
+        # The new log is shorter than what `second` has read of the old one.
+        os.remove(edits_path)
+        first.edit({'op': 'add_nodes', 'nodes': [{'id': -1}]})
+        self.assertIn(-1, second.get())
+
+
+class GraphEditPermissionTests(SimpleTestCase):
+
+    def test_only_staff_can_edit(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        benchmark.synthetic_dataset(2000, os.path.join(work_dir, 'snapshot'), seed=5, tag=self.id())
+        body = {'nodes': [{'id': 2 ** 40, 'label': 'L1'}]}
+        with benchmark.synthetic_store(os.path.join(work_dir, 'snapshot'), work_dir):
+            anonymous = Client().post('/api/v1/graph/nodes/', body, content_type='application/json')
+            request = APIRequestFactory().post('/api/v1/graph/nodes/', body, format='json')
+            force_authenticate(request, user=User(username='staff', is_staff=True))
+            staff = views.graph_nodes(request)
+        self.assertIn(anonymous.status_code, (401, 403))
+        self.assertEqual(staff.status_code, 200)
+        self.assertEqual(staff.data['changed_nodes'], 1)
+
+
+class BenchmarkHarnessTests(SimpleTestCase):
+
+    def test_synthetic_edges_are_distinct(self):
+        src, dst, labels_by_id = benchmark.synthetic_edges(5000, seed=1)
+        self.assertEqual(len(set(zip(src.tolist(), dst.tolist()))), 5000)
+        self.assertFalse((src == dst).any())
+        self.assertTrue(set(src.tolist()) | set(dst.tolist()) <= set(labels_by_id.index.tolist()))
+
+    def test_report_times_computations_and_views(self):
+        report = benchmark.run(sizes=[2000], only=['degree', 'label_index'])
+        size = report['sizes']['2000']
+        self.assertEqual(size['edges'], 2000)
+        self.assertIn('peak_bytes', size['computations']['centrality.degree'])
+        self.assertIn('seconds', size['computations']['label_index'])
+        self.assertIn('seconds', size['views']['degree_distribution'])
+        self.assertIn('seconds', size['views']['label_degree_distribution'])
+        self.assertNotIn('general_statistical_info', size['views'])
+
+    def test_startup_leaves_heavy_libraries_unloaded(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        benchmark.synthetic_dataset(2000, os.path.join(work_dir, 'snapshot'), seed=4, tag=self.id())
+        report = benchmark.startup(os.path.join(work_dir, 'snapshot'), work_dir, repeats=1)
+        self.assertEqual(report['cold']['heavy_modules'], [])
+        self.assertIn('preload_seconds', report['preload'])
+        self.assertEqual(list(report['cold']['first_request']), [name for name, _ in benchmark.STARTUP_VIEWS])
+
+
+class CommunityEndpointTests(SimpleTestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        benchmark.synthetic_dataset(2000, os.path.join(self.work_dir, 'snapshot'), seed=6, tag=self.id())
+
+    def test_partition_endpoints_agree(self):
+        client = Client()
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir):
+            nodes = len(sparse.adjacency())
+            membership = client.get('/api/v1/communities/membership/?seed=1').json()
+            sizes = client.get('/api/v1/communities/sizes/?seed=1').json()
+            modularity = client.get('/api/v1/communities/modularity/?seed=1').json()
+            weights = client.get('/api/v1/community_weight/?seed=1').json()
+            members = client.get('/api/v1/communities/membership/?seed=1&community=0').json()
+        self.assertEqual(len(membership), nodes)
+        self.assertEqual(sum(row['size'] * row['count'] for row in sizes), nodes)
+        self.assertEqual(modularity['communities'], sum(row['count'] for row in sizes))
+        self.assertEqual(len(set(row['community'] for row in membership)), modularity['communities'])
+        self.assertTrue(-0.5 <= modularity['modularity'] <= 1)
+        self.assertEqual(weights, [{'#Communities': row['count'], 'Weight': row['size']} for row in sizes])
+        self.assertEqual(sorted(members['members']),
+                         sorted(row['node'] for row in membership if row['community'] == 0))
+
+    def test_invalid_parameters_are_rejected(self):
+        client = Client()
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir):
+            for path in ('community_weight/', 'communities/membership/', 'communities/modularity/',
+                         'communities/sizes/', 'predicted_labels/'):
+                for query in ('resolution=nan', 'resolution=inf', 'resolution=0', 'resolution=x', 'seed=1.5'):
+                    response = client.get('/api/v1/{}?{}'.format(path, query))
+                    self.assertEqual(response.status_code, 400, (path, query))
+            response = client.get('/api/v1/communities/membership/?community=100000')
+            self.assertEqual(response.status_code, 400)
+
+
+class GraphPayloadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        benchmark.synthetic_dataset(2000, os.path.join(self.work_dir, 'snapshot'), seed=9, tag=self.id())
+
+    def decode(self, payload):
+        """The binary payload back as (header, {name: array}), checking its layout."""
+        (length,) = struct.unpack_from('<I', payload)
+        self.assertEqual((4 + length) % 8, 0)
+        header = json.loads(payload[4:4 + length])
+        arrays = {}
+        end = 4 + length
+        for name, dtype, offset, count in header['arrays']:
+            self.assertEqual(offset % 8, 0)
+            self.assertGreaterEqual(offset, end)
+            arrays[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+            end = offset + arrays[name].nbytes
+        self.assertEqual(len(payload) - end, (-end) % 8)
+        self.assertEqual([name for name, *_ in header['arrays']], ['ids', 'x', 'y', 'label', 'source', 'target'])
+        return header, arrays
+
+    def test_every_format_carries_the_full_document(self):
+        client = Client()
+        url = '/api/v1/convert_graph/?layout=forceatlas2'
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir):
+            full = client.get(url).json()
+            streamed = json.loads(b''.join(client.get(url + '&stream=1').streaming_content))
+            columnar = client.get(url + '&payload=columnar').json()
+            response = client.get(url + '&payload=binary')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(streamed, full)
+
+        header, arrays = self.decode(response.content)
+        self.assertEqual((header['nodes'], header['edges']), (len(full['nodes']), len(full['edges'])))
+        self.assertEqual(header['labels'], columnar['labels'])
+        self.assertEqual([str(node) for node in arrays['ids'].tolist()], columnar['ids'])
+        self.assertEqual(arrays['label'].tolist(), columnar['label'])
+        self.assertEqual(arrays['source'].tolist(), columnar['source'])
+        self.assertEqual(arrays['target'].tolist(), columnar['target'])
+        np.testing.assert_allclose(arrays['x'], columnar['x'], rtol=1e-6, atol=1e-3)
+        np.testing.assert_allclose(arrays['y'], columnar['y'], rtol=1e-6, atol=1e-3)
+
+        labels = columnar['labels']
+        for i, row in enumerate(full['nodes']):
+            code = columnar['label'][i]
+            self.assertEqual(row, {'id': columnar['ids'][i], 'olabel': labels[code] if code >= 0 else None,
+                                   'size': columnar['size'], 'x': columnar['x'][i], 'y': columnar['y'][i]})
+        for edge, u, v in zip(full['edges'], columnar['source'], columnar['target']):
+            self.assertEqual((edge['source'], edge['target']), (columnar['ids'][u], columnar['ids'][v]))
+            self.assertEqual(edge['startPoint'], {'x': columnar['x'][u], 'y': columnar['y'][u]})
+            self.assertEqual(edge['endPoint'], {'x': columnar['x'][v], 'y': columnar['y'][v]})
+            self.assertEqual(edge['weight'], columnar['weight'])
+
+
+class ViewportTests(SimpleTestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        benchmark.synthetic_dataset(2000, os.path.join(self.work_dir, 'snapshot'), seed=8, tag=self.id())
+
+    def get(self, client, **params):
+        return client.get('/api/v1/viewport/', dict(layout='forceatlas2', **params))
+
+    def test_boxes_select_the_nodes_inside(self):
+        client = Client()
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir):
+            nodes = len(sparse.adjacency())
+            everything = self.get(client, xmin=-1e300, ymin=-1e300, xmax=1e300, ymax=1e300, zoom=0).json()
+            self.assertEqual(everything['nodes_in_box'], nodes)
+            self.assertTrue(everything['aggregated'])
+            self.assertEqual(sum(row['size'] for row in everything['nodes']), nodes)
+
+            detail = self.get(client, xmin=0, ymin=0, xmax=300, ymax=300, zoom=5).json()
+            self.assertFalse(detail['aggregated'])
+            self.assertGreater(detail['nodes_in_box'], 0)
+            self.assertEqual(len(detail['nodes']), detail['nodes_in_box'])
+            self.assertTrue(all(0 <= row['x'] <= 300 and 0 <= row['y'] <= 300 for row in detail['nodes']))
+
+            for params in ({'xmin': 'inf'}, {'ymax': 'nan'}, {'xmin': 5, 'xmax': 1}, {'zoom': 21}, {'zoom': -1}):
+                box = dict(dict(xmin=-1, ymin=-1, xmax=1, ymax=1), **params)
+                self.assertEqual(self.get(client, **box).status_code, 400, params)
+
+
+class ResultCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        benchmark.synthetic_dataset(2000, os.path.join(self.work_dir, 'snapshot'), seed=10, tag=self.id())
+        settings = override_settings(ANALYSIS_CACHE_GENERATION_FILE=os.path.join(self.work_dir, 'generation.json'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_etags_generations_and_graph_versions(self):
+        client = Client()
+        url = '/api/v1/top_nodes/degree/'
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir) as store:
+            first = client.get(url)
+            self.assertEqual((first.status_code, first['X-Cache']), (200, 'MISS'))
+            etag = first['ETag']
+
+            revalidated = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((revalidated.status_code, revalidated['X-Cache']), (304, 'HIT'))
+            self.assertEqual(revalidated.content, b'')
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+            # Parameters that do not change the result share the entry.
+            self.assertEqual(client.get(url + '?async=0')['X-Cache'], 'HIT')
+            self.assertEqual(client.get(url + '?k=3')['X-Cache'], 'MISS')
+
+            result_cache.invalidate(['node_labels'])
+            self.assertEqual(client.get(url)['X-Cache'], 'HIT')
+            result_cache.invalidate(['top_nodes'])
+            self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+            result_cache.invalidate()
+            self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+            with open(os.path.join(self.work_dir, 'generation.json')) as f:
+                self.assertEqual(json.load(f), {'node_labels': 1, 'top_nodes': 1, '*': 1})
+
+            hub = first.json()[0]['node']
+            store.edit({'op': 'add_nodes', 'nodes': [{'id': node} for node in range(-1, -51, -1)]})
+            store.edit({'op': 'add_edges', 'edges': [(node, hub) for node in range(-1, -51, -1)]})
+            edited = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((edited.status_code, edited['X-Cache']), (200, 'MISS'))
+            self.assertNotEqual(edited['ETag'], etag)
+            self.assertNotEqual(edited.json(), first.json())
+
+
+class _DeferredPool:
+    """Takes job submissions without running them; the test runs them in-process."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        return Future()
+
+
+class JobTests(TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        benchmark.synthetic_dataset(2000, os.path.join(self.work_dir, 'snapshot'), seed=11, tag=self.id())
+        self.pool = _DeferredPool()
+        patcher = mock.patch.object(jobs, '_get_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_submit_deduplicate_and_serve_the_result(self):
+        client = Client()
+        url = '/api/v1/top_nodes/degree/?k=3'
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir):
+            first = client.get(url + '&async=1')
+            self.assertEqual(first.status_code, 202)
+            job = first.json()
+            self.assertEqual((job['status'], job['endpoint']), ('queued', 'top_nodes'))
+            self.assertEqual(first['Location'], job['url'])
+
+            again = client.get(url + '&async=1')
+            self.assertEqual((again.status_code, again.json()['id']), (202, job['id']))
+            self.assertEqual(self.pool.submitted, [(uuid.UUID(job['id']),)])
+            self.assertEqual(client.get(job['url']).json()['status'], 'queued')
+
+            done = Future()
+            done.set_result(jobs.run(uuid.UUID(job['id'])))
+            jobs._job_done(uuid.UUID(job['id']), 'top_nodes', done)
+            finished = client.get(job['url'])
+            self.assertEqual(finished.status_code, 200)
+            self.assertEqual((finished.json()['status'], finished.json()['progress']), ('done', 100))
+            # The submitting process caches the result for plain requests.
+            plain = client.get(url)
+            self.assertEqual(plain['X-Cache'], 'HIT')
+            self.assertEqual(finished.json()['result'], plain.json())
+
+            # A finished job no longer absorbs submissions.
+            self.assertNotEqual(client.get(url + '&async=1').json()['id'], job['id'])
+            self.assertEqual(len(self.pool.submitted), 2)
+
+    def test_unknown_job(self):
+        response = Client().get('/api/v1/jobs/{}/'.format(uuid.uuid4()))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+
+class InstrumentationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        # A version of its own per test, so no result is cached yet.
+        benchmark.synthetic_dataset(2000, os.path.join(self.work_dir, 'snapshot'), seed=3, tag=self.id())
+
+    def test_requests_are_logged_and_counted(self):
+        client = Client()
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir):
+            with self.assertLogs('analysis.requests', 'INFO') as logs:
+                self.assertEqual(client.get('/api/v1/top_nodes/degree/').status_code, 200)
+                self.assertEqual(client.get('/api/v1/top_nodes/degree/').status_code, 200)
+        first, second = (json.loads(line.split(':', 2)[2]) for line in logs.output)
+        self.assertEqual((first['view'], first['cache'], second['cache']), ('top_nodes', 'MISS', 'HIT'))
+        self.assertTrue({'load', 'centrality.degree', 'view', 'serialization'} <= set(first['phases']))
+
+        text = client.get('/metrics').content.decode()
+        self.assertIn('analysis_result_cache_requests_total{route="api/v1/top_nodes/<str:measure>/",outcome="hit"}', text)
+        self.assertIn('analysis_phase_duration_seconds_count{phase="centrality.degree"}', text)
+
+    @override_settings(ANALYSIS_PROFILE=True)
+    def test_profile_bypasses_the_result_cache(self):
+        client = Client()
+        with benchmark.synthetic_store(os.path.join(self.work_dir, 'snapshot'), self.work_dir):
+            self.assertEqual(client.get('/api/v1/top_nodes/degree/')['X-Cache'], 'MISS')
+            response = client.get('/api/v1/top_nodes/degree/?profile=1')
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual(response.json()['status'], 200)
+        self.assertIn('centrality.py', response.json()['profile'])
@@ -1,17 +1,30 @@
 from django.contrib import admin
 from django.urls import path, include
-from .views import *
+from . import views
 
 urlpatterns = [
-    path('general_statistical_info/', general_statistical_info, name="get general statistical information"),
-    path('top_5_nodes_based_on_several_measures/', top_5_nodes_based_on_several_measures, name="get top five nodes table"),
-    path('degree_distribution/', degree_distribution, name='plot degree distribution'),
-    path('community_weight/', community_weight, name='get community with their weight'),
-    path('node_labels/', node_labels, name='get the percent of nodes for each label'),
-    path('label_clustering/', label_clustering, name='get average CC for nodes for each label'),
-    path('label_degree_values/', label_degree_values, name='get degree values for nodes for each label'),
-    path('label_degree_distribution/<str:label>/', label_degree_distribution, name='get the degree distribution for each label'),
-    path('sis_epidemic/', sis_epidemic, name='plot SIS epidemic'),
-    path('sir_epidemic/', sir_epidemic, name='plot SIR epidemic'),
-    path('convert_graph/', convert_graph, name='convert graph to desired format to pass to UI.'),
+    path('general_statistical_info/', views.general_statistical_info, name="get general statistical information"),
+    path('top_5_nodes_based_on_several_measures/', views.top_5_nodes_based_on_several_measures, name="get top five nodes table"),
+    path('top_nodes/<str:measure>/', views.top_nodes, name='get top k nodes for one centrality measure'),
+    path('degree_distribution/', views.degree_distribution, name='plot degree distribution'),
+    path('community_weight/', views.community_weight, name='get community with their weight'),
+    path('communities/membership/', views.community_membership, name='get the community of every node, or the members of one community'),
+    path('communities/modularity/', views.community_modularity, name='get the modularity of the community partition'),
+    path('communities/sizes/', views.community_sizes, name='get the community size distribution'),
+    path('reachability/', views.reachability_summary, name='get the strongly connected components, reachable pairs and largest component diameter'),
+    path('reachability/components/', views.reachability_components, name='get the size, diameter and reach of the largest strongly connected components'),
+    path('reachability/eccentricities/', views.reachability_eccentricities, name='get the eccentricity of every node of a strongly connected component'),
+    path('graph/edges/', views.graph_edges, name='add or remove edges'),
+    path('graph/nodes/', views.graph_nodes, name='add or remove nodes'),
+    path('graph/labels/', views.graph_labels, name='set node labels'),
+    path('node_labels/', views.node_labels, name='get the percent of nodes for each label'),
+    path('label_clustering/', views.label_clustering, name='get average CC for nodes for each label'),
+    path('label_degree_values/', views.label_degree_values, name='get degree values for nodes for each label'),
+    path('label_degree_distribution/<str:label>/', views.label_degree_distribution, name='get the degree distribution for each label'),
+    path('predicted_labels/', views.predicted_labels, name='get the labels inferred for the Unknown nodes'),
+    path('sis_epidemic/', views.sis_epidemic, name='plot SIS epidemic'),
+    path('sir_epidemic/', views.sir_epidemic, name='plot SIR epidemic'),
+    path('convert_graph/', views.convert_graph, name='convert graph to desired format to pass to UI.'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='get the status and result of a job'),
+    path('viewport/', views.viewport, name='get the nodes and edges inside a bounding box of the layout'),
 ]
\ No newline at end of file
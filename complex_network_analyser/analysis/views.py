@@ -1,142 +1,131 @@
-from django.shortcuts import render
-from rest_framework.decorators import api_view
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-import pandas as pd
-import os
-import networkx as nx
-import statistics
-from itertools import chain
-from collections import Counter, defaultdict
-from operator import itemgetter
-import pickle
-import json
-import community as louvain_community
-import EoN
-
-def read_data():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    edges_path = os.path.join(base_dir, 'data', 'edges.xlsx')
-    nodes_path = os.path.join(base_dir, 'data', 'nodes.xlsx')
-
-    data = pd.read_excel(edges_path)
-    G = nx.from_pandas_edgelist(data, 'sourceNodeId', 'targetNodeId', create_using=nx.DiGraph())
-
-    labels_df = pd.read_excel(nodes_path)
-    labels_dict = labels_df.set_index('NodeId')['Labels'].to_dict()
-    nx.set_node_attributes(G, labels_dict, 'label')
-    return G
+import numpy as np
+import logging
+import math
 
+from .models import Job
 
-@api_view(['GET'])
-def general_statistical_info(request):
-    if request.method == 'GET':
-        G = read_data()
-        print(f"THE G IS {G}")
-
-        number_of_nodes = G.number_of_nodes()
-        avg_in_degree_value = sum(d for n, d in G.in_degree()) / float(number_of_nodes)
-        print(f"The average in degree in the graph network is: {avg_in_degree_value}")
+# The analysis subsystems (and scipy, networkx, ... behind them) are
+# imported by the views that use them, so importing the URLconf stays cheap.
+from . import graph_store, instrumentation, jobs, result_cache
 
-        avg_out_degree_value = sum(d for n, d in G.out_degree()) / float(number_of_nodes)
-        print(f"The average out degree in the graph network is: {avg_out_degree_value}")
+logger = logging.getLogger(__name__)
 
-        network_diameter = max([max(j.values()) for (i,j) in nx.shortest_path_length(G)])
 
-        path_lengths = (y.values() for (x, y) in nx.shortest_path_length(G))
-        average_shortest_path_length = statistics.mean(chain.from_iterable(path_lengths))
-
-        N = G.order()
-        sum_in_degrees = sum(d for n, d in G.in_degree())
-        max_in = max(d for n, d in G.in_degree())
-        centralization = float(N * max_in - sum_in_degrees) / (N - 1) ** 2
+@api_view(['GET'])
+@instrumentation.instrumented('general_statistical_info')
+@jobs.asynchronous('general_statistical_info')
+@result_cache.cached('general_statistical_info')
+def general_statistical_info(request):
+    from . import aggregates, backend, metrics, sparse
 
-        result = {
-            "nodes_count": G.number_of_nodes(),
-            "edges_count": G.number_of_edges(),
-            "avg_in_degree": float("{:.6f}".format(avg_in_degree_value)),
-            "avg_out_degree": float("{:.6f}".format(avg_out_degree_value)) ,
-            "density": float("{:.6f}".format(nx.density(G))),
-            "diameter": network_diameter,
-            "avg_shortest_path_length": float("{:.6f}".format(average_shortest_path_length)),
-            "avg_cc": float("{:.6f}".format(nx.average_clustering(G))),
-            "transitivity": float("{:.6f}".format(nx.transitivity(G))),
-            "assortiativity": float("{:.6f}".format(nx.degree_pearson_correlation_coefficient(G))),
-            "degree_centralization": float("{:.6f}".format(centralization))
-        }
-        print("+++++++++++++++++++++ END ++++++++++++++++++++++++")
+    if request.method == 'GET':
+        G = backend.networkx().graph
+        result = metrics.general_statistics(G, sparse.adjacency(), aggregates.current())
         return Response(result, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('convert_graph')
+@jobs.asynchronous('convert_graph')
+@result_cache.cached('convert_graph')
 def convert_graph(request):
-    G = read_data()
-    pos = nx.spring_layout(G)
-    data = {"nodes": [], "edges": []}
-    for node in G.nodes:
-        data["nodes"].append({
-            "id": str(node),
-            "olabel": G.nodes[node]["label"],
-            "size": 10,
-            "x": pos[node][0] * 1000,
-            "y": pos[node][1] * 1000
-        })
-    for edge in G.edges:
-        data["edges"].append({
-            "source": str(edge[0]),
-            "target": str(edge[1]),
-            "weight": 2.5,
-            "startPoint": {
-                "x": pos[edge[0]][0] * 1000,
-                "y": pos[edge[0]][1] * 1000
-            },
-            "endPoint": {
-                "x": pos[edge[1]][0] * 1000,
-                "y": pos[edge[1]][1] * 1000
-            }
-        })
-
-    return Response(data, status=status.HTTP_200_OK)
+    from . import backend, graph_payload, layout
+
+    algorithm = request.query_params.get('layout', 'spring')
+    if algorithm not in layout.ALGORITHMS:
+        return Response({'error': f"layout must be one of {', '.join(layout.ALGORITHMS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    payload = request.query_params.get('payload', 'full')
+    if payload not in ('full', 'columnar', 'binary'):
+        return Response({'error': "payload must be 'full', 'columnar' or 'binary'"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    graph = backend.current()
+    nodes, positions = layout.positions(algorithm)
+    sources, targets = graph.edges()
+
+    if payload == 'columnar':
+        return Response(graph_payload.columnar(nodes, graph.labels, graph.label_codes, positions, sources, targets),
+                        status=status.HTTP_200_OK)
+    if payload == 'binary':
+        return HttpResponse(graph_payload.binary(nodes, graph.labels, graph.label_codes, positions, sources, targets),
+                            content_type='application/octet-stream')
+    if request.query_params.get('stream') == '1':
+        return StreamingHttpResponse(graph_payload.stream_full(nodes, graph.node_labels(), positions, sources, targets),
+                                     content_type='application/json')
+    return Response(graph_payload.full(nodes, graph.node_labels(), positions, sources, targets),
+                    status=status.HTTP_200_OK)
 
 @api_view(['GET'])
-def top_5_nodes_based_on_several_measures(request):
-    if request.method == 'GET':
-        G = read_data()
-        # Calculate degree centrality
-        degree_centrality = nx.degree_centrality(G)
-
-        degree_centrality_sorted = [] 
-        for node in sorted(degree_centrality, key=degree_centrality.get, reverse=True)[:5]:
-            degree_centrality_sorted.append({'node': node, 'value': degree_centrality[node]})
+@instrumentation.instrumented('viewport')
+@result_cache.cached('viewport')
+def viewport(request):
+    from . import layout, spatial
 
-        print(f'****************** TOP 5 NODES BY DEGREE CENTRALITY: {degree_centrality_sorted}')
-
-        # Calculate closeness centrality
-        closeness_centrality = nx.closeness_centrality(G)
+    if request.method == 'GET':
+        algorithm = request.query_params.get('layout', 'spring')
+        if algorithm not in layout.ALGORITHMS:
+            return Response({'error': f"layout must be one of {', '.join(layout.ALGORITHMS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            box = spatial.Box(*(float(request.query_params[name]) for name in spatial.Box._fields))
+            zoom = int(request.query_params.get('zoom', 0))
+        except KeyError:
+            return Response({'error': 'xmin, ymin, xmax and ymax are required'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'error': 'the bounding box must be numbers and zoom an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not all(math.isfinite(value) for value in box):
+            return Response({'error': 'the bounding box must be finite'}, status=status.HTTP_400_BAD_REQUEST)
+        if box.xmin > box.xmax or box.ymin > box.ymax:
+            return Response({'error': 'xmin/ymin must not exceed xmax/ymax'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= zoom <= spatial.MAX_ZOOM:
+            return Response({'error': f"zoom must be in [0, {spatial.MAX_ZOOM}]"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(spatial.viewport(box, zoom, algorithm), status=status.HTTP_200_OK)
 
-        closeness_centrality_sorted = [] 
-        for node in sorted(closeness_centrality, key=closeness_centrality.get, reverse=True)[:5]:
-            closeness_centrality_sorted.append({'node': node, 'value': closeness_centrality[node]})
 
-        print(f'****************** TOP 5 NODES BY CLOSENESS CENTRALITY: {closeness_centrality_sorted}')
-        
-        # Calculate betweenness centrality
-        betweenness_centrality = nx.betweenness_centrality(G)
+@api_view(['GET'])
+@instrumentation.instrumented('top_5_nodes_based_on_several_measures')
+@jobs.asynchronous('top_5_nodes_based_on_several_measures')
+@result_cache.cached('top_5_nodes_based_on_several_measures')
+def top_5_nodes_based_on_several_measures(request):
+    from . import approximate, backend, centrality
 
-        betweenness_centrality_sorted = []
-        for node in sorted(betweenness_centrality, key=betweenness_centrality.get, reverse=True)[:5]:
-            betweenness_centrality_sorted.append({'node': node, 'value': betweenness_centrality[node]})
+    if request.method == 'GET':
+        mode = request.query_params.get('mode', 'exact')
+        if mode not in ('exact', 'approx'):
+            return Response({'error': "mode must be 'exact' or 'approx'"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = int(request.query_params.get('k', 256))
+            seed = request.query_params.get('seed')
+            seed = int(seed) if seed is not None else None
+        except ValueError:
+            return Response({'error': 'k and seed must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if k < 1:
+            return Response({'error': 'k must be positive'}, status=status.HTTP_400_BAD_REQUEST)
 
-        print(f'****************** TOP 5 NODES BY BETWEENNESS CENTRALITY: {betweenness_centrality_sorted}')
+        # Calculate degree centrality
+        degree_centrality_sorted = centrality.top_nodes('degree', 5)
+
+        # Calculate closeness and betweenness centrality
+        sample_size = None
+        if mode == 'approx':
+            with instrumentation.phase('centrality.approximate'):
+                estimate = approximate.approximate_centrality(backend.current(), k=k, seed=seed)
+            sample_size = estimate.sample_size
+            closeness_centrality_sorted = centrality.top_of(estimate.closeness, 5, errors=estimate.closeness_error)
+            betweenness_centrality_sorted = centrality.top_of(estimate.betweenness, 5, errors=estimate.betweenness_error)
+        else:
+            closeness_centrality_sorted = centrality.top_nodes('closeness', 5)
+            betweenness_centrality_sorted = centrality.top_nodes('betweenness', 5)
 
         # Calculate eigenvector centrality
-        eigenvector_centrality = nx.eigenvector_centrality(G)
-
-        eigenvector_centrality_sorted = []  
-        for node in sorted(eigenvector_centrality, key=eigenvector_centrality.get, reverse=True)[:5]:
-            eigenvector_centrality_sorted.append({'node': node, 'value': eigenvector_centrality[node]})
-
-        print(f'****************** TOP 5 NODES BY EIGENVECTOR CENTRALITY: {eigenvector_centrality_sorted}')
+        eigenvector_centrality_sorted = centrality.top_nodes('eigenvector', 5)
 
         result = {}
         result = []
@@ -152,209 +141,551 @@ def top_5_nodes_based_on_several_measures(request):
                 'key': str(i + 1),
                 'feature': measure_name
             }
+            if any('error' in data for data in measure_data):
+                measure_dict['sample_size'] = sample_size
             for j, data in enumerate(measure_data):
                 measure_dict[f'id{j + 1}'] = data['node']
                 measure_dict[f'value{j + 1}'] = data['value']
+                if 'error' in data:
+                    measure_dict[f'error{j + 1}'] = data['error']
             result.append(measure_dict)
 
         return Response(result, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('top_nodes')
+@jobs.asynchronous('top_nodes')
+@result_cache.cached('top_nodes')
+def top_nodes(request, measure):
+    from . import centrality
+
+    if request.method == 'GET':
+        if measure not in centrality.MEASURES:
+            return Response({'error': f"unknown measure '{measure}', expected one of {', '.join(centrality.MEASURES)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        try:
+            k = int(request.query_params.get('k', 5))
+        except ValueError:
+            return Response({'error': 'k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if k < 1:
+            return Response({'error': 'k must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = []
+        for i, row in enumerate(centrality.top_nodes(measure, k)):
+            data.append({'key': str(i + 1), 'node': row['node'], 'value': row['value']})
+        return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@instrumentation.instrumented('degree_distribution')
 def degree_distribution(request):
+    from . import sparse
+
     if request.method == 'GET':
-        G = read_data()  # function to read your network data
-        degree_sequence = [d for n, d in G.degree()]
-        degree_count = Counter(degree_sequence)
-        result = [{'Degree': k, 'Frequency': v} for k, v in sorted(degree_count.items())]
+        view = sparse.adjacency()
+        result = [{'Degree': k, 'Frequency': v} for k, v in sparse.degree_histogram(view)]
         total_frequency = sum([item['Frequency'] for item in result])
-        if total_frequency == G.number_of_nodes():
-            print("The sum of frequencies is equal to the number of nodes")
-        else:
-            print("The sum of frequencies is not equal to the number of nodes")
+        if total_frequency != len(view):
+            logger.warning("degree frequencies add up to %d, but the graph has %d nodes",
+                           total_frequency, len(view))
         return Response(result, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('community_weight')
+@jobs.asynchronous('community_weight')
+@result_cache.cached('community_weight')
 def community_weight(request):
+    from . import communities
+
     if request.method == 'GET':
-        G = read_data()  # function to read your network data
-        if isinstance(G, nx.DiGraph):
-            G = G.to_undirected()
-        partition = louvain_community.best_partition(G)
-        communities = []
-        for com in set(partition.values()):
-            communities.append(set(nodes for nodes in partition.keys() if partition[nodes] == com))
-        community_weights = []
-        for community in communities:
-            weight = len(community)
-            community_weights.append(weight)
-        weight_count = Counter(community_weights)
-        result = [{'#Communities': v, 'Weight': k} for k, v in weight_count.items()]
-        result = sorted(result, key=lambda x: x['Weight'])
+        try:
+            resolution, seed = _community_parameters(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        partition = communities.partition(resolution, seed)
+        result = [{'#Communities': count, 'Weight': size} for size, count in partition.size_distribution()]
         return Response(result, status=status.HTTP_200_OK)
 
+
+def _community_parameters(request):
+    try:
+        resolution = float(request.query_params.get('resolution', 1.0))
+        seed = int(request.query_params['seed']) if 'seed' in request.query_params else None
+    except ValueError:
+        raise ValueError('resolution must be a number and seed an integer')
+    # Louvain does not terminate for a NaN or infinite resolution.
+    if not (math.isfinite(resolution) and resolution > 0):
+        raise ValueError('resolution must be a positive finite number')
+    return resolution, seed
+
+
+@api_view(['GET'])
+@instrumentation.instrumented('community_membership')
+@jobs.asynchronous('community_membership')
+@result_cache.cached('community_membership')
+def community_membership(request):
+    from . import communities
+
+    if request.method == 'GET':
+        try:
+            resolution, seed = _community_parameters(request)
+            community = int(request.query_params['community']) if 'community' in request.query_params else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        partition = communities.partition(resolution, seed)
+        if community is None:
+            result = [{'node': node, 'community': c}
+                      for node, c in zip(partition.nodes, partition.membership.tolist())]
+            return Response(result, status=status.HTTP_200_OK)
+        if not 0 <= community < len(partition):
+            return Response({'error': f"community must be in [0, {len(partition) - 1}]"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        members = partition.member_ids(community)
+        return Response({'community': community, 'size': len(members), 'members': members},
+                        status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@instrumentation.instrumented('community_modularity')
+@jobs.asynchronous('community_modularity')
+@result_cache.cached('community_modularity')
+def community_modularity(request):
+    from . import communities
+
+    if request.method == 'GET':
+        try:
+            resolution, seed = _community_parameters(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        partition = communities.partition(resolution, seed)
+        result = {
+            'modularity': partition.modularity,
+            'communities': len(partition),
+            'resolution': resolution,
+            'seed': seed,
+        }
+        return Response(result, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@instrumentation.instrumented('community_sizes')
+@jobs.asynchronous('community_sizes')
+@result_cache.cached('community_sizes')
+def community_sizes(request):
+    from . import communities
+
+    if request.method == 'GET':
+        try:
+            resolution, seed = _community_parameters(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        partition = communities.partition(resolution, seed)
+        result = [{'size': size, 'count': count} for size, count in partition.size_distribution()]
+        return Response(result, status=status.HTTP_200_OK)
+
+"""
+    Reachability
+"""
+
+@api_view(['GET'])
+@instrumentation.instrumented('reachability_summary')
+@jobs.asynchronous('reachability_summary')
+@result_cache.cached('reachability_summary')
+def reachability_summary(request):
+    from . import reachability
+
+    if request.method == 'GET':
+        return Response(reachability.reachability().summary(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@instrumentation.instrumented('reachability_components')
+@jobs.asynchronous('reachability_components')
+@result_cache.cached('reachability_components')
+def reachability_components(request):
+    from . import reachability
+
+    if request.method == 'GET':
+        try:
+            limit = int(request.query_params.get('limit', 100))
+            min_size = int(request.query_params.get('min_size', 1))
+        except ValueError:
+            return Response({'error': 'limit and min_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        r = reachability.reachability()
+        selected = np.flatnonzero(r.sizes >= min_size)
+        selected = selected[np.argsort(-r.sizes[selected], kind='stable')][:limit]
+        result = [{'component': c, 'size': int(r.sizes[c]), 'diameter': int(r.diameters[c]),
+                   'reachable_nodes': int(r.reach[c])} for c in selected.tolist()]
+        return Response(result, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@instrumentation.instrumented('reachability_eccentricities')
+@jobs.asynchronous('reachability_eccentricities')
+@result_cache.cached('reachability_eccentricities')
+def reachability_eccentricities(request):
+    from . import reachability
+
+    if request.method == 'GET':
+        r = reachability.reachability()
+        try:
+            component = int(request.query_params['component']) if 'component' in request.query_params else r.largest
+        except ValueError:
+            return Response({'error': 'component must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if component is None or not 0 <= component < len(r):
+            return Response({'error': f"component must be in [0, {len(r) - 1}]"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with instrumentation.phase('reachability.eccentricities'):
+            ecc = r.eccentricities(component)
+        result = {
+            'component': component,
+            'size': len(ecc.nodes),
+            'diameter': int(ecc.values.max()),
+            'radius': int(ecc.values.min()),
+            'bfs_runs': ecc.bfs_runs,
+            'eccentricities': [{'node': node, 'eccentricity': value}
+                               for node, value in zip(ecc.nodes, ecc.values.tolist())],
+        }
+        return Response(result, status=status.HTTP_200_OK)
+
+"""
+    Graph Edits
+
+    Edits change the dataset for every worker (data/edits.jsonl), so they
+    are reserved to staff users, authenticated by session or basic auth.
+"""
+
+def _edit_response(edit):
+    from . import aggregates
+
+    try:
+        version, change = graph_store.edit_graph(edit)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    # The aggregates follow the edit incrementally; a CompactGraph would be
+    # rebuilt from scratch.
+    state = aggregates.current()
+    result = {
+        'version': version,
+        'nodes_count': state.nodes,
+        'edges_count': state.edges,
+        'changed_nodes': len(change.nodes),
+        'changed_edges': len(change.edges),
+    }
+    return Response(result, status=status.HTTP_200_OK)
+
+
+def _node_id(value):
+    # NodeIds are 64-bit integers, in the dataset and in the binary payload.
+    if isinstance(value, bool) or not isinstance(value, int) or not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError('node ids must be 64-bit integers')
+    return value
+
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAdminUser])
+def graph_edges(request):
+    """POST adds, DELETE removes {"edges": [[source, target], ...]}."""
+    try:
+        edges = [[_node_id(u), _node_id(v)] for u, v in request.data['edges']]
+    except (KeyError, TypeError, ValueError):
+        return Response({'error': 'expected {"edges": [[source, target], ...]} with integer ids'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return _edit_response({'op': 'add_edges' if request.method == 'POST' else 'remove_edges', 'edges': edges})
+
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAdminUser])
+def graph_nodes(request):
+    """POST adds {"nodes": [{"id": ..., "label": ...}, ...]}, DELETE removes {"nodes": [id, ...]}."""
+    try:
+        if request.method == 'POST':
+            nodes = [{'id': _node_id(node['id']), 'label': node.get('label')} for node in request.data['nodes']]
+            if any(node['label'] is not None and not isinstance(node['label'], str) for node in nodes):
+                raise ValueError
+            edit = {'op': 'add_nodes', 'nodes': nodes}
+        else:
+            edit = {'op': 'remove_nodes', 'nodes': [_node_id(node) for node in request.data['nodes']]}
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return Response({'error': 'expected {"nodes": [{"id": ..., "label": ...}, ...]} to add '
+                                  'or {"nodes": [id, ...]} to remove, with integer ids'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return _edit_response(edit)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def graph_labels(request):
+    """Set labels: {"labels": [{"id": ..., "label": ...}, ...]}."""
+    try:
+        nodes = [{'id': _node_id(node['id']), 'label': node['label']} for node in request.data['labels']]
+        if any(not isinstance(node['label'], str) for node in nodes):
+            raise ValueError
+    except (KeyError, TypeError, ValueError):
+        return Response({'error': 'expected {"labels": [{"id": ..., "label": "..."}, ...]} with integer ids'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return _edit_response({'op': 'set_labels', 'labels': nodes})
+
+
 """
     Label Analysis
 """
 
 @api_view(['GET'])
+@instrumentation.instrumented('node_labels')
 def node_labels(request):
+    from . import aggregates
+
     if request.method == 'GET':
-        G = read_data()  # function to read your network data
-        labels = [data['label'] for n, data in G.nodes(data=True)]
-        label_count = Counter(labels)
+        label_count = dict(aggregates.current().label_counts())
         total_count = sum(label_count.values())
         result = [{'type': k, 'value': v / total_count * 100} for k, v in label_count.items()]
         return Response(result, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('label_clustering')
 def label_clustering(request):
+    from . import aggregates
+
     if request.method == 'GET':
-        G = read_data()  # function to read your network data
-        clustering = nx.clustering(G)
-        label_clustering = defaultdict(list)
-        for n, data in G.nodes(data=True):
-            label = data['label']
-            cc = clustering[n]
-            label_clustering[label].append(cc)
+        stats = aggregates.current().label_statistics()
         result = []
-        labels = ['L1', 'L2', 'L3', 'L4', 'L5', 'L6', 'L7', 'Unknown']
-        for i, label in enumerate(labels):
-            cc_avg = sum(label_clustering[label]) / len(label_clustering[label])
-            result.append({'key': str(i + 1), 'label': label, 'cc_avg': cc_avg})
+        for i, label in enumerate(['L1', 'L2', 'L3', 'L4', 'L5', 'L6', 'L7', 'Unknown']):
+            result.append({'key': str(i + 1), 'label': label, 'cc_avg': stats[label][4] if label in stats else 0.0})
         
         return Response(result, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('label_degree_values')
 def label_degree_values(request):
-    if request.method == 'GET':
-        G = read_data()
-        degree_values = {}
+    from . import aggregates
 
-        for node, degree in G.degree():
-            label = G.nodes[node]['label']
-            if label not in degree_values:
-                degree_values[label] = []
-            degree_values[label].append(degree)
+    if request.method == 'GET':
+        stats = aggregates.current().label_statistics(clustering=False)
 
         data = []
-        for i, label in enumerate(sorted(degree_values.keys())):
-            degrees = degree_values[label]
-            average_degree = sum(degrees) / len(degrees)
-            max_degree = max(degrees)
-            min_degree = min(degrees)
+        for i, (label, (count, degree_min, degree_avg, degree_max, cc_avg)) in enumerate(stats.items()):
             data.append({
                 "key": str(i+1),
                 "label": label,
-                "avg": average_degree,
-                "min": min_degree,
-                "max": max_degree
+                "avg": degree_avg,
+                "min": degree_min,
+                "max": degree_max
             })
         return Response(data)
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('label_degree_distribution')
 def label_degree_distribution(request, label):
+    from . import aggregates
+
     if request.method == 'GET':
-        G = read_data()
+        data = [{"Degree": deg, "Frequency": cnt} for deg, cnt in aggregates.current().label_degree_histogram(label)]
+        return Response(data)
 
-        nodes = [n for n in G.nodes() if G.nodes[n]['label'] == label]
 
-        degree_sequence = sorted([d for n, d in G.degree(nodes)], reverse=True)
-        degreeCount = Counter(degree_sequence)
-        data = [{"Degree": deg, "Frequency": cnt} for deg, cnt in degreeCount.items()]
+@api_view(['GET'])
+@instrumentation.instrumented('predicted_labels')
+@result_cache.cached('predicted_labels')
+def predicted_labels(request):
+    from . import communities, inference
 
-        data.sort(key=lambda x: x["Degree"])
-        return Response(data)
+    if request.method == 'GET':
+        try:
+            resolution, seed = _community_parameters(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        prediction = inference.predictions()
+        partition = communities.partition(resolution, seed)
+        community_of = partition.membership[prediction.unknown]
+
+        rows = []
+        for i, label, confidence, community in zip(prediction.unknown.tolist(), prediction.label.tolist(),
+                                                   prediction.confidence.tolist(), community_of.tolist()):
+            rows.append({
+                "node": prediction.nodes[i],
+                "label": prediction.labels[label] if label >= 0 else None,
+                "confidence": confidence,
+                "community": community,
+            })
+        # Each community the predicted nodes belong to, listed once.
+        referenced = [{"id": c, "size": int(partition.sizes[c]), "members": partition.member_ids(c)}
+                      for c in np.unique(community_of).tolist()]
+        result = {"iterations": prediction.iterations, "predictions": rows, "communities": referenced}
+        return Response(result, status=status.HTTP_200_OK)
+
+
+def _epidemic_parameters(request, tau, gamma):
+    """Query parameters shared by the epidemic endpoints, with the given rate defaults.
+
+    engine=eon runs one EoN trajectory, engine=batch the Monte Carlo
+    engine in epidemics.py. Either way the result is `points` samples on
+    a regular time grid, as long rows (payload=rows) or as one array per
+    column (payload=columnar). Raises ValueError with a client-facing message.
+    """
+    from . import epidemics, labels, sparse
+
+    query = request.query_params
+    try:
+        engine = query.get('engine', 'eon')
+        params = {
+            'engine': engine,
+            'tau': float(query.get('tau', tau)),
+            'gamma': float(query.get('gamma', gamma)),
+            'seed_label': query.get('seed_label', 'L1'),
+            'tmax': float(query.get('tmax', 2000 if engine == 'eon' else 50)),
+            'runs': int(query.get('runs', 100)),
+            'dt': float(query.get('dt', 0.1)),
+            'points': int(query.get('points', 51)),
+            'seed': int(query['seed']) if 'seed' in query else None,
+            'payload': query.get('payload', 'rows'),
+        }
+    except ValueError:
+        raise ValueError('tau, gamma, tmax and dt must be numbers; runs, points and seed integers')
+    if engine not in ('eon', 'batch'):
+        raise ValueError("engine must be 'eon' or 'batch'")
+    if params['payload'] not in ('rows', 'columnar'):
+        raise ValueError("payload must be 'rows' or 'columnar'")
+    if not all(math.isfinite(params[rate]) and 0 <= params[rate] <= epidemics.MAX_RATE for rate in ('tau', 'gamma')):
+        raise ValueError(f"tau and gamma must be in [0, {epidemics.MAX_RATE:g}]")
+    if not (params['tmax'] > 0 and params['dt'] > 0):
+        raise ValueError('tmax and dt must be positive')
+    if params['tmax'] > epidemics.MAX_TMAX:
+        raise ValueError(f"tmax must not exceed {epidemics.MAX_TMAX:g}")
+    if engine == 'eon' and (params['tau'] + params['gamma']) * params['tmax'] > epidemics.MAX_EON_RATE_TIME:
+        raise ValueError(f"with engine=eon, (tau + gamma) x tmax must not exceed {epidemics.MAX_EON_RATE_TIME:g}; "
+                         "lower tmax or use engine=batch")
+    steps = max(1, math.ceil(params['tmax'] / params['dt']))
+    if engine == 'batch' and steps > epidemics.MAX_STEPS:
+        raise ValueError(f"tmax / dt must not exceed {epidemics.MAX_STEPS} steps")
+    if not 1 <= params['runs'] <= 10000 or not 2 <= params['points'] <= 10000:
+        raise ValueError('runs must be in [1, 10000] and points in [2, 10000]')
+    if engine == 'batch' and params['runs'] * steps * len(sparse.adjacency()) > epidemics.MAX_WORK:
+        raise ValueError(f"runs x tmax / dt x nodes must not exceed {epidemics.MAX_WORK}; "
+                         "lower runs or tmax, or raise dt")
+    if not len(labels.label_index().members.get(params['seed_label'], [])):
+        raise ValueError(f"no nodes with label '{params['seed_label']}'")
+    return params
+
+
+def _batch_epidemic(model, params):
+    from . import epidemics, labels, sparse
+
+    view = sparse.adjacency()
+    with instrumentation.phase('epidemic.batch'):
+        bands = epidemics.simulate(
+            view, model, params['tau'], params['gamma'],
+            labels.label_index().members[params['seed_label']],
+            runs=params['runs'], tmax=params['tmax'], dt=params['dt'], points=params['points'], seed=params['seed'],
+        )
+    series = {}
+    for name in epidemics.MODELS[model]:
+        series[name] = {'count': bands.mean[name]}
+        for p in epidemics.PERCENTILES:
+            series[name][f'p{p}'] = bands.percentiles[name][p]
+    return bands.t, series
+
+
+def _epidemic_payload(t, series, payload):
+    """Long rows {"name", "t", "count", ...} per grid time and compartment, or columnar arrays."""
+    if payload == 'columnar':
+        return {
+            "t": np.round(t, 6).tolist(),
+            "series": {name: {key: values.tolist() for key, values in columns.items()}
+                       for name, columns in series.items()},
+        }
+    times = [str(value) for value in np.round(t, 6).tolist()]
+    data = []
+    for name, columns in series.items():
+        keys = list(columns)
+        for i, row in enumerate(zip(*(columns[key].tolist() for key in keys))):
+            data.append({"name": name, "t": times[i], **dict(zip(keys, row))})
+    return data
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('sis_epidemic')
+@jobs.asynchronous('sis_epidemic')
+@result_cache.cached('sis_epidemic')
 def sis_epidemic(request):
+    from . import backend, epidemics, labels
+
     if request.method == 'GET':
-        G = read_data()
         # Set the initial conditions for the SI model
-        gamma = 1.
-        tau = 0.2
-        initial_infected_nodes = [n for n in G.nodes() if G.nodes[n]['label'] == 'L1']  # initial set of infected nodes
+        try:
+            params = _epidemic_parameters(request, tau=0.2, gamma=1.)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if params['engine'] == 'batch':
+            return Response(_epidemic_payload(*_batch_epidemic('SIS', params), params['payload']),
+                            status=status.HTTP_200_OK)
+
+        G = backend.networkx().graph
+        gamma = params['gamma']
+        tau = params['tau']
+        initial_infected_nodes = labels.label_index().member_ids(params['seed_label'])  # initial set of infected nodes
         # Simulate the spread of the epidemic on the network
-        t, S, I = EoN.fast_SIS(G, tau, gamma, initial_infected_nodes, tmin=0, tmax=2000)
-        print(f"THE t in SIS MODEL IS: {t}")
-        print(f"THE S in SIS MODEL IS: {S}")
-        print(f"THE I in SIS MODEL IS: {I}")
-
-        t_selected = [t[0]]
-        S_selected = [S[0]]
-        I_selected = [I[0]]
-        for i in range(1, len(t)):
-            if t[i] - t_selected[-1] >= 50:
-                t_selected.append(int(t[i]))
-                S_selected.append(S[i])
-                I_selected.append(I[i])
+        with instrumentation.phase('epidemic.eon'):
+            import EoN
 
-        data = []
-        for i in range(len(t_selected)):
-            data.append({
-                "name": "S",
-                "t": str(t_selected[i]),
-                "count": S_selected[i]
-            })
+            t, S, I = EoN.fast_SIS(G, tau, gamma, initial_infected_nodes, tmin=0, tmax=params['tmax'])
+        logger.debug("SIS trajectory: %d events up to t=%g", len(t), t[-1])
 
-        for i in range(len(t_selected)):
-            data.append({
-                "name": "I",
-                "t": str(t_selected[i]),
-                "count": I_selected[i]
-            })
+        # The last state holds until tmax unless the epidemic died out before.
+        grid, (S, I) = epidemics.resample(t, (S, I), params['points'], params['tmax'] if I[-1] else None)
+        data = _epidemic_payload(grid, {"S": {"count": S}, "I": {"count": I}}, params['payload'])
         return Response(data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@instrumentation.instrumented('sir_epidemic')
+@jobs.asynchronous('sir_epidemic')
+@result_cache.cached('sir_epidemic')
 def sir_epidemic(request):
+    from . import backend, epidemics, labels
+
     if request.method == 'GET':
-        G = read_data()
-        p = 0.5  # probability of infection
-        r = 0.5  # probability of recovery
-        initial_infected_nodes = [n for n in G.nodes() if G.nodes[n]['label'] == 'L1']  # initial set of infected nodes
+        try:
+            params = _epidemic_parameters(request, tau=0.5, gamma=0.5)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if params['engine'] == 'batch':
+            return Response(_epidemic_payload(*_batch_epidemic('SIR', params), params['payload']),
+                            status=status.HTTP_200_OK)
+
+        G = backend.networkx().graph
+        p = params['tau']  # probability of infection
+        r = params['gamma']  # probability of recovery
+        initial_infected_nodes = labels.label_index().member_ids(params['seed_label'])  # initial set of infected nodes
 
         # Simulate the spread of the epidemic on the network
-        t, S, I, R = EoN.fast_SIR(G, p, r, initial_infecteds=initial_infected_nodes, tmax=2000, tmin=0)
-        print(f"THE t in SIR MODEL IS: {t}")
-
-        t_selected = [t[0]]
-        S_selected = [S[0]]
-        I_selected = [I[0]]
-        R_selected = [R[0]]
-
-        for i in range(1, len(t)):
-            if t[i] - t_selected[-1] >= 50:
-                t_selected.append(int(t[i]))
-                S_selected.append(S[i])
-                I_selected.append(I[i])
-                R_selected.append(R[i])
-        
-        data = []
-        for i in range(len(t)):
-            data.append({
-                "name": "S",
-                "t": str(t[i]),
-                "count": S[i]
-            })
+        with instrumentation.phase('epidemic.eon'):
+            import EoN
 
-        for i in range(len(t)):
-            data.append({
-                "name": "I",
-                "t": str(t[i]),
-                "count": I[i]
-            })
-
-        for i in range(len(t)):
-            data.append({
-                "name": "R",
-                "t": str(t[i]),
-                "count": R[i]
-            })
+            t, S, I, R = EoN.fast_SIR(G, p, r, initial_infecteds=initial_infected_nodes, tmax=params['tmax'], tmin=0)
+        logger.debug("SIR trajectory: %d events up to t=%g", len(t), t[-1])
 
+        grid, (S, I, R) = epidemics.resample(t, (S, I, R), params['points'], params['tmax'] if I[-1] else None)
+        data = _epidemic_payload(grid, {"S": {"count": S}, "I": {"count": I}, "R": {"count": R}}, params['payload'])
         return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def job_status(request, job_id):
+    if request.method == 'GET':
+        job = Job.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({'error': f"no job with id '{job_id}'"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(jobs.describe(job), status=status.HTTP_200_OK)
+
+
+def prometheus_metrics(request):
+    """Request, phase and cache counters of this process, for Prometheus to scrape."""
+    return HttpResponse(instrumentation.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
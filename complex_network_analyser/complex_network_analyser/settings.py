@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # per-request phase timings, /metrics counters and ?profile=1
+    'analysis.instrumentation.MetricsMiddleware',
 ]
 
 
@@ -103,6 +106,32 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# The 'analysis' alias holds endpoint results (see analysis/result_cache.py).
+# Set ANALYSIS_CACHE_DIR to share it between worker processes on disk.
+
+ANALYSIS_CACHE_DIR = os.environ.get('ANALYSIS_CACHE_DIR')
+# Lock files that coalesce identical computations across workers; only
+# useful when the workers share the cache.
+ANALYSIS_LOCK_DIR = os.path.join(ANALYSIS_CACHE_DIR, 'locks') if ANALYSIS_CACHE_DIR else None
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analysis': {
+        'BACKEND': ('django.core.cache.backends.filebased.FileBasedCache' if ANALYSIS_CACHE_DIR
+                    else 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': ANALYSIS_CACHE_DIR or 'analysis-results',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 256,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -145,3 +174,59 @@ STATIC_URL = '/static/'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Analysis
+# Number of worker processes for the all-pairs BFS / betweenness sweeps.
+# 1 keeps the computation inside the request process.
+
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 1))
+
+# Seconds a cached endpoint result stays valid. Entries are also keyed on
+# the dataset hash, so the TTL mostly matters for the randomized analyses.
+
+ANALYSIS_CACHE_TTLS = {
+    'default': 24 * 3600,
+    'community_weight': 3600,
+    'community_membership': 3600,
+    'community_modularity': 3600,
+    'community_sizes': 3600,
+    'convert_graph': 24 * 3600,
+    'sis_epidemic': 3600,
+    'sir_epidemic': 3600,
+}
+
+# Background jobs (?async=1, see analysis/jobs.py): size of the process
+# pool, seconds without progress after which a queued or running job is
+# considered lost, and seconds after which a job row is deleted.
+
+ANALYSIS_JOB_WORKERS = int(os.environ.get('ANALYSIS_JOB_WORKERS', 2))
+ANALYSIS_JOB_TIMEOUT = 3600
+ANALYSIS_JOB_TTL = 7 * 24 * 3600
+
+# Instrumentation (see analysis/instrumentation.py): one JSON line per
+# request on the 'analysis.requests' logger, and whether ?profile=1 may
+# answer with a cProfile summary instead of the result.
+
+ANALYSIS_PROFILE = os.environ.get('ANALYSIS_PROFILE', '1' if DEBUG else '0') == '1'
+
+# Load the graph store when the WSGI application is imported (see
+# analysis/preload.py). Combined with gunicorn --preload the workers
+# share one copy of it instead of each loading the graph on its first
+# request.
+
+ANALYSIS_PRELOAD = os.environ.get('ANALYSIS_PRELOAD', '0') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'analysis': {'handlers': ['console'], 'level': os.environ.get('ANALYSIS_LOG_LEVEL', 'INFO')},
+    },
+}
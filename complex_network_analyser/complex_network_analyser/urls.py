@@ -16,7 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from analysis.views import prometheus_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/v1/", include("analysis.urls")),
+    path('metrics', prometheus_metrics, name='prometheus metrics'),
 ]
@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'complex_network_analyser.settings')
 
 application = get_wsgi_application()
+
+# Build the graph store now, before the server forks its workers (see
+# analysis/preload.py).
+if settings.ANALYSIS_PRELOAD:
+    from analysis import preload
+
+    preload.preload()